@@ -0,0 +1,206 @@
+# src/dev/cassitly/python/benchmarks/__main__.py
+"""
+Latency/throughput benchmark for the interactions-api.
+
+Starts the real websocket server in a subprocess with the headless
+``recording`` input backend (no display needed), then drives every action with N concurrent
+clients and reports p50/p95/p99 round-trip latency and throughput per action.
+
+    python -m src.dev.cassitly.python.benchmarks --clients 8 --requests 200 --output bench.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import secrets
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import websockets
+import yaml
+
+# One representative message per action (clients authenticate once, with a header)
+ACTIONS = {
+    "stats": {"action": "stats"},
+    "size": {"action": "size"},
+    "move": {"action": "move", "x": 400, "y": 300},
+    "click": {"action": "click", "x": 410, "y": 310, "button": "left"},
+    "press": {"action": "press", "key": "a"},
+    "keydown": {"action": "keydown", "key": "shift"},
+    "keyup": {"action": "keyup", "key": "shift"},
+    "hotkey": {"action": "hotkey", "keys": ["ctrl", "c"]},
+    "type": {"action": "type", "text": "hello world", "interval": 0},
+    "scroll": {"action": "scroll", "clicks": -3},
+    "dragto": {"action": "dragto", "x": 500, "y": 400},
+    "dragrel": {"action": "dragrel", "x": 10, "y": 10},
+    "screenshot": {"action": "screenshot", "return": "inline", "transport": "base64", "format": "jpeg", "scale": 0.5},
+    "batch": {"action": "batch", "actions": [
+        {"action": "move", "x": 400, "y": 300},
+        {"action": "click"},
+        {"action": "type", "text": "hi", "interval": 0},
+        {"action": "press", "key": "enter"},
+    ]},
+}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(sorted_values, pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[rank]
+
+
+def summarize(latencies, errors: int, wall: float) -> dict:
+    values = sorted(latencies)
+    ms = lambda seconds: round(seconds * 1000, 3)
+    return {
+        "requests": len(values),
+        "errors": errors,
+        "p50_ms": ms(percentile(values, 50)),
+        "p95_ms": ms(percentile(values, 95)),
+        "p99_ms": ms(percentile(values, 99)),
+        "mean_ms": ms(sum(values) / len(values)) if values else 0.0,
+        "max_ms": ms(values[-1]) if values else 0.0,
+        "throughput_rps": round(len(values) / wall, 1) if wall > 0 else 0.0,
+    }
+
+
+def start_server(workdir: Path, port: int, token: str) -> subprocess.Popen:
+    config = {
+        "host": "127.0.0.1",
+        "port": port,
+        "auth_token": token,
+        "screenshot_dir": str(workdir / "screenshots"),
+        "macro_dir": str(workdir / "macros"),
+        "input_backend": "recording",
+        # No settle time between input actions: measure the server, not the pacing
+        "pause": 0,
+        # No sampled spans (debug.trace in src/dev/config.yaml): measure the server, not the tracer
+        "trace": False,
+    }
+    config_path = workdir / "authentication.yaml"
+    config_path.write_text(yaml.safe_dump(config), encoding="utf-8")
+
+    root = Path(__file__).resolve().parents[5]
+    env = dict(os.environ)
+    env["WINDOWS_API_AUTH_CONFIG"] = str(config_path)
+    env["PYTHONPATH"] = str(root) + os.pathsep + env.get("PYTHONPATH", "")
+    server_module = __package__.rsplit(".", 1)[0] + ".interactions-api"
+    log = open(workdir / "server.log", "wb")
+    return subprocess.Popen([sys.executable, "-m", server_module], cwd=root, env=env, stdout=log, stderr=log)
+
+
+async def wait_for_server(uri: str, proc: subprocess.Popen, log_path: Path, timeout: float = 15.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            log = log_path.read_text(encoding="utf-8", errors="replace")
+            raise RuntimeError(f"Server exited early with code {proc.returncode}:\n{log}")
+        try:
+            async with websockets.connect(uri):
+                return
+        except OSError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f"Server did not come up on {uri} within {timeout}s")
+
+
+async def run_client(uri: str, token: str, message: str, count: int, latencies: list) -> int:
+    errors = 0
+    headers = {"Authorization": f"Bearer {token}"}
+    async with websockets.connect(uri, max_size=None, additional_headers=headers) as ws:
+        for _ in range(count):
+            started = time.perf_counter()
+            await ws.send(message)
+            reply = await ws.recv()
+            latencies.append(time.perf_counter() - started)
+            if json.loads(reply).get("status") != "ok":
+                errors += 1
+    return errors
+
+
+async def bench_action(uri: str, token: str, name: str, clients: int, requests: int, warmup: int) -> dict:
+    message = json.dumps(ACTIONS[name])
+    # Warm up imports/caches on the server before measuring
+    await run_client(uri, token, message, warmup, [])
+
+    latencies = []
+    started = time.perf_counter()
+    errors = await asyncio.gather(*(run_client(uri, token, message, requests, latencies) for _ in range(clients)))
+    wall = time.perf_counter() - started
+    return summarize(latencies, sum(errors), wall)
+
+
+def print_table(results: dict) -> None:
+    header = f"{'action':<12}{'reqs':>7}{'err':>5}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>10}"
+    print(header)
+    print("-" * len(header))
+    for name, row in results.items():
+        print(f"{name:<12}{row['requests']:>7}{row['errors']:>5}{row['p50_ms']:>10.3f}"
+              f"{row['p95_ms']:>10.3f}{row['p99_ms']:>10.3f}{row['throughput_rps']:>10.1f}")
+
+
+async def run(args) -> dict:
+    names = args.actions.split(",") if args.actions else list(ACTIONS)
+    unknown = [name for name in names if name not in ACTIONS]
+    if unknown:
+        raise SystemExit(f"Unknown actions: {', '.join(unknown)} (available: {', '.join(ACTIONS)})")
+
+    token = secrets.token_hex(16)
+    port = free_port()
+    uri = f"ws://127.0.0.1:{port}"
+    with tempfile.TemporaryDirectory(prefix="interactions-bench-") as tmp:
+        proc = start_server(Path(tmp), port, token)
+        try:
+            await wait_for_server(uri, proc, Path(tmp) / "server.log")
+            results = {}
+            for name in names:
+                results[name] = await bench_action(uri, token, name, args.clients, args.requests, args.warmup)
+        finally:
+            proc.terminate()
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "clients": args.clients,
+            "requests_per_client": args.requests,
+        },
+        "actions": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the interactions-api dispatcher and handlers")
+    parser.add_argument("--clients", type=int, default=4, help="concurrent websocket clients")
+    parser.add_argument("--requests", type=int, default=200, help="requests per client per action")
+    parser.add_argument("--warmup", type=int, default=20, help="unmeasured requests before each action")
+    parser.add_argument("--actions", default="", help="comma-separated subset of actions (default: all)")
+    parser.add_argument("--output", default="benchmark-results.json", help="where to write the JSON results")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print_table(report["actions"])
+    Path(args.output).write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
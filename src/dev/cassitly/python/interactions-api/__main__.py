@@ -1,19 +1,72 @@
-import asyncio, json, traceback, importlib, pkgutil
-import signal
 import sys
+
+# --profile-startup: time every import from here on and print a breakdown before serving
+if "--profile-startup" in sys.argv:
+    from .startup import StartupProfile
+    startup_profile = StartupProfile().start()
+else:
+    startup_profile = None
+
+import asyncio, traceback, importlib, pkgutil, base64
+import importlib.util
+import os
+import signal
+import struct
+import threading
 from pathlib import Path
 import yaml
 
-import pyautogui
 import websockets
 
+from .executor import ActionExecutor, INPUT, READ
+from . import auth
+from .backends import get_input_backend
+from .capture import get_capture_backend
+from .codec import MSGPACK_SUBPROTOCOL, json_codec, msgpack_codec
+from .geometry import ScreenGeometry, query_layout, watch_display_changes
+from .macros import MacroError, MacroRecorder, MacroStore
+from .metrics import Metrics, timed
+from .pacing import MAX_DELAY, PACING_SCHEMA, Pacer
+from .scheduler import InputScheduler, SchedulerBusy
+from .schema import SchemaError, compile_schema
+from .screenshots import ScreenshotStore
+from .session import Session
+from . import streaming
+from .tracing import Tracer
+from .workers import OWNER_ENV, OwnerLink, WorkerPool, watch_owner, worker_index, worker_socket
+
+def startup_mark(phase: str) -> None:
+    if startup_profile is not None:
+        startup_profile.mark(phase)
+
+startup_mark("imports")
+
 # ---------------------------
 # Load configuration from YAML
 # ---------------------------
+# libyaml's loader when PyYAML was built with it (several times faster than the pure Python one)
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+def read_yaml(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return yaml.load(f, Loader=YAML_LOADER)
+
 def load_config():
+    # An explicit config file (used by the benchmark harness) skips the lookup below
+    override = os.environ.get("WINDOWS_API_AUTH_CONFIG")
+    if override:
+        return read_yaml(override)
+
     # Get the directory of this script
     current_dir = Path(__file__).resolve().parent
 
+    # Usual layout: <project>/src/dev/cassitly/python/interactions-api, whatever the checkout is called
+    parents = current_dir.parents
+    if len(parents) > 3:
+        config_path = parents[3] / "resources" / "gui" / "config" / "authentication.yaml"
+        if config_path.exists():
+            return read_yaml(config_path)
+
     # Walk upward until we find "windows-api" folder (the project root)
     for parent in current_dir.parents:
         if parent.name == "windows-api":
@@ -28,97 +81,926 @@ def load_config():
     if not config_path.exists():
         raise FileNotFoundError(f"Config file not found at: {config_path}")
 
-    with open(config_path, "r", encoding="utf-8") as f:
-        return yaml.safe_load(f)
+    return read_yaml(config_path)
+
+def load_dev_config():
+    """src/dev/config.yaml (gui_automation/performance sections); empty if it's missing"""
+    config_path = Path(__file__).resolve().parents[3] / "config.yaml"
+    if not config_path.exists():
+        return {}
+    return read_yaml(config_path) or {}
 
 cfg = load_config()
+dev_cfg = load_dev_config()
+gui_cfg = dev_cfg.get("gui_automation") or {}
 
 HOST = cfg.get("host", "127.0.0.1")
 PORT = int(cfg.get("port", 8765))
 AUTH_TOKEN = cfg.get("auth_token", "replace-with-a-strong-secret")
-SCREENSHOT_DIR = Path(cfg.get("screenshot_dir", "./screenshots"))
+# Extra tokens with limited permissions (see auth.py)
+EXTRA_CREDENTIALS = auth.parse_tokens(cfg.get("tokens"))
+screenshot_cfg = gui_cfg.get("screenshot") or {}
+SCREENSHOT_DIR = Path(cfg.get("screenshot_dir") or screenshot_cfg.get("default_dir") or "./screenshots")
+
+# Multi-process mode (workers.py): the owner keeps the input device, workers serve the public port
+WORKERS = int(cfg.get("workers", 0))
+WORKER_INDEX = worker_index()
+OWNER_URL = os.environ.get(OWNER_ENV) if WORKER_INDEX is not None else None
 
-# Basic safety defaults
-pyautogui.FAILSAFE = bool(cfg.get("failsafe", True))
-pyautogui.PAUSE = float(cfg.get("pause", 0.05))
+# Owns SCREENSHOT_DIR (creates it): background writes, dedup, retention, PNG compression level
+screenshot_store = ScreenshotStore(
+    SCREENSHOT_DIR,
+    max_files=screenshot_cfg.get("max_files", 0),
+    max_bytes=screenshot_cfg.get("max_bytes", 0),
+    max_age=screenshot_cfg.get("max_age", 0),
+    compression=screenshot_cfg.get("compression", 6),
+    dedup=screenshot_cfg.get("dedup", True),
+    # Workers share the directory; keep their generated names apart
+    tag=f"w{WORKER_INDEX}" if WORKER_INDEX is not None else "",
+)
 
-# Ensure screenshot directory exists
-SCREENSHOT_DIR.mkdir(parents=True, exist_ok=True)
+startup_mark("config")
 
 # ---------------------------
-# Load all handlers dynamically
+# Load handlers on first use
 # ---------------------------
 
+# Action name -> handler module, from the file names under handlers/ (nothing imported yet)
+handler_manifest = {}
+# Handlers imported so far
 handlers = {}
+# Actions whose handler module sets READ_ONLY = True (run on the read pool)
+read_only_actions = set()
+# Read-only actions whose module also sets ON_LOOP = True: the handler awaits on the
+# websocket loop (long waits) and passes its blocking steps to context["offload"]
+loop_actions = set()
+# Compiled SCHEMA validators, run by the dispatcher before the handler
+validators = {}
+# Action -> why its module failed to import (retried on the next use)
+handler_errors = {}
 
 def load_handlers():
+    """Rebuild the action manifest; each module is imported by ensure_handler() when first used"""
     from . import handlers as package
+    handler_manifest.clear()
     for _, modname, _ in pkgutil.iter_modules(package.__path__):
-        module = importlib.import_module(f"{__package__}.handlers.{modname}")
-        if hasattr(module, "handle"):
-            handlers[modname] = module.handle
+        handler_manifest[modname] = f"{__package__}.handlers.{modname}"
+
+def handler_entry(module):
+    """``(handle, read_only, on_loop, validator or None)`` for a handler module"""
+    schema = getattr(module, "SCHEMA", None)
+    read_only = bool(getattr(module, "READ_ONLY", False))
+    if not read_only:
+        # Every input action accepts a per-message settle "delay"
+        schema = {**PACING_SCHEMA, **(schema or {})}
+    on_loop = read_only and bool(getattr(module, "ON_LOOP", False))
+    return module.handle, read_only, on_loop, compile_schema(schema) if schema is not None else None
+
+def register_handler(action, module, tables=None) -> None:
+    """Add a handler to ``(handlers, read_only_actions, loop_actions, validators)``, the live ones by default"""
+    handler_table, read_only_table, loop_table, validator_table = tables or (handlers, read_only_actions, loop_actions, validators)
+    handle, read_only, on_loop, validator = handler_entry(module)
+    handler_table[action] = handle
+    read_only_table.discard(action)
+    loop_table.discard(action)
+    validator_table.pop(action, None)
+    if read_only:
+        read_only_table.add(action)
+    if on_loop:
+        loop_table.add(action)
+    if validator is not None:
+        validator_table[action] = validator
+
+def ensure_handler(action) -> bool:
+    """Import an action's handler module if it isn't yet; False when there is no usable handler"""
+    if not isinstance(action, str):
+        return False
+    if action in handlers:
+        return True
+    module_name = handler_manifest.get(action)
+    if module_name is None:
+        return False
+    try:
+        module = importlib.import_module(module_name)
+        if not hasattr(module, "handle"):
+            return False
+        register_handler(action, module)
+    except Exception as e:
+        handler_errors[action] = f"{type(e).__name__}: {e}"
+        traceback.print_exc()
+        return False
+    handler_errors.pop(action, None)
+    return True
+
+def import_fresh(module_name):
+    """Execute a handler module's current source into a new module object and make it the current one
+
+    The old module object is left alone, so calls already running keep their own globals.
+    """
+    old = sys.modules.get(module_name)
+    if old is None:
+        return importlib.import_module(module_name)
+    spec = importlib.util.spec_from_file_location(module_name, old.__file__)
+    module = importlib.util.module_from_spec(spec)
+    # Compiled from source, so an edit within the same second can't hit a stale .pyc
+    code = compile(spec.loader.get_source(module_name), old.__file__, "exec")
+    exec(code, module.__dict__)
+    sys.modules[module_name] = module
+    return module
+
+def reload_handlers(changed=None) -> dict:
+    """Re-import changed handler modules and swap the registry in one step
+
+    ``changed`` is a set of action names (``None``: every loaded handler). The new tables
+    are built on copies and assigned together, so no request sees a half-reloaded registry
+    and there is never a moment without handlers. Handlers that aren't loaded yet are
+    picked up on first use as usual; a module that fails to import keeps its old version.
+    """
+    global handlers, read_only_actions, loop_actions, validators
+    load_handlers()
+    tables = (dict(handlers), set(read_only_actions), set(loop_actions), dict(validators))
+    reloaded, removed, failed = [], [], {}
+    for action in list(tables[0]):
+        if action not in handler_manifest:
+            tables[0].pop(action)
+            tables[1].discard(action)
+            tables[2].discard(action)
+            tables[3].pop(action, None)
+            removed.append(action)
+            continue
+        if changed is not None and action not in changed:
+            continue
+        try:
+            register_handler(action, import_fresh(handler_manifest[action]), tables)
+        except Exception as e:
+            failed[action] = f"{type(e).__name__}: {e}"
+            continue
+        reloaded.append(action)
+    handlers, read_only_actions, loop_actions, validators = tables
+    return {"reloaded": sorted(reloaded), "removed": sorted(removed), "failed": failed}
+
+def handler_file_stamps() -> dict:
+    """Modification times of the handler files, by action name"""
+    from . import handlers as package
+    stamps = {}
+    for directory in package.__path__:
+        for entry in os.scandir(directory):
+            if entry.name.endswith(".py") and not entry.name.startswith("_") and entry.is_file():
+                stamps[entry.name[:-3]] = entry.stat().st_mtime_ns
+    return stamps
+
+async def watch_handlers(interval: float) -> None:
+    """Reload handler modules as their files change (performance.reload_on_change)"""
+    previous = handler_file_stamps()
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            current = handler_file_stamps()
+        except OSError:
+            continue
+        if current == previous:
+            continue
+        changed = {name for name in current.keys() | previous.keys() if current.get(name) != previous.get(name)}
+        previous = current
+        result = reload_handlers(changed)
+        print(f"[RELOAD] changed: {', '.join(sorted(changed))}; reloaded: {result['reloaded']}; failed: {result['failed']}")
 
 load_handlers()
 
+# Watch handlers/ and reload edited modules in place (src/dev/config.yaml)
+performance_cfg = dev_cfg.get("performance") or {}
+RELOAD_ON_CHANGE = bool(performance_cfg.get("reload_on_change", False))
+RELOAD_INTERVAL = float(performance_cfg.get("reload_interval", 1.0))
+
+startup_mark("handler manifest")
+
+# Handler bodies run here instead of on the websocket loop
+executor = ActionExecutor(read_workers=int(cfg.get("read_workers", 4)))
+
+# Everything that touches the mouse/keyboard goes through this ("recording" for headless runs).
+# authentication.yaml wins over gui_automation in src/dev/config.yaml.
+INPUT_BACKEND = cfg.get("input_backend") or gui_cfg.get("backend") or "pyautogui"
+safety = gui_cfg.get("safety") or {}
+if INPUT_BACKEND == "pyautogui":
+    backend = get_input_backend(INPUT_BACKEND, failsafe=bool(cfg.get("failsafe", safety.get("failsafe", True))))
+else:
+    backend = get_input_backend(INPUT_BACKEND)
+
+# Settle time between input actions ("pause"), awaited on the input lane instead of pyautogui.PAUSE
+pacer = Pacer(default_delay=float(cfg.get("pause", safety.get("pause", 0.05))))
+
+# Screen capture used by screenshots and streams: the backend's own unless overridden ("fake" for headless CI)
+capture = get_capture_backend(cfg["capture_backend"]) if cfg.get("capture_backend") else backend.capture
+
+# Monitor bounds, cached instead of queried on every click/move
+geometry = ScreenGeometry(ttl=float(cfg.get("geometry_ttl", 5.0)), query=lambda: query_layout(backend))
+
+# Shared with every handler call
+context = {"screenshot_dir": SCREENSHOT_DIR, "screenshot_store": screenshot_store, "backend": backend, "capture": capture, "geometry": geometry}
+
+# Fastest JSON codec installed (orjson > msgspec > stdlib), plus MessagePack when available
+codec = json_codec(cfg.get("json_codec", "auto"))
+binary_codec = msgpack_codec()
+
+# Upper bound on sub-actions carried by a single batch message
+MAX_BATCH_ACTIONS = int(cfg.get("max_batch_actions", 256))
+
+# Payload caps. max_message_size bounds every inbound frame (the transport refuses
+# larger ones before they are decoded) and is the default cap on inline attachments.
+# action_payload_limits overrides the attachment cap per action; it never raises
+# what a client may send.
+MAX_MESSAGE_SIZE = int(cfg.get("max_message_size", 2**20))
+ACTION_PAYLOAD_LIMITS = {name: int(limit) for name, limit in (cfg.get("action_payload_limits") or {}).items()}
+context["screenshot_return"] = cfg.get("screenshot_return", "file")
+# Sampling rate and timeout cap for wait_for_change / wait_for_pixel (each sample runs on the read pool)
+watch_cfg = cfg.get("watch") or {}
+context["watch_options"] = {
+    "interval": float(watch_cfg.get("interval", 0.05)),
+    "max_timeout": float(watch_cfg.get("max_timeout", 60)),
+}
+# One matcher shared by every "locate": template LRU, last-known boxes, pyramid depth.
+# Built by the first locate, so servers that never match templates don't pay for it.
+locate_cfg = cfg.get("locate") or {}
+locate_matcher = None
+locate_matcher_lock = threading.Lock()
+
+def get_locate_matcher():
+    """The server's matcher, created on first use (locate runs on several read workers)"""
+    global locate_matcher
+    with locate_matcher_lock:
+        if locate_matcher is None:
+            from .matching import TemplateMatcher
+            locate_matcher = TemplateMatcher(
+                cache_size=int(locate_cfg.get("cache_size", 32)),
+                max_levels=int(locate_cfg.get("max_levels", 4)),
+            )
+        return locate_matcher
+
+context["get_matcher"] = get_locate_matcher
+
+# Per-connection input queues in front of the input lane: weighted fair order, leases, rate limits
+scheduler_cfg = cfg.get("scheduler") or {}
+scheduler = InputScheduler(
+    rate=float(scheduler_cfg.get("rate", 0)),
+    burst=float(scheduler_cfg.get("burst", 20)),
+    max_queue=int(scheduler_cfg.get("max_queue", 64)),
+    max_lease=float(scheduler_cfg.get("max_lease", 60)),
+    weights=scheduler_cfg.get("weights"),
+)
+
+# Request counters and latency histograms, served at metrics.path and in "stats"
+metrics_cfg = cfg.get("metrics") or {}
+metrics = Metrics()
+METRICS_PATH = metrics_cfg.get("path", "/metrics") if metrics_cfg.get("enabled", True) else None
+# Scrapers send a token with the read permission unless this is turned off
+METRICS_AUTH = bool(metrics_cfg.get("require_auth", True))
+
+# Sampled per-action spans from debug.trace in src/dev/config.yaml, exported as Chrome trace JSON.
+# mode "settrace" is the old whole-process tracer (see src/dev/utils/config_loader.py), not used here.
+# "trace: false" in authentication.yaml turns it off for one server (the benchmarks do this).
+debug_cfg = dev_cfg.get("debug") or {}
+trace_cfg = debug_cfg.get("trace") or {}
+if cfg.get("trace", True) and debug_cfg.get("enabled") and trace_cfg.get("enabled") and trace_cfg.get("mode", "spans") == "spans":
+    tracer = Tracer.from_config(trace_cfg)
+else:
+    tracer = Tracer(sample_rate=0)
+TRACE_EXPORT = trace_cfg.get("export")
+if TRACE_EXPORT and WORKER_INDEX is not None:
+    export_path = Path(TRACE_EXPORT)
+    TRACE_EXPORT = str(export_path.with_name(f"{export_path.stem}.worker{WORKER_INDEX}{export_path.suffix}"))
+
+# Recorded macros, memory-mapped by name on first replay
+macro_store = MacroStore(Path(cfg.get("macro_dir", "./macros")))
+MAX_REPLAY_SPEED = 100.0
+
+startup_mark("backends and services")
+
 # ---------------------------
 # Utilities
 # ---------------------------
 
+def ok_result(payload=None):
+    return {"status": "ok", "result": payload or {}}
+
+def error_result(message, details=None):
+    return {"status": "error", "error": {"message": message, "details": details or ""}}
+
 def ok(payload=None):
-    return json.dumps({"status": "ok", "result": payload or {}})
+    return codec.dumps(ok_result(payload))
 
 def err(message, details=None):
-    return json.dumps({"status": "error", "error": {"message": message, "details": details or ""}})
+    return codec.dumps(error_result(message, details))
+
+def payload_limit(action) -> int:
+    """Largest inline attachment ``action`` may return"""
+    if not isinstance(action, str):
+        return MAX_MESSAGE_SIZE
+    return ACTION_PAYLOAD_LIMITS.get(action, MAX_MESSAGE_SIZE)
+
+def check_attachment(action, result: dict) -> dict:
+    """Swap an oversized inline attachment for a payload_too_large error"""
+    attachment = result.get("attachment")
+    if attachment is not None and len(attachment) > payload_limit(action):
+        return error_result(
+            "payload_too_large",
+            f"{len(attachment)} bytes exceeds the {payload_limit(action)} byte limit for '{action}'; lower 'scale' or 'quality'",
+        )
+    return result
+
+def validate_params(action, msg: dict):
+    """Run the action's compiled schema; returns ``(msg, None)`` or ``(None, error)``"""
+    validator = validators.get(action)
+    if validator is None:
+        return msg, None
+    try:
+        return validator(msg), None
+    except SchemaError as e:
+        return None, error_result("invalid_params", e.details())
+
+def inline_attachment(result: dict) -> dict:
+    """Move a binary attachment into result.data as base64 (for text-only clients)"""
+    if "attachment" not in result:
+        return result
+    result = dict(result)
+    data = result.pop("attachment")
+    result["result"] = {**result.get("result", {}), "data": base64.b64encode(data).decode("ascii")}
+    return result
+
+def credentials():
+    """The full-access auth_token first, then any limited tokens"""
+    return [auth.Credential("default", AUTH_TOKEN.encode("utf-8"), auth.ALL_PERMISSIONS), *EXTRA_CREDENTIALS]
+
+def message_permissions(msg: dict, session=None):
+    """Permissions for a message: the session's once authenticated, else from the message's token"""
+    if session is not None and session.permissions is not None:
+        # Already authenticated: the token field is not looked at again
+        return session.permissions
+    credential = auth.authenticate(msg.get("token"), credentials())
+    if credential is None:
+        return None
+    if session is not None:
+        session.client, session.permissions = credential.name, credential.permissions
+        session.token = msg.get("token")
+    return credential.permissions
+
+def required_permission(msg: dict):
+    action = msg.get("action")
+    if action in ("auth", "configure", "cancel"):
+        return None
+    if action in ("reload", "shutdown", "trace_export"):
+        return auth.ADMIN
+    if action == "macros" or is_read_only(msg):
+        return auth.READ
+    return auth.INPUT
+
+def is_read_only(msg: dict) -> bool:
+    """Whether a message can run concurrently with other requests on its connection"""
+    action = msg.get("action")
+    if action in ("stats", "cancel", "screenshot_stream", "screenshot_stream_stop"):
+        return True
+    if action == "batch":
+        actions = msg.get("actions")
+        return isinstance(actions, list) and bool(actions) and all(
+            isinstance(step, dict) and ensure_handler(step.get("action")) and step["action"] in read_only_actions
+            for step in actions
+        )
+    return ensure_handler(action) and action in read_only_actions
+
+def call_context(msg: dict, session):
+    """The shared context, plus progress/cancel hooks for requests that carry an ``id``
+
+    Returns ``(context, request_id)``; ``request_id`` is ``None`` when no hooks were added.
+    """
+    request_id = msg.get("id")
+    if session is None or not isinstance(request_id, (str, int)) or request_id in session.cancellations:
+        return context, None
+    loop = asyncio.get_running_loop()
+    cancel = threading.Event()
+    session.cancellations[request_id] = cancel
+    hooks = {"cancelled": cancel.is_set}
+    if msg.get("progress"):
+        # Called from the executor thread; the send itself happens on the websocket loop
+        def progress(payload: dict):
+            event = {"event": "progress", "id": request_id, "action": msg.get("action"), **payload}
+            asyncio.run_coroutine_threadsafe(session.send(session.codec.dumps(event)), loop)
+        hooks["progress"] = progress
+    return {**context, **hooks}, request_id
+
+async def offload(func, *args):
+    """Run a blocking ``func(*args)`` on the read pool; handed to ON_LOOP handlers as context["offload"]"""
+    async def call():
+        return func(*args)
+    return await executor.run(READ, call)
+
+def scheduler_client(session):
+    """The scheduler key and client name for a connection (in-process callers share one queue)"""
+    return (session, session.client) if session is not None else ("local", None)
+
+async def run_input(session, cost, func, *args):
+    """Run ``func(*args)`` on the input lane once the scheduler gives this connection its turn
+
+    Raises SchedulerBusy when the connection is rate limited or its queue is full.
+    """
+    key, name = scheduler_client(session)
+    return await scheduler.run(key, name, lambda: executor.run(INPUT, func, *args), cost)
+
+# ---------------------------
+# Batches
+# ---------------------------
+
+async def run_batch(steps, stop_on_error, context, pacer=None, delay=None):
+    """Run resolved (handler, msg, error) steps back to back inside one executor job
+
+    With a ``pacer``, steps are spaced by their own ``delay``, else the batch's ``delay``.
+    """
+    results = []
+    for step_handler, step, error in steps:
+        if error is not None:
+            result = error
+        elif step_handler is None:
+            result = error_result("unsupported_action", f"Action '{step.get('action')}' not supported in a batch")
+        else:
+            try:
+                step_handler = tracer.wrap(step_handler, step.get("action"))
+                if pacer is not None:
+                    result = await pacer.pace(step_handler, step, context, delay)
+                else:
+                    result = await step_handler(step, context)
+                result = inline_attachment(check_attachment(step.get("action"), result))
+            except Exception as e:
+                result = error_result("executionerror", {"exception": str(e), "traceback": traceback.format_exc()})
+        results.append(result)
+        if stop_on_error and result.get("status") != "ok":
+            break
+    return results
+
+async def handle_batch(msg: dict, session=None) -> dict:
+    actions = msg.get("actions")
+    if not isinstance(actions, list) or not actions:
+        return error_result("invalid_params", "Requires a non-empty 'actions' list")
+    if len(actions) > MAX_BATCH_ACTIONS:
+        return error_result("invalid_params", f"A batch may carry at most {MAX_BATCH_ACTIONS} actions")
+    if not all(isinstance(step, dict) for step in actions):
+        return error_result("invalid_params", "Every batch entry must be an object")
+
+    options = msg.get("options") or {}
+    stop_on_error = bool(options.get("stop_on_error", True))
+    delay = options.get("delay")
+    if delay is not None and (isinstance(delay, bool) or not isinstance(delay, (int, float)) or not 0 <= delay <= MAX_DELAY):
+        return error_result("invalid_params", {"field": "options.delay", "reason": f"must be a number between 0 and {MAX_DELAY}"})
+
+    # Sub-actions go through the handler registry only (no nested batch/reload/shutdown)
+    names = [step.get("action") if isinstance(step.get("action"), str) else None for step in actions]
+    steps = []
+    for name, step in zip(names, actions):
+        ensure_handler(name)
+        if name in loop_actions:
+            # These wait on the websocket loop; inside a batch they would hold an executor worker for the whole wait
+            return error_result("invalid_params", {"field": "actions", "reason": f"'{name}' can't run inside a batch"})
+        step, error = validate_params(name, step)
+        steps.append((handlers.get(name), step, error))
+    # The whole batch is one job, so other clients' input can't interleave with it
+    lane = READ if is_read_only(msg) else INPUT
+
+    job = timed(tracer.wrap(run_batch, "batch"))
+    try:
+        if lane == INPUT:
+            results = await run_input(session, len(steps), job, steps, stop_on_error, context, pacer, delay)
+        else:
+            results = await executor.run(lane, job, steps, stop_on_error, context)
+    except SchedulerBusy as e:
+        return error_result(e.reason, e.details)
+    except Exception as e:
+        return error_result("executionerror", {"exception": str(e), "traceback": traceback.format_exc()})
+
+    failed = sum(1 for result in results if result.get("status") != "ok")
+    return ok_result({
+        "results": results,
+        "completed": len(results) - failed,
+        "failed": failed,
+        "stopped_early": len(results) < len(actions),
+    })
+
+# ---------------------------
+# Macros
+# ---------------------------
+
+def record_action(session, msg: dict, response: dict) -> None:
+    """Append a successful input action (or a batch's successful input steps) to the connection's recording"""
+    if session is None or session.recording is None or response.get("status") != "ok":
+        return
+    action = msg.get("action")
+    if action == "batch":
+        for step, result in zip(msg["actions"], response["result"]["results"]):
+            if result.get("status") == "ok" and step.get("action") in handlers and step["action"] not in read_only_actions:
+                session.recording.add(step)
+    elif action in handlers and action not in read_only_actions:
+        session.recording.add(msg)
+
+async def run_macro(steps, speed, stop_on_error, context):
+    """Run resolved (offset, handler, msg, error) steps on their recorded schedule inside one executor job
+
+    ``speed`` divides the recorded gaps; 0 runs the steps back to back.
+    """
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    cancelled = context.get("cancelled")
+    completed, ran, failures = 0, 0, []
+    for index, (offset, step_handler, step, error) in enumerate(steps):
+        if cancelled is not None and cancelled():
+            break
+        if speed > 0:
+            wait = started + offset / speed - loop.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+        if error is not None:
+            result = error
+        elif step_handler is None:
+            result = error_result("unsupported_action", f"Action '{step.get('action')}' is no longer available")
+        else:
+            try:
+                # The recording already carries the gaps, so no extra settle time
+                result = await pacer.pace(tracer.wrap(step_handler, step.get("action")), step, context, 0)
+            except Exception as e:
+                result = error_result("executionerror", {"exception": str(e), "traceback": traceback.format_exc()})
+        ran += 1
+        if result.get("status") == "ok":
+            completed += 1
+            continue
+        failures.append({"index": index, "action": step.get("action"), "error": result.get("error")})
+        if stop_on_error:
+            break
+    return completed, ran, failures
+
+async def handle_replay(msg: dict, session=None) -> dict:
+    speed = msg.get("speed", 1.0)
+    if isinstance(speed, bool) or not isinstance(speed, (int, float)) or not 0 <= speed <= MAX_REPLAY_SPEED:
+        return error_result("invalid_params", {"field": "speed", "reason": f"must be a number between 0 and {MAX_REPLAY_SPEED}"})
+    options = msg.get("options") or {}
+    stop_on_error = bool(options.get("stop_on_error", True))
+    # Decode and validate against the handlers as they are now, before any input is sent
+    steps = []
+    try:
+        macro = macro_store.get(msg.get("name"))
+        for offset, step in macro.events():
+            name = step["action"]
+            ensure_handler(name)
+            step, error = validate_params(name, step)
+            steps.append((offset, handlers.get(name), step, error))
+    except MacroError as e:
+        return error_result("invalid_params", str(e))
+
+    replay_context, request_id = call_context(msg, session)
+    try:
+        job = timed(tracer.wrap(run_macro, "replay"))
+        completed, ran, failures = await run_input(session, len(steps), job, steps, speed, stop_on_error, replay_context)
+    except SchedulerBusy as e:
+        return error_result(e.reason, e.details)
+    except Exception as e:
+        return error_result("executionerror", {"exception": str(e), "traceback": traceback.format_exc()})
+    finally:
+        if request_id is not None:
+            session.cancellations.pop(request_id, None)
+
+    return ok_result({
+        "name": macro.name,
+        "events": len(steps),
+        "completed": completed,
+        "failed": len(failures),
+        "errors": failures[:10],
+        "stopped_early": ran < len(steps),
+    })
 
 # ---------------------------
 # Dispatcher
 # ---------------------------
 
-async def handle_message(msg: dict) -> str:
-    if msg.get("token") != AUTH_TOKEN:
-        return err("unauthorized")
+# Actions answered by dispatch() itself rather than a handler module
+BUILTIN_ACTIONS = frozenset((
+    "auth", "reload", "shutdown", "batch", "stats", "configure", "screenshot_stream", "screenshot_stream_stop",
+    "lease", "lease_release", "record_start", "record_stop", "replay", "macros", "cancel", "trace_export",
+))
+
+async def dispatch(msg: dict, session=None) -> dict:
+    permissions = message_permissions(msg, session)
+    if permissions is None:
+        return error_result("unauthorized")
 
     action = msg.get("action")
     if not action or not isinstance(action, str):
-        return err("invalid_action", "Missing or non-string 'action'")
+        return error_result("invalid_action", "Missing or non-string 'action'")
+    needed = required_permission(msg)
+    if needed is not None and needed not in permissions:
+        return error_result("forbidden", f"'{action}' needs the '{needed}' permission")
+
+    # --- Worker processes hand input to the owner process ---
+    if OWNER_URL is not None and forwarded_to_owner(msg, session):
+        return await owner_call(msg, session)
+
+    # --- Connection handshake (the token was already checked above) ---
+    if action == "auth":
+        return ok_result({"client": session.client if session is not None else None, "permissions": sorted(permissions)})
 
     # --- Dynamic reload hook ---
-    if action == "reload":
+    elif action == "reload":
         try:
-            handlers.clear()
-            load_handlers()
-            return ok({"message": "Handlers reloaded", "count": len(handlers)})
+            result = reload_handlers()
+            if OWNER_URL is not None:
+                # The owner runs the input handlers; reload them there too
+                result["owner"] = (await owner_call(msg, session)).get("result")
+            return ok_result({"message": "Handlers reloaded", "count": len(handler_manifest), **result})
         except Exception as e:
-            return err("reload_failed", {"exception": str(e), "traceback": traceback.format_exc()})
+            return error_result("reload_failed", {"exception": str(e), "traceback": traceback.format_exc()})
     # --- Shutdown action ---
     elif action == "shutdown":
-        exit(0)
-        return ok({"message": "Shutting down"})
+        # Same path as SIGTERM, so main() closes the server and stops any worker processes
+        shutdown_event.set()
+        return ok_result({"message": "Shutting down"})
+    # --- Several actions in one round-trip ---
+    elif action == "batch":
+        return await handle_batch(msg, session)
+    # --- Executor queue depths, request metrics ---
+    elif action == "stats":
+        result = {
+            "executor": executor.stats(), "backend": backend.stats(), "pacing": pacer.stats(),
+            "scheduler": scheduler.stats(), "metrics": metrics.snapshot(), "tracing": tracer.stats(),
+            "screenshots": screenshot_store.stats(),
+            "locate": locate_matcher.stats() if locate_matcher is not None else None,
+            "workers": worker_pool.stats() if worker_pool is not None else None,
+            "worker": {"index": WORKER_INDEX, "pid": os.getpid(), "forwarded": forwarded_count} if WORKER_INDEX is not None else None,
+        }
+        if OWNER_URL is not None:
+            # Input (backend, pacing, scheduler) only happens in the owner
+            result["owner"] = (await owner_call(msg, session)).get("result")
+        return ok_result(result)
+    # --- Per-connection options ---
+    elif action == "configure":
+        if session is None:
+            return error_result("invalid_action", "'configure' needs a websocket connection")
+        if "concurrent" in msg:
+            session.concurrent = bool(msg["concurrent"])
+        return ok_result({"concurrent": session.concurrent})
+    # --- Push changed screen tiles at a fixed rate ---
+    elif action == "screenshot_stream":
+        if session is None:
+            return error_result("invalid_action", "'screenshot_stream' needs a websocket connection")
+        try:
+            stream = streaming.start_stream(session, executor, capture, msg)
+        except SchemaError as e:
+            return error_result("invalid_params", e.details())
+        except ValueError as e:
+            return error_result("invalid_params", str(e))
+        return ok_result({"stream": stream.id, "fps": stream.fps, "encoding": stream.encoding})
+    # --- Exclusive use of the input device for a while ---
+    elif action == "lease":
+        duration = msg.get("duration", 10)
+        if isinstance(duration, bool) or not isinstance(duration, (int, float)) or duration <= 0:
+            return error_result("invalid_params", {"field": "duration", "reason": "must be a positive number"})
+        try:
+            return ok_result(scheduler.acquire_lease(*scheduler_client(session), duration))
+        except SchedulerBusy as e:
+            return error_result(e.reason, e.details)
+    elif action == "lease_release":
+        return ok_result({"released": scheduler.release_lease(scheduler_client(session)[0])})
+    # --- Macro recording and replay ---
+    elif action == "record_start":
+        if session is None:
+            return error_result("invalid_action", "'record_start' needs a websocket connection")
+        if session.recording is not None:
+            return error_result("invalid_action", f"Already recording '{session.recording.name}'")
+        try:
+            session.recording = MacroRecorder(msg.get("name"))
+        except MacroError as e:
+            return error_result("invalid_params", str(e))
+        return ok_result({"recording": session.recording.name})
+    elif action == "record_stop":
+        if session is None or session.recording is None:
+            return error_result("invalid_action", "Not recording")
+        recorder, session.recording = session.recording, None
+        try:
+            macro = macro_store.save(recorder.name, recorder.encode())
+        except (MacroError, OSError, struct.error) as e:
+            return error_result("record_failed", str(e))
+        return ok_result(macro.info())
+    elif action == "replay":
+        return await handle_replay(msg, session)
+    elif action == "macros":
+        return ok_result({"macros": macro_store.info()})
+    # --- Sampled spans as Chrome trace JSON ---
+    elif action == "trace_export":
+        return ok_result(tracer.export(clear=bool(msg.get("clear", False))))
+    # --- Stop a running request (e.g. a long bulk "type") by its id ---
+    elif action == "cancel":
+        target = msg.get("target")
+        cancel = session.cancellations.get(target) if session is not None and isinstance(target, (str, int)) else None
+        if cancel is None:
+            return error_result("invalid_params", f"No running request with id '{target}'")
+        cancel.set()
+        return ok_result({"cancelled": target})
+    elif action == "screenshot_stream_stop":
+        if session is None or not streaming.stop_stream(session, msg.get("stream")):
+            return error_result("invalid_params", f"No active stream '{msg.get('stream')}'")
+        return ok_result({"stopped": msg.get("stream")})
 
     else:
-        handler = handlers.get(action)
+        handler = handlers.get(action) if ensure_handler(action) else None
         if not handler:
-            return err("unsupported_action", f"Action '{action}' not supported")
+            if action in handler_errors:
+                return error_result("executionerror", {"exception": handler_errors[action]})
+            return error_result("unsupported_action", f"Action '{action}' not supported")
+
+        # Malformed params are rejected here, before any executor or traceback cost
+        msg, error = validate_params(action, msg)
+        if error is not None:
+            return error
     
+        handler_context, request_id = call_context(msg, session)
         try:
-            result = await handler(msg, {"screenshot_dir": SCREENSHOT_DIR})
-            return json.dumps(result)
+            if action in loop_actions:
+                result = await timed(tracer.wrap(handler, action))(msg, {**handler_context, "offload": offload})
+            elif action in read_only_actions:
+                result = await executor.run(READ, timed(tracer.wrap(handler, action)), msg, handler_context)
+            else:
+                result = await run_input(session, 1, pacer.pace, timed(tracer.wrap(handler, action)), msg, handler_context)
+            return check_attachment(action, result)
+        except SchedulerBusy as e:
+            return error_result(e.reason, e.details)
         except Exception as e:
-            return err("executionerror", {"exception": str(e), "traceback": traceback.format_exc()})
+            return error_result("executionerror", {"exception": str(e), "traceback": traceback.format_exc()})
+        finally:
+            if request_id is not None:
+                session.cancellations.pop(request_id, None)
+
+# Built-ins a worker answers itself (reload runs locally and on the owner)
+WORKER_LOCAL_ACTIONS = frozenset({"auth", "stats", "configure", "reload", "screenshot_stream", "screenshot_stream_stop", "trace_export"})
+# Started by main() in the owner process when "workers" is set
+worker_pool = None
+forwarded_count = 0
+local_owner_link = None
+
+def forwarded_to_owner(msg: dict, session) -> bool:
+    """Whether a worker must pass this message to the owner (anything that produces input)"""
+    action = msg.get("action")
+    if action == "cancel":
+        # Only requests that were themselves forwarded are cancelled on the owner
+        link = session.owner_link if session is not None else local_owner_link
+        return link is not None and link.link_id(msg.get("target")) is not None
+    return action not in WORKER_LOCAL_ACTIONS and not is_read_only(msg)
+
+async def owner_call(msg: dict, session) -> dict:
+    """Run ``msg`` on the owner over this connection's link; the reply keeps the caller's ``id``"""
+    global forwarded_count, local_owner_link
+    if session is None:
+        if local_owner_link is None:
+            local_owner_link = OwnerLink(OWNER_URL, AUTH_TOKEN, codec, lambda event: asyncio.sleep(0))
+        link = local_owner_link
+    else:
+        if session.owner_link is None:
+            async def relay(event: dict):
+                try:
+                    await session.send(session.codec.dumps(event))
+                except websockets.ConnectionClosed:
+                    pass
+            session.owner_link = OwnerLink(OWNER_URL, session.token, codec, relay)
+        link = session.owner_link
+    if msg.get("action") == "cancel":
+        msg = {**msg, "target": link.link_id(msg.get("target"))}
+    forwarded_count += 1
+    return await link.call(msg)
+
+def metric_action(msg: dict) -> str:
+    """The action label for metrics; unknown names share one label so clients can't grow the series"""
+    action = msg.get("action")
+    if isinstance(action, str) and (action in handlers or action in handler_manifest or action in BUILTIN_ACTIONS):
+        return action
+    return "unknown"
+
+async def handle_message(msg: dict, session=None, received=None):
+    """Return the encoded reply, or ``[reply, binary_frame]`` for a binary attachment on a connection
+
+    ``received`` is when the message arrived (metrics clock), so connection queueing counts too.
+    """
+    action = metric_action(msg)
+    with tracer.request(action, {"id": msg["id"]} if "id" in msg else None):
+        with metrics.start(received) as timing:
+            response = await dispatch(msg, session)
+        dispatched = metrics.clock()
+        record_action(session, msg, response)
+        with tracer.span("serialize"):
+            reply = encode_response(msg, response, session)
+    metrics.observe(action, response, timing, dispatched, metrics.clock())
+    return reply
+
+def encode_response(msg: dict, response: dict, session=None):
+    out = session.codec if session is not None else codec
+    attachment = None
+    if "attachment" in response:
+        if out.binary:
+            # MessagePack carries the raw bytes inside the reply itself
+            response = dict(response)
+            response["result"] = {**response.get("result", {}), "data": response.pop("attachment")}
+        elif session is None or msg.get("transport", "binary") == "base64":
+            response = inline_attachment(response)
+        else:
+            response = dict(response)
+            attachment = response.pop("attachment")
+            response["result"] = {**response.get("result", {}), "binary": True}
+    # Echo the client's request id so pipelined replies can be matched up
+    if "id" in msg:
+        response = {**response, "id": msg["id"]}
+    if attachment is None:
+        return out.dumps(response)
+    return [out.dumps(response), attachment]
 
 # ---------------------------
 # WebSocket Server
 # ---------------------------
 
+async def respond(session, msg: dict, received=None):
+    response = await handle_message(msg, session, received)
+    try:
+        if isinstance(response, list):
+            await session.send_all(response)
+        else:
+            await session.send(response)
+    except websockets.ConnectionClosed:
+        pass
+
+def select_subprotocol(connection, subprotocols):
+    """Use MessagePack for clients that ask for it; plain JSON otherwise"""
+    if binary_codec is not None and MSGPACK_SUBPROTOCOL in subprotocols:
+        return MSGPACK_SUBPROTOCOL
+    return None
+
 async def handler(websocket):
-    async for message in websocket:
-        try:
-            data = json.loads(message)
-        except json.JSONDecodeError:
-            await websocket.send(err("invalid_json"))
-            continue
-        response = await handle_message(data)
-        await websocket.send(response)
+    use_msgpack = binary_codec is not None and getattr(websocket, "subprotocol", None) == MSGPACK_SUBPROTOCOL
+    session = Session(websocket, binary_codec if use_msgpack else codec, on_send=metrics.sent)
+    # Clients that can set headers authenticate during the handshake instead of in a message
+    token = auth.header_token(getattr(getattr(websocket, "request", None), "headers", None))
+    if token is not None:
+        credential = auth.authenticate(token, credentials())
+        if credential is None:
+            await websocket.close(code=1008, reason="unauthorized")
+            return
+        session.client, session.permissions = credential.name, credential.permissions
+        session.token = token
+    metrics.connection_opened()
+    try:
+        async for message in websocket:
+            received = metrics.clock()
+            metrics.received(len(message))
+            try:
+                data = session.codec.loads(message)
+            except session.codec.decode_errors:
+                metrics.error("unknown", "invalid_json")
+                await session.send(session.codec.dumps(error_result("invalid_json")))
+                continue
+            if not isinstance(data, dict):
+                metrics.error("unknown", "invalid_json")
+                await session.send(session.codec.dumps(error_result("invalid_json", "Expected an object")))
+                continue
+
+            if not session.concurrent:
+                await respond(session, data, received)
+            elif is_read_only(data):
+                # Read-only work runs alongside everything else and may reply out of order
+                session.spawn(respond(session, data, received))
+            else:
+                # Input stays serialized through the connection's own queue, bounded by max_queue
+                try:
+                    scheduler.admit(*scheduler_client(session), session.input_queued)
+                except SchedulerBusy as e:
+                    metrics.error(metric_action(data), e.reason)
+                    await session.send(encode_response(data, error_result(e.reason, e.details), session))
+                    continue
+                session.start_input_worker(lambda item: respond(session, *item))
+                await session.queue_input((data, received))
+    finally:
+        metrics.connection_closed()
+        scheduler.drop(session)
+        await session.close()
+
+def metrics_gauges() -> dict:
+    """Point-in-time values added to the /metrics output"""
+    lanes = executor.stats()
+    return {
+        "input_lane_pending": lanes[INPUT]["pending"],
+        "read_lane_pending": lanes[READ]["pending"],
+        "scheduler_queued": sum(client["queued"] for client in scheduler.stats()["clients"].values()),
+    }
+
+def serve_metrics(connection, request):
+    """Answer plain HTTP GETs on METRICS_PATH with the Prometheus text format; other paths upgrade as usual"""
+    if METRICS_PATH is None or request.path.split("?", 1)[0] != METRICS_PATH:
+        return None
+    if METRICS_AUTH:
+        credential = auth.authenticate(auth.header_token(request.headers), credentials())
+        if credential is None or auth.READ not in credential.permissions:
+            return connection.respond(401, "unauthorized\n")
+    response = connection.respond(200, metrics.render(metrics_gauges()))
+    del response.headers["Content-Type"]
+    response.headers["Content-Type"] = "text/plain; version=0.0.4; charset=utf-8"
+    return response
 
 # Shutdown event for graceful termination
 shutdown_event = asyncio.Event()
@@ -131,8 +1013,46 @@ def signal_handler(sig, frame):
     loop.call_soon_threadsafe(shutdown_event.set)
 
 async def main():
-    server = await websockets.serve(handler, HOST, PORT, max_size=2**20)  # 1 MiB limit
-    print(f"WebSocket GUI server listening on ws://{HOST}:{PORT}")
+    # Drop cached monitor bounds as soon as the OS reports a layout change
+    watch_display_changes(geometry.invalidate)
+    if tracer.enabled and tracer.functions:
+        tracer.install_function_hooks()
+    watcher = asyncio.create_task(watch_handlers(RELOAD_INTERVAL)) if RELOAD_ON_CHANGE else None
+    options = dict(
+        max_size=MAX_MESSAGE_SIZE, process_request=serve_metrics,
+        subprotocols=[MSGPACK_SUBPROTOCOL], select_subprotocol=select_subprotocol,
+    )
+    global worker_pool
+    if WORKER_INDEX is not None:
+        # Worker: the public port, shared with the other workers; input goes to OWNER_URL
+        listen = worker_socket()
+        if listen is not None:
+            server = await websockets.serve(handler, sock=listen, **options)
+        else:
+            server = await websockets.serve(handler, HOST, PORT, reuse_port=True, **options)
+        listening = f"Worker {WORKER_INDEX} (pid {os.getpid()}) listening on ws://{HOST}:{PORT}, input via {OWNER_URL}"
+
+        def owner_gone():
+            print(f"[SHUTDOWN] Worker {WORKER_INDEX}: owner process is gone")
+            shutdown_event.set()
+        watch_owner(owner_gone)
+    elif WORKERS > 0:
+        # Owner: only its workers connect, over loopback
+        server = await websockets.serve(handler, "127.0.0.1", 0, **options)
+        owner_url = f"ws://127.0.0.1:{server.sockets[0].getsockname()[1]}"
+        worker_pool = WorkerPool(WORKERS, __package__, owner_url, HOST, PORT)
+        worker_pool.start()
+        listening = f"Input owner on {owner_url} (input: {backend.name}); {WORKERS} workers on ws://{HOST}:{PORT}"
+    else:
+        server = await websockets.serve(handler, HOST, PORT, **options)
+        listening = f"WebSocket GUI server listening on ws://{HOST}:{PORT} (codec: {codec.name}, input: {backend.name})"
+    if startup_profile is not None:
+        startup_mark("serve")
+        startup_profile.stop()
+        print(startup_profile.report())
+    print(listening)
+    if METRICS_PATH is not None and worker_pool is None:
+        print(f"Metrics at http://{HOST}:{PORT}{METRICS_PATH}")
     print("Press Ctrl+C to stop.")
     
     # Wait for shutdown signal
@@ -140,8 +1060,19 @@ async def main():
     
     # Close server gracefully
     print("[SHUTDOWN] Closing WebSocket server...")
+    if watcher is not None:
+        watcher.cancel()
+    if worker_pool is not None:
+        await worker_pool.stop()
     server.close()
     await server.wait_closed()
+    executor.shutdown(wait=False)
+    macro_store.close()
+    # Finish writing queued screenshots
+    screenshot_store.close()
+    tracer.remove_function_hooks()
+    if tracer.enabled and TRACE_EXPORT:
+        print(f"[SHUTDOWN] Trace written to {tracer.dump(TRACE_EXPORT)}")
     print("[SHUTDOWN] Server closed successfully")
 
 if __name__ == "__main__":
@@ -0,0 +1,79 @@
+"""
+Connection-level authentication.
+
+A connection authenticates once: with an ``Authorization: Bearer <token>``
+(or ``X-Auth-Token``) header on the websocket handshake, or with the first
+message that carries a valid ``token`` (usually ``{"action": "auth", ...}``).
+After that the session's permissions are used and message tokens are no
+longer compared. Tokens are always checked with ``hmac.compare_digest``.
+
+``auth_token`` in authentication.yaml grants everything. Extra tokens can be
+limited to a subset of permissions::
+
+    tokens:
+      - name: dashboard
+        token: another-secret
+        permissions: [read]
+
+- ``read``: read-only actions (screenshots, size, stats, streams, macro list)
+- ``input``: mouse/keyboard actions, batches, macro record/replay
+- ``admin``: ``reload`` and ``shutdown``
+"""
+
+import hmac
+from typing import NamedTuple, Optional
+
+READ = "read"
+INPUT = "input"
+ADMIN = "admin"
+PERMISSIONS = (READ, INPUT, ADMIN)
+ALL_PERMISSIONS = frozenset(PERMISSIONS)
+
+
+class Credential(NamedTuple):
+    name: str
+    secret: bytes
+    permissions: frozenset
+
+
+def parse_tokens(entries) -> list:
+    """Credentials from the ``tokens`` list in authentication.yaml"""
+    credentials = []
+    for index, entry in enumerate(entries or []):
+        token = entry.get("token") if isinstance(entry, dict) else None
+        if not isinstance(token, str) or not token:
+            raise ValueError(f"tokens[{index}] needs a non-empty 'token'")
+        permissions = frozenset(entry.get("permissions") or PERMISSIONS)
+        unknown = permissions - ALL_PERMISSIONS
+        if unknown:
+            raise ValueError(f"tokens[{index}] has unknown permissions: {', '.join(sorted(unknown))}")
+        credentials.append(Credential(str(entry.get("name") or f"token-{index}"), token.encode("utf-8"), permissions))
+    return credentials
+
+
+def authenticate(token, credentials) -> Optional[Credential]:
+    """The credential matching ``token``, or ``None``
+
+    Every credential is compared, so the time taken doesn't reveal which one matched.
+    """
+    if not isinstance(token, str) or not token:
+        return None
+    candidate = token.encode("utf-8")
+    match = None
+    for credential in credentials:
+        if hmac.compare_digest(candidate, credential.secret) and match is None:
+            match = credential
+    return match
+
+
+def header_token(headers) -> Optional[str]:
+    """A token from the websocket handshake headers, if the client sent one"""
+    if headers is None:
+        return None
+    authorization = headers.get("Authorization")
+    if isinstance(authorization, str):
+        scheme, _, value = authorization.partition(" ")
+        if scheme.lower() == "bearer" and value.strip():
+            return value.strip()
+    token = headers.get("X-Auth-Token")
+    return token if isinstance(token, str) and token else None
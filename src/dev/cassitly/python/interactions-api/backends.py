@@ -0,0 +1,330 @@
+"""
+Input backends: the only place that actually drives the mouse and keyboard.
+
+Handlers call ``context["backend"]`` instead of importing pyautogui, so the
+implementation can be swapped from config (``input_backend`` in
+authentication.yaml, or ``gui_automation.backend`` in src/dev/config.yaml):
+
+- ``pyautogui``: the real desktop (default)
+- ``recording``: headless, records every event with a timestamp and never
+  sleeps, for load tests and benchmarks on machines without a display
+"""
+
+import sys
+import threading
+import time
+from collections import Counter, deque
+from typing import NamedTuple
+
+from .capture import FakeCapture, PyAutoGUICapture
+
+
+class InputBackend:
+    """Mouse, keyboard and capture operations used by the handlers"""
+
+    name = "base"
+
+    def __init__(self, capture=None):
+        self.capture = capture
+
+    # --- mouse ---
+    def move_to(self, x: int, y: int, duration: float = 0.0) -> None:
+        raise NotImplementedError
+
+    def move_rel(self, dx: int, dy: int, duration: float = 0.0) -> None:
+        raise NotImplementedError
+
+    def click(self, button: str = "left") -> None:
+        raise NotImplementedError
+
+    def mouse_down(self, button: str = "left") -> None:
+        raise NotImplementedError
+
+    def mouse_up(self, button: str = "left") -> None:
+        raise NotImplementedError
+
+    def drag_to(self, x: int, y: int, duration: float = 0.0, button: str = "left") -> None:
+        raise NotImplementedError
+
+    def drag_rel(self, dx: int, dy: int, duration: float = 0.0, button: str = "left") -> None:
+        raise NotImplementedError
+
+    def scroll(self, clicks: int) -> None:
+        raise NotImplementedError
+
+    def position(self):
+        raise NotImplementedError
+
+    # --- keyboard ---
+    def key_down(self, key: str) -> None:
+        raise NotImplementedError
+
+    def key_up(self, key: str) -> None:
+        raise NotImplementedError
+
+    def press(self, key: str) -> None:
+        raise NotImplementedError
+
+    def hotkey(self, *keys: str) -> None:
+        raise NotImplementedError
+
+    def write(self, text: str, interval: float = 0.0) -> None:
+        raise NotImplementedError
+
+    def write_unicode(self, text: str) -> None:
+        """Inject ``text`` in one call: any Unicode, no per-keystroke sleeps"""
+        raise NotImplementedError
+
+    def paste(self, text: str) -> None:
+        """Put ``text`` on the clipboard and send the paste shortcut"""
+        raise NotImplementedError
+
+    # --- screen ---
+    def size(self):
+        raise NotImplementedError
+
+    def screenshot(self, region=None):
+        return self.capture.grab(region)
+
+    def stats(self) -> dict:
+        return {"backend": self.name}
+
+
+class PyAutoGUIBackend(InputBackend):
+    name = "pyautogui"
+
+    def __init__(self, failsafe: bool = True):
+        super().__init__(PyAutoGUICapture())
+        self.failsafe = failsafe
+        self._module = None
+
+    @property
+    def _gui(self):
+        # Imported on first use: pyautogui pulls in PIL, pyscreeze and pymsgbox, which slows startup
+        if self._module is None:
+            import pyautogui
+
+            pyautogui.FAILSAFE = self.failsafe
+            # No sleep after every call; settle time is handled by pacing.Pacer off the hot path
+            pyautogui.PAUSE = 0
+            self._module = pyautogui
+        return self._module
+
+    def move_to(self, x, y, duration=0.0):
+        self._gui.moveTo(x, y, duration=duration)
+
+    def move_rel(self, dx, dy, duration=0.0):
+        self._gui.moveRel(dx, dy, duration=duration)
+
+    def click(self, button="left"):
+        self._gui.click(button=button)
+
+    def mouse_down(self, button="left"):
+        self._gui.mouseDown(button=button)
+
+    def mouse_up(self, button="left"):
+        self._gui.mouseUp(button=button)
+
+    def drag_to(self, x, y, duration=0.0, button="left"):
+        self._gui.dragTo(x, y, duration=duration, button=button)
+
+    def drag_rel(self, dx, dy, duration=0.0, button="left"):
+        self._gui.dragRel(dx, dy, duration=duration, button=button)
+
+    def scroll(self, clicks):
+        self._gui.scroll(clicks)
+
+    def position(self):
+        x, y = self._gui.position()
+        return int(x), int(y)
+
+    def key_down(self, key):
+        self._gui.keyDown(key)
+
+    def key_up(self, key):
+        self._gui.keyUp(key)
+
+    def press(self, key):
+        self._gui.press(key)
+
+    def hotkey(self, *keys):
+        self._gui.hotkey(*keys)
+
+    def write(self, text, interval=0.0):
+        self._gui.typewrite(text, interval=interval)
+
+    def write_unicode(self, text):
+        if sys.platform == "win32":
+            _send_unicode_input(text)
+        else:
+            # No portable Unicode injection elsewhere; the clipboard handles any text
+            self.paste(text)
+
+    def paste(self, text):
+        import pyperclip
+
+        pyperclip.copy(text)
+        self._gui.hotkey("command" if sys.platform == "darwin" else "ctrl", "v")
+
+    def size(self):
+        width, height = self._gui.size()
+        return int(width), int(height)
+
+
+def _send_unicode_input(text: str) -> None:
+    """Type ``text`` with a single SendInput call using KEYEVENTF_UNICODE (Windows)"""
+    import ctypes
+    from ctypes import wintypes
+
+    INPUT_KEYBOARD = 1
+    KEYEVENTF_KEYUP = 0x0002
+    KEYEVENTF_UNICODE = 0x0004
+    VK_RETURN = 0x0D
+    ULONG_PTR = ctypes.c_size_t
+
+    class KEYBDINPUT(ctypes.Structure):
+        _fields_ = [("wVk", wintypes.WORD), ("wScan", wintypes.WORD), ("dwFlags", wintypes.DWORD),
+                    ("time", wintypes.DWORD), ("dwExtraInfo", ULONG_PTR)]
+
+    class MOUSEINPUT(ctypes.Structure):
+        # Largest union member; INPUT must have the size SendInput expects
+        _fields_ = [("dx", wintypes.LONG), ("dy", wintypes.LONG), ("mouseData", wintypes.DWORD),
+                    ("dwFlags", wintypes.DWORD), ("time", wintypes.DWORD), ("dwExtraInfo", ULONG_PTR)]
+
+    class _INPUTUNION(ctypes.Union):
+        _fields_ = [("ki", KEYBDINPUT), ("mi", MOUSEINPUT)]
+
+    class INPUT(ctypes.Structure):
+        _fields_ = [("type", wintypes.DWORD), ("union", _INPUTUNION)]
+
+    events = []
+    for char in text.replace("\r\n", "\n"):
+        if char == "\n":
+            # Unicode newlines are ignored by many apps; send a real Enter
+            events += [(VK_RETURN, 0, 0), (VK_RETURN, 0, KEYEVENTF_KEYUP)]
+            continue
+        data = char.encode("utf-16-le")
+        # Characters outside the BMP go as two UTF-16 surrogate units
+        for i in range(0, len(data), 2):
+            unit = int.from_bytes(data[i:i + 2], "little")
+            events += [(0, unit, KEYEVENTF_UNICODE), (0, unit, KEYEVENTF_UNICODE | KEYEVENTF_KEYUP)]
+    if not events:
+        return
+
+    inputs = (INPUT * len(events))()
+    for item, (vk, scan, flags) in zip(inputs, events):
+        item.type = INPUT_KEYBOARD
+        item.union.ki = KEYBDINPUT(vk, scan, flags, 0, 0)
+
+    user32 = ctypes.WinDLL("user32", use_last_error=True)
+    sent = user32.SendInput(len(events), inputs, ctypes.sizeof(INPUT))
+    if sent != len(events):
+        raise OSError(ctypes.get_last_error(), f"SendInput injected {sent} of {len(events)} events")
+
+
+class RecordedEvent(NamedTuple):
+    time: float
+    name: str
+    params: dict
+
+
+class RecordingBackend(InputBackend):
+    """In-memory backend: keeps the last ``max_events`` calls with perf_counter timestamps"""
+
+    name = "recording"
+
+    def __init__(self, width: int = 1920, height: int = 1080, max_events: int = 100_000):
+        super().__init__(FakeCapture(width, height))
+        self.width = width
+        self.height = height
+        self.events = deque(maxlen=max_events)
+        self.counts = Counter()
+        self._lock = threading.Lock()
+        self._position = (0, 0)
+
+    def _record(self, name: str, **params) -> None:
+        with self._lock:
+            self.events.append(RecordedEvent(time.perf_counter(), name, params))
+            self.counts[name] += 1
+
+    def calls(self):
+        """``[(name, params), ...]`` without timestamps, handy in tests"""
+        return [(event.name, event.params) for event in self.events]
+
+    def clear(self) -> None:
+        with self._lock:
+            self.events.clear()
+            self.counts.clear()
+
+    def move_to(self, x, y, duration=0.0):
+        self._position = (x, y)
+        self._record("move_to", x=x, y=y, duration=duration)
+
+    def move_rel(self, dx, dy, duration=0.0):
+        self._position = (self._position[0] + dx, self._position[1] + dy)
+        self._record("move_rel", dx=dx, dy=dy, duration=duration)
+
+    def click(self, button="left"):
+        self._record("click", button=button)
+
+    def mouse_down(self, button="left"):
+        self._record("mouse_down", button=button)
+
+    def mouse_up(self, button="left"):
+        self._record("mouse_up", button=button)
+
+    def drag_to(self, x, y, duration=0.0, button="left"):
+        self._position = (x, y)
+        self._record("drag_to", x=x, y=y, duration=duration, button=button)
+
+    def drag_rel(self, dx, dy, duration=0.0, button="left"):
+        self._position = (self._position[0] + dx, self._position[1] + dy)
+        self._record("drag_rel", dx=dx, dy=dy, duration=duration, button=button)
+
+    def scroll(self, clicks):
+        self._record("scroll", clicks=clicks)
+
+    def position(self):
+        return self._position
+
+    def key_down(self, key):
+        self._record("key_down", key=key)
+
+    def key_up(self, key):
+        self._record("key_up", key=key)
+
+    def press(self, key):
+        self._record("press", key=key)
+
+    def hotkey(self, *keys):
+        self._record("hotkey", keys=list(keys))
+
+    def write(self, text, interval=0.0):
+        self._record("write", text=text, interval=interval)
+
+    def write_unicode(self, text):
+        self._record("write_unicode", text=text)
+
+    def paste(self, text):
+        self._record("paste", text=text)
+
+    def size(self):
+        return self.width, self.height
+
+    def stats(self) -> dict:
+        with self._lock:
+            events = list(self.events)
+            counts = dict(self.counts)
+        stats = {"backend": self.name, "events": sum(counts.values()), "by_name": counts}
+        if len(events) > 1:
+            span = events[-1].time - events[0].time
+            stats["events_per_second"] = round((len(events) - 1) / span, 1) if span > 0 else None
+        return stats
+
+
+def get_input_backend(name: str = "pyautogui", **options) -> InputBackend:
+    if name == PyAutoGUIBackend.name:
+        return PyAutoGUIBackend(**options)
+    if name == RecordingBackend.name:
+        return RecordingBackend()
+    raise ValueError(f"Unknown input backend '{name}' (expected one of: pyautogui, recording)")
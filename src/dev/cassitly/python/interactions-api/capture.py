@@ -0,0 +1,89 @@
+"""
+Screen capture backends.
+
+Everything that grabs pixels (the screenshot handler, screenshot streams)
+goes through a backend chosen by ``capture_backend`` in authentication.yaml:
+
+- ``pyautogui``: the real screen (default)
+- ``fake``: synthetic frames with a moving block, for headless/Linux CI
+"""
+
+import io
+
+IMAGE_FORMATS = ("png", "jpeg")
+
+
+class CaptureBackend:
+    """Grabs the screen (or a region of it) as an RGB PIL image"""
+
+    name = "base"
+
+    def grab(self, region=None):
+        """``region`` is ``(x, y, w, h)`` or ``None`` for the full screen"""
+        raise NotImplementedError
+
+
+class PyAutoGUICapture(CaptureBackend):
+    name = "pyautogui"
+
+    def grab(self, region=None):
+        import pyautogui
+
+        img = pyautogui.screenshot(region=tuple(region)) if region else pyautogui.screenshot()
+        return img if img.mode == "RGB" else img.convert("RGB")
+
+
+class FakeCapture(CaptureBackend):
+    """Deterministic frames: a flat background with a block that moves every grab"""
+
+    name = "fake"
+
+    def __init__(self, width: int = 640, height: int = 360, block: int = 32, step: int = 8):
+        self.width = width
+        self.height = height
+        self.block = block
+        self.step = step
+        self.frame = 0
+
+    def grab(self, region=None):
+        from PIL import Image, ImageDraw
+
+        img = Image.new("RGB", (self.width, self.height), (32, 32, 48))
+        offset = (self.frame * self.step) % max(1, self.width - self.block)
+        ImageDraw.Draw(img).rectangle(
+            (offset, self.height // 2, offset + self.block - 1, self.height // 2 + self.block - 1),
+            fill=(240, 200, 40),
+        )
+        self.frame += 1
+        if region:
+            x, y, w, h = region
+            img = img.crop((x, y, x + w, y + h))
+        return img
+
+
+def encode_image(img, fmt: str = "png", quality: int = 80, scale: float = 1.0) -> bytes:
+    """Encode a PIL image into an in-memory PNG/JPEG, optionally downscaled first"""
+    if scale != 1.0:
+        from PIL import Image
+
+        size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+        img = img.resize(size, Image.BILINEAR)
+    buffer = io.BytesIO()
+    if fmt == "jpeg":
+        img.save(buffer, format="JPEG", quality=quality)
+    else:
+        img.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+CAPTURE_BACKENDS = {
+    PyAutoGUICapture.name: PyAutoGUICapture,
+    FakeCapture.name: FakeCapture,
+}
+
+
+def get_capture_backend(name: str = "pyautogui") -> CaptureBackend:
+    try:
+        return CAPTURE_BACKENDS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown capture backend '{name}' (expected one of: {', '.join(CAPTURE_BACKENDS)})")
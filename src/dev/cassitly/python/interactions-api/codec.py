@@ -0,0 +1,116 @@
+"""
+Message codecs for the websocket server.
+
+Every codec encodes straight to ``bytes`` so replies are serialized once
+and handed to websockets without another str -> bytes pass. JSON uses
+orjson or msgspec when installed (``pip install interactions-api[fast]``)
+and falls back to the stdlib. MessagePack is offered to clients that ask
+for the ``windows-api.msgpack`` websocket subprotocol; binary payloads
+(screenshots, stream tiles) then travel as raw bytes instead of base64.
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MSGPACK_SUBPROTOCOL = "windows-api.msgpack"
+
+
+class Codec:
+    name = "base"
+    # Binary codecs reply in binary frames and can carry raw bytes
+    binary = False
+    decode_errors = (ValueError,)
+
+    def dumps(self, obj) -> bytes:
+        raise NotImplementedError
+
+    def loads(self, data):
+        raise NotImplementedError
+
+
+class StdlibJsonCodec(Codec):
+    name = "json"
+
+    def dumps(self, obj) -> bytes:
+        return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+    def loads(self, data):
+        return json.loads(data)
+
+
+class OrjsonCodec(Codec):
+    name = "orjson"
+
+    def dumps(self, obj) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+
+    def loads(self, data):
+        return orjson.loads(data)
+
+
+class MsgspecJsonCodec(Codec):
+    name = "msgspec"
+
+    def __init__(self):
+        self._encoder = msgspec.json.Encoder()
+        self._decoder = msgspec.json.Decoder()
+        self.decode_errors = (msgspec.DecodeError, ValueError)
+
+    def dumps(self, obj) -> bytes:
+        return self._encoder.encode(obj)
+
+    def loads(self, data):
+        return self._decoder.decode(data)
+
+
+class MsgpackCodec(Codec):
+    name = "msgpack"
+    binary = True
+
+    def __init__(self):
+        if msgspec is not None:
+            encoder, decoder = msgspec.msgpack.Encoder(), msgspec.msgpack.Decoder()
+            self._dumps, self._loads = encoder.encode, decoder.decode
+            self.decode_errors = (msgspec.DecodeError, ValueError)
+        else:
+            self._dumps = lambda obj: msgpack.packb(obj, use_bin_type=True)
+            self._loads = lambda data: msgpack.unpackb(data, raw=False)
+            self.decode_errors = (ValueError, msgpack.ExtraData, msgpack.FormatError, msgpack.StackError)
+
+    def dumps(self, obj) -> bytes:
+        return self._dumps(obj)
+
+    def loads(self, data):
+        if isinstance(data, str):
+            raise ValueError("MessagePack connections expect binary frames")
+        return self._loads(data)
+
+
+def json_codec(preference: str = "auto") -> Codec:
+    """The fastest available JSON codec, or a specific one by name"""
+    if preference in ("auto", "orjson") and orjson is not None:
+        return OrjsonCodec()
+    if preference in ("auto", "msgspec") and msgspec is not None:
+        return MsgspecJsonCodec()
+    return StdlibJsonCodec()
+
+
+def msgpack_codec():
+    """A MessagePack codec, or ``None`` if neither msgspec nor msgpack is installed"""
+    if msgspec is None and msgpack is None:
+        return None
+    return MsgpackCodec()
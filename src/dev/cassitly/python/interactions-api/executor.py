@@ -0,0 +1,102 @@
+"""
+Managed executor for handler bodies.
+
+Handlers are written as ``async def handle(msg, context)`` but most of them
+call pyautogui synchronously, which would stall the websocket loop. The
+executor runs each handler coroutine to completion on a worker thread instead:
+
+- ``input`` lane: a single thread, so mouse/keyboard actions keep their order.
+- ``read`` lane: a small pool for read-only actions (screenshots, size queries).
+"""
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+INPUT = "input"
+READ = "read"
+
+
+class _Lane:
+    """One thread pool plus the counters reported by ``stats()``"""
+
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = workers
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"{name}-lane")
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.running = 0
+        self.max_pending = 0
+        self.completed = 0
+        self.failed = 0
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "workers": self.workers,
+                "pending": self.pending,
+                "running": self.running,
+                "max_pending": self.max_pending,
+                "completed": self.completed,
+                "failed": self.failed,
+            }
+
+
+class ActionExecutor:
+    """Runs handler coroutines on the input thread or the read-only pool"""
+
+    def __init__(self, read_workers: int = 4):
+        self._local = threading.local()
+        self._loops = []
+        self.lanes = {
+            INPUT: _Lane(INPUT, 1),
+            READ: _Lane(READ, max(1, int(read_workers))),
+        }
+
+    def _loop(self) -> asyncio.AbstractEventLoop:
+        # Each worker thread keeps its own event loop so handlers can still await
+        loop = getattr(self._local, "loop", None)
+        if loop is None or loop.is_closed():
+            loop = asyncio.new_event_loop()
+            self._local.loop = loop
+            self._loops.append(loop)
+        return loop
+
+    def _run(self, lane: _Lane, func, args):
+        with lane.lock:
+            lane.pending -= 1
+            lane.running += 1
+        try:
+            result = self._loop().run_until_complete(func(*args))
+        except BaseException:
+            with lane.lock:
+                lane.running -= 1
+                lane.failed += 1
+            raise
+        with lane.lock:
+            lane.running -= 1
+            lane.completed += 1
+        return result
+
+    async def run(self, lane_name: str, func, *args):
+        """Await ``func(*args)`` on the given lane and return its result"""
+        lane = self.lanes[lane_name]
+        with lane.lock:
+            lane.pending += 1
+            lane.max_pending = max(lane.max_pending, lane.pending)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(lane.pool, self._run, lane, func, args)
+
+    def stats(self) -> dict:
+        """Queue-depth metrics for every lane"""
+        return {name: lane.stats() for name, lane in self.lanes.items()}
+
+    def shutdown(self, wait: bool = True) -> None:
+        for lane in self.lanes.values():
+            lane.pool.shutdown(wait=wait)
+        if wait:
+            # Workers are gone, so their loops can be closed safely
+            for loop in self._loops:
+                loop.close()
+            self._loops.clear()
@@ -0,0 +1,195 @@
+"""
+Cached screen geometry shared by the handlers.
+
+Querying the OS for the screen size on every click/move is wasted work on
+the hottest path, so monitor bounds are cached and only re-queried when the
+TTL expires or the cache is invalidated. On Windows a hidden window listens
+for WM_DISPLAYCHANGE and invalidates the cache as soon as the layout changes.
+Bounds cover the whole virtual desktop, so multi-monitor setups (including
+monitors left of / above the primary one, at negative coordinates) work.
+"""
+
+import sys
+import threading
+import time
+from typing import List, NamedTuple, Optional, Tuple
+
+
+class Rect(NamedTuple):
+    left: int
+    top: int
+    width: int
+    height: int
+
+    def contains(self, x: int, y: int) -> bool:
+        return self.left <= x < self.left + self.width and self.top <= y < self.top + self.height
+
+    def clamp(self, x: int, y: int, margin: int = 0) -> Tuple[int, int]:
+        x = max(self.left + margin, min(x, self.left + self.width - 1 - margin))
+        y = max(self.top + margin, min(y, self.top + self.height - 1 - margin))
+        return x, y
+
+
+class Layout(NamedTuple):
+    virtual: Rect
+    monitors: List[Rect]
+
+    @property
+    def primary(self) -> Rect:
+        for monitor in self.monitors:
+            if monitor.contains(0, 0):
+                return monitor
+        return self.monitors[0]
+
+
+def _query_windows() -> Layout:
+    import ctypes
+    from ctypes import wintypes
+
+    user32 = ctypes.windll.user32
+    monitors = []
+
+    MONITORENUMPROC = ctypes.WINFUNCTYPE(
+        wintypes.BOOL, wintypes.HMONITOR, wintypes.HDC, ctypes.POINTER(wintypes.RECT), wintypes.LPARAM
+    )
+
+    def collect(hmonitor, hdc, rect, data):
+        r = rect.contents
+        monitors.append(Rect(r.left, r.top, r.right - r.left, r.bottom - r.top))
+        return True
+
+    user32.EnumDisplayMonitors(None, None, MONITORENUMPROC(collect), 0)
+    # SM_XVIRTUALSCREEN, SM_YVIRTUALSCREEN, SM_CXVIRTUALSCREEN, SM_CYVIRTUALSCREEN
+    virtual = Rect(*(user32.GetSystemMetrics(index) for index in (76, 77, 78, 79)))
+    return Layout(virtual, monitors or [virtual])
+
+
+def _query_pyautogui() -> Layout:
+    import pyautogui
+
+    width, height = pyautogui.size()
+    screen = Rect(0, 0, int(width), int(height))
+    return Layout(screen, [screen])
+
+
+def _query_backend(backend) -> Layout:
+    width, height = backend.size()
+    screen = Rect(0, 0, int(width), int(height))
+    return Layout(screen, [screen])
+
+
+def query_layout(backend=None) -> Layout:
+    """Ask the OS (or a non-desktop input backend) for the current monitor layout (uncached)"""
+    if backend is not None and backend.name != "pyautogui":
+        return _query_backend(backend)
+    if sys.platform == "win32":
+        try:
+            return _query_windows()
+        except Exception:
+            pass
+    return _query_backend(backend) if backend is not None else _query_pyautogui()
+
+
+def watch_display_changes(callback) -> Optional[threading.Thread]:
+    """Call ``callback()`` whenever Windows broadcasts WM_DISPLAYCHANGE
+
+    Returns the listener thread, or ``None`` where there is no such signal.
+    """
+    if sys.platform != "win32":
+        return None
+
+    def listen():
+        import ctypes
+        from ctypes import wintypes
+
+        user32 = ctypes.windll.user32
+        kernel32 = ctypes.windll.kernel32
+        WM_DISPLAYCHANGE = 0x007E
+        LRESULT = ctypes.c_ssize_t
+        WNDPROC = ctypes.WINFUNCTYPE(LRESULT, wintypes.HWND, wintypes.UINT, wintypes.WPARAM, wintypes.LPARAM)
+        user32.DefWindowProcW.argtypes = [wintypes.HWND, wintypes.UINT, wintypes.WPARAM, wintypes.LPARAM]
+        user32.DefWindowProcW.restype = LRESULT
+
+        class WNDCLASSW(ctypes.Structure):
+            _fields_ = [
+                ("style", wintypes.UINT), ("lpfnWndProc", WNDPROC),
+                ("cbClsExtra", ctypes.c_int), ("cbWndExtra", ctypes.c_int),
+                ("hInstance", wintypes.HINSTANCE), ("hIcon", wintypes.HICON),
+                ("hCursor", wintypes.HANDLE), ("hbrBackground", wintypes.HBRUSH),
+                ("lpszMenuName", wintypes.LPCWSTR), ("lpszClassName", wintypes.LPCWSTR),
+            ]
+
+        def wndproc(hwnd, msg, wparam, lparam):
+            if msg == WM_DISPLAYCHANGE:
+                callback()
+            return user32.DefWindowProcW(hwnd, msg, wparam, lparam)
+
+        proc = WNDPROC(wndproc)
+        wc = WNDCLASSW()
+        wc.lpfnWndProc = proc
+        wc.hInstance = kernel32.GetModuleHandleW(None)
+        wc.lpszClassName = "InteractionsApiDisplayWatcher"
+        user32.RegisterClassW(ctypes.byref(wc))
+        # A hidden top-level window: message-only windows don't get broadcasts
+        hwnd = user32.CreateWindowExW(0, wc.lpszClassName, "", 0, 0, 0, 0, 0, None, None, wc.hInstance, None)
+        if not hwnd:
+            return
+
+        msg = wintypes.MSG()
+        while user32.GetMessageW(ctypes.byref(msg), None, 0, 0) > 0:
+            user32.TranslateMessage(ctypes.byref(msg))
+            user32.DispatchMessageW(ctypes.byref(msg))
+
+    thread = threading.Thread(target=listen, name="display-watcher", daemon=True)
+    thread.start()
+    return thread
+
+
+class ScreenGeometry:
+    """Monitor layout cache, refreshed on a TTL or an explicit/OS invalidation"""
+
+    def __init__(self, ttl: float = 5.0, query=query_layout):
+        self.ttl = ttl
+        self._query = query
+        self._lock = threading.Lock()
+        self._layout = None
+        self._expires = 0.0
+        self.refreshes = 0
+
+    def invalidate(self) -> None:
+        self._expires = 0.0
+
+    def layout(self) -> Layout:
+        now = time.monotonic()
+        if self._layout is None or now >= self._expires:
+            with self._lock:
+                if self._layout is None or now >= self._expires:
+                    self._layout = self._query()
+                    self._expires = now + self.ttl
+                    self.refreshes += 1
+        return self._layout
+
+    def clamp(self, x, y, margin: int = 1) -> Tuple[int, int]:
+        """Clamp a point onto the nearest monitor, keeping ``margin`` px off its edges"""
+        x, y = int(x), int(y)
+        monitors = self.layout().monitors
+        for monitor in monitors:
+            if monitor.contains(x, y):
+                return monitor.clamp(x, y, margin)
+
+        def distance(monitor):
+            cx, cy = monitor.clamp(x, y)
+            return (cx - x) ** 2 + (cy - y) ** 2
+
+        return min(monitors, key=distance).clamp(x, y, margin)
+
+
+_shared = None
+
+
+def shared_geometry() -> ScreenGeometry:
+    """Process-wide cache for handlers called without a server context"""
+    global _shared
+    if _shared is None:
+        _shared = ScreenGeometry()
+    return _shared
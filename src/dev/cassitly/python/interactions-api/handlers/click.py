@@ -1,19 +1,25 @@
-import pyautogui
+from ..geometry import shared_geometry
+
+SCHEMA = {
+    "x": {"type": "int"},
+    "y": {"type": "int"},
+    "button": {"type": "str", "default": "left", "choices": ["left", "right", "middle"]},
+}
 
 async def handle(msg, context):
     x = msg.get("x")
     y = msg.get("y")
     button = msg.get("button", "left")
     
-    # Get screen size for validation
-    screen_width, screen_height = pyautogui.size()
+    backend = context["backend"]
+    # Cached monitor bounds from the server context
+    geometry = context.get("geometry") or shared_geometry()
 
     # Move first if coordinates provided
     if isinstance(x, (int, float)) and isinstance(y, (int, float)):
-        # Validate and clamp coordinates to screen bounds
-        x = max(1, min(int(x), screen_width - 2))  # Avoid corners (1 to width-2)
-        y = max(1, min(int(y), screen_height - 2))  # Avoid corners (1 to height-2)
-        pyautogui.moveTo(x, y)
+        # Clamp onto the nearest monitor, 1px in from its edges (avoids failsafe corners)
+        x, y = geometry.clamp(x, y)
+        backend.move_to(x, y)
     
-    pyautogui.click(button=button)
+    backend.click(button=button)
     return {"status": "ok", "result": {"clicked": [x, y], "button": button}}
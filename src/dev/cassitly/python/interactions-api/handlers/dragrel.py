@@ -1,11 +1,26 @@
-import pyautogui
+from ..geometry import shared_geometry
+from ..trajectory import DEFAULT_RATE, MAX_DURATION, PATH_KINDS, glide
+
+SCHEMA = {
+    "x": {"type": "int", "required": True},
+    "y": {"type": "int", "required": True},
+    "duration": {"type": "float", "default": 0.0, "min": 0, "max": MAX_DURATION},
+    "button": {"type": "str", "default": "left", "choices": ["left", "right", "middle"]},
+    "path": {"type": "str", "default": "linear", "choices": list(PATH_KINDS)},
+    "rate": {"type": "int", "default": DEFAULT_RATE, "min": 10, "max": 1000},
+}
 
 async def handle(msg, context):
-    dx = msg.get("x")
-    dy = msg.get("y")
-    if dx is None or dy is None:
-        return {"status": "error", "error": {"message": "invalid_params", "details": "Requires 'x' and 'y'"}}
-    duration = float(msg.get("duration", 0.0))
+    dx = msg["x"]
+    dy = msg["y"]
+    duration = msg.get("duration", 0.0)
     button = msg.get("button", "left")
-    pyautogui.dragRel(int(dx), int(dy), duration=duration, button=button)
-    return {"status": "ok", "result": {"dragged_rel": [int(dx), int(dy)], "button": button}}
\ No newline at end of file
+    backend = context["backend"]
+    if duration > 0:
+        geometry = context.get("geometry") or shared_geometry()
+        x, y = backend.position()
+        target = geometry.clamp(x + dx, y + dy)
+        await glide(backend, geometry, target, duration, msg.get("path", "linear"), msg.get("rate", DEFAULT_RATE), button)
+    else:
+        backend.drag_rel(dx, dy, button=button)
+    return {"status": "ok", "result": {"dragged_rel": [dx, dy], "button": button}}
\ No newline at end of file
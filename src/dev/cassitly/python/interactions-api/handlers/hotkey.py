@@ -1,7 +1,7 @@
 # src/gui/handlers/hotkey.py
-import pyautogui
-import asyncio
-import json
+SCHEMA = {
+    "keys": {"type": "list", "required": True, "min_length": 1, "items": {"type": "str"}},
+}
 
 async def handle(msg: dict, ctx: dict):
     """
@@ -13,13 +13,11 @@ async def handle(msg: dict, ctx: dict):
         "keys": ["ctrl", "alt", "del"]
     }
     """
-    keys = msg.get("keys")
-    if not keys or not isinstance(keys, list):
-        return {"status": "error", "error": {"message": "Missing or invalid 'keys' list"}}
+    keys = msg["keys"]
 
     try:
-        # Run hotkey in thread-safe way (pyautogui is blocking)
-        await asyncio.to_thread(pyautogui.hotkey, *keys)
+        # Already on the dispatcher's input thread, so call the backend directly
+        ctx["backend"].hotkey(*keys)
         return {"status": "ok", "result": {"message": f"Pressed hotkey: {'+'.join(keys)}"}}
     except Exception as e:
         return {
@@ -1,8 +1,8 @@
-import pyautogui
+SCHEMA = {
+    "key": {"type": "str", "required": True, "min_length": 1},
+}
 
 async def handle(msg, context):
-    key = msg.get("key")
-    if not key:
-        return {"status": "error", "error": {"message": "invalid_params", "details": "Requires 'key'"}}
-    pyautogui.keyDown(str(key))
+    key = msg["key"]
+    context["backend"].key_down(key)
     return {"status": "ok", "result": {"keydown": key}}
\ No newline at end of file
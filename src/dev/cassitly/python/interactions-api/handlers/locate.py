@@ -0,0 +1,32 @@
+READ_ONLY = True
+
+SCHEMA = {
+    # Base64 PNG/JPEG of the thing to find (decoded once, then cached by content)
+    "template": {"type": "str", "required": True, "min_length": 1},
+    # Only search here: [x, y, w, h]
+    "region": {"type": "list", "length": 4, "items": {"type": "int"}},
+    "threshold": {"type": "float", "default": 0.9, "min": 0, "max": 1},
+    "max_results": {"type": "int", "default": 1, "min": 1, "max": 50},
+}
+
+async def handle(msg, context):
+    # Imported here so numpy and the matcher load with the first locate, not at startup
+    from ..matching import TemplateError, shared_matcher
+
+    # The server's matcher keeps templates and last locations across requests
+    matcher = context.get("matcher") or context.get("get_matcher", shared_matcher)()
+    region = msg.get("region")
+    if region is not None and (region[2] <= 0 or region[3] <= 0):
+        return {"status": "error", "error": {"message": "invalid_params", "details": {"field": "region", "reason": "must have a positive width and height"}}}
+    try:
+        template = matcher.template(msg["template"])
+    except TemplateError as e:
+        return {"status": "error", "error": {"message": "invalid_params", "details": {"field": "template", "reason": str(e)}}}
+
+    result = matcher.locate(
+        context["capture"], template,
+        threshold=msg.get("threshold", 0.9),
+        max_results=msg.get("max_results", 1),
+        region=region,
+    )
+    return {"status": "ok", "result": result}
@@ -1,19 +1,29 @@
 # handlers/move.py
-import pyautogui
+from ..geometry import shared_geometry
+from ..trajectory import DEFAULT_RATE, MAX_DURATION, PATH_KINDS, glide
+
+SCHEMA = {
+    "x": {"type": "int", "required": True},
+    "y": {"type": "int", "required": True},
+    "duration": {"type": "float", "default": 0.0, "min": 0, "max": MAX_DURATION},
+    # With a duration, the path is precomputed and replayed (instead of pyautogui's tween loop)
+    "path": {"type": "str", "default": "linear", "choices": list(PATH_KINDS)},
+    "rate": {"type": "int", "default": DEFAULT_RATE, "min": 10, "max": 1000},
+}
 
 async def handle(msg, context):
-    x = msg.get("x")
-    y = msg.get("y")
-    duration = float(msg.get("duration", 0.0))
-    if x is None or y is None:
-        return {"status": "error", "error": {"message": "invalid_params", "details": "Requires 'x' and 'y'"}}
+    x = msg["x"]
+    y = msg["y"]
+    duration = msg.get("duration", 0.0)
     
-    # Get screen size for validation
-    screen_width, screen_height = pyautogui.size()
+    # Cached monitor bounds from the server context
+    geometry = context.get("geometry") or shared_geometry()
     
-    # Validate and clamp coordinates to screen bounds
-    x = max(1, min(int(x), screen_width - 2))  # Avoid corners (1 to width-2)
-    y = max(1, min(int(y), screen_height - 2))  # Avoid corners (1 to height-2)
+    # Clamp onto the nearest monitor, 1px in from its edges (avoids failsafe corners)
+    x, y = geometry.clamp(x, y)
     
-    pyautogui.moveTo(x, y, duration=duration)
+    if duration > 0:
+        await glide(context["backend"], geometry, (x, y), duration, msg.get("path", "linear"), msg.get("rate", DEFAULT_RATE))
+    else:
+        context["backend"].move_to(x, y)
     return {"status": "ok", "result": {"moved_to": [x, y]}}
@@ -1,8 +1,8 @@
-import pyautogui
+SCHEMA = {
+    "key": {"type": "str", "required": True, "min_length": 1},
+}
 
 async def handle(msg, context):
-    key = msg.get("key")
-    if not key:
-        return {"status": "error", "error": {"message": "invalid_params", "details": "Requires 'key'"}}
-    pyautogui.press(str(key))
+    key = msg["key"]
+    context["backend"].press(key)
     return {"status": "ok", "result": {"pressed": key}}
\ No newline at end of file
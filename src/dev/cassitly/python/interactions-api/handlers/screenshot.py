@@ -1,16 +1,40 @@
-import datetime, pyautogui
+from ..capture import IMAGE_FORMATS, encode_image
+from ..screenshots import shared_store
+
+READ_ONLY = True
+
+SCHEMA = {
+    "return": {"type": "str", "choices": ["file", "inline"]},
+    "name": {"type": "str"},
+    "region": {"type": "list", "length": 4, "items": {"type": "int"}},
+    "format": {"type": "str", "default": "png", "choices": list(IMAGE_FORMATS)},
+    "quality": {"type": "int", "default": 80, "min": 1, "max": 95},
+    "scale": {"type": "float", "default": 1.0, "min": 0.01, "max": 1.0},
+    "transport": {"type": "str", "choices": ["binary", "base64"]},
+    # File mode replies before the file is written unless this is set
+    "wait": {"type": "bool", "default": False},
+}
 
 async def handle(msg, context):
-    screenshot_dir = context["screenshot_dir"]
-    name = msg.get("name")
-    ts = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = name if (isinstance(name, str) and name.strip()) else f"snap_{ts}.png"
-    path = screenshot_dir / filename
+    mode = msg.get("return") or context.get("screenshot_return", "file")
     region = msg.get("region")
-    if isinstance(region, list) and len(region) == 4:
-        x, y, w, h = map(int, region)
-        img = pyautogui.screenshot(region=(x, y, w, h))
-    else:
-        img = pyautogui.screenshot()
-    img.save(path)
-    return {"status": "ok", "result": {"saved": str(path.resolve())}}
\ No newline at end of file
+    img = context["capture"].grab(tuple(region) if region else None)
+
+    if mode == "inline":
+        fmt = msg.get("format", "png")
+        scale = msg.get("scale", 1.0)
+        data = encode_image(img, fmt, msg.get("quality", 80), scale)
+        # The dispatcher sends the attachment as a binary frame (or base64 for text-only clients)
+        return {
+            "status": "ok",
+            "result": {"format": fmt, "size": [img.width, img.height], "scale": scale, "bytes": len(data)},
+            "attachment": data,
+        }
+
+    store = context.get("screenshot_store") or shared_store(context["screenshot_dir"])
+    name = msg.get("name")
+    try:
+        saved = store.save(img, name if (name and name.strip()) else None, wait=msg.get("wait", False))
+    except ValueError as e:
+        return {"status": "error", "error": {"message": "invalid_params", "details": {"field": "name", "reason": str(e)}}}
+    return {"status": "ok", "result": {"saved": str(saved["path"].resolve()), "deduplicated": saved["deduplicated"]}}
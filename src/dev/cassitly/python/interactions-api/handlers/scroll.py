@@ -1,10 +1,15 @@
-import pyautogui
+SCHEMA = {
+    "clicks": {"type": "int", "default": 0},
+    "x": {"type": "int"},
+    "y": {"type": "int"},
+}
 
 async def handle(msg, context):
-    clicks = int(msg.get("clicks", 0))
+    clicks = msg.get("clicks", 0)
     x = msg.get("x")
     y = msg.get("y")
+    backend = context["backend"]
     if x is not None and y is not None:
-        pyautogui.moveTo(int(x), int(y))
-    pyautogui.scroll(clicks)
+        backend.move_to(x, y)
+    backend.scroll(clicks)
     return {"status": "ok", "result": {"scrolled": clicks}}
\ No newline at end of file
@@ -0,0 +1,23 @@
+from ..geometry import shared_geometry
+
+READ_ONLY = True
+
+SCHEMA = {
+    "refresh": {"type": "bool", "default": False},
+}
+
+async def handle(msg, context):
+    geometry = context.get("geometry") or shared_geometry()
+    if msg.get("refresh"):
+        geometry.invalidate()
+    layout = geometry.layout()
+    primary = layout.primary
+    return {
+        "status": "ok",
+        "result": {
+            "width": primary.width,
+            "height": primary.height,
+            "virtual": list(layout.virtual),
+            "monitors": [list(monitor) for monitor in layout.monitors],
+        },
+    }
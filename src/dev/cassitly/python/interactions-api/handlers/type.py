@@ -1,13 +1,51 @@
-import pyautogui
-import time
+import asyncio
+
+SCHEMA = {
+    "text": {"type": "str", "required": True, "min_length": 1},
+    # Per keystroke: the input lane is held for about len(text) * interval
+    "interval": {"type": "float", "default": 0.02, "min": 0, "max": 1},
+    # keys: one keystroke at a time (ASCII only); unicode: bulk injection; paste: via the clipboard
+    "mode": {"type": "str", "default": "keys", "choices": ["keys", "unicode", "paste"]},
+    "chunk_size": {"type": "int", "default": 512, "min": 1, "max": 65536},
+    # Gap between chunks; paste needs one so the app reads the clipboard before it changes
+    "chunk_delay": {"type": "float", "min": 0, "max": 5},
+    "progress": {"type": "bool", "default": False},
+}
+
+PASTE_CHUNK_DELAY = 0.05
 
 async def handle(msg, context):
-    text = msg.get("text", "")
-    interval = float(msg.get("interval", 0.02))
-    
-    if not isinstance(text, str) or not text:
-        return {"status": "error", "error": {"message": "No text to type"}}
-    
-    pyautogui.typewrite(text, interval=interval)
-    time.sleep(0.05)
-    return {"status": "ok", "result": {"typed": text}}
+    text = msg["text"]
+    interval = msg.get("interval", 0.02)
+    mode = msg.get("mode", "keys")
+    backend = context["backend"]
+
+    if mode == "keys":
+        backend.write(text, interval=interval)
+        return {"status": "ok", "result": {"typed": text}}
+
+    inject = backend.write_unicode if mode == "unicode" else backend.paste
+    chunk_size = msg.get("chunk_size", 512)
+    chunk_delay = msg.get("chunk_delay")
+    if chunk_delay is None:
+        chunk_delay = PASTE_CHUNK_DELAY if mode == "paste" else 0.0
+    # Set by the dispatcher for requests that carry an "id"
+    progress = context.get("progress")
+    cancelled = context.get("cancelled")
+
+    total = len(text)
+    chunks = range(0, total, chunk_size)
+    for index, start in enumerate(chunks):
+        if cancelled is not None and cancelled():
+            return {
+                "status": "error",
+                "error": {"message": "cancelled", "details": {"typed_chars": start, "total_chars": total}},
+            }
+        if index and chunk_delay:
+            await asyncio.sleep(chunk_delay)
+        chunk = text[start:start + chunk_size]
+        inject(chunk)
+        if progress is not None:
+            progress({"typed_chars": start + len(chunk), "total_chars": total})
+
+    return {"status": "ok", "result": {"typed_chars": total, "mode": mode, "chunks": len(chunks)}}
@@ -0,0 +1,48 @@
+import hashlib
+
+from ..schema import SchemaError
+from ..watch import difference, fingerprint, poll, sample, timing
+
+READ_ONLY = True
+# Waits on the server loop; each grab goes to the read pool (see watch.py)
+ON_LOOP = True
+
+SCHEMA = {
+    # [x, y, w, h]; the whole screen when omitted
+    "region": {"type": "list", "length": 4, "items": {"type": "int"}},
+    "timeout": {"type": "float", "default": 5.0, "min": 0},
+    # Seconds between samples (authentication.yaml watch.interval by default)
+    "interval": {"type": "float", "min": 0.01, "max": 5},
+    # Mean thumbnail difference (0-1) that counts as a change
+    "threshold": {"type": "float", "default": 0.002, "min": 0, "max": 1},
+}
+
+async def handle(msg, context):
+    try:
+        timeout, interval = timing(msg, context)
+    except SchemaError as e:
+        return {"status": "error", "error": {"message": "invalid_params", "details": e.details()}}
+    region = msg.get("region")
+    region = tuple(region) if region else None
+    threshold = msg.get("threshold", 0.002)
+    capture = context["capture"]
+    offload = context.get("offload")
+
+    baseline = await sample(lambda: fingerprint(capture.grab(region)), offload)
+    latest = [baseline]
+
+    def changed():
+        sample = latest[0] = fingerprint(capture.grab(region))
+        score = difference(baseline, sample)
+        return score if score > threshold else None
+
+    outcome, score, samples, elapsed = await poll(changed, timeout, interval, context.get("cancelled"), offload)
+    if outcome == "cancelled":
+        return {"status": "error", "error": {"message": "cancelled", "details": {"elapsed": round(elapsed, 3), "samples": samples}}}
+    return {"status": "ok", "result": {
+        "changed": outcome == "matched",
+        "difference": round(score if score is not None else difference(baseline, latest[0]), 4),
+        "elapsed": round(elapsed, 3),
+        "samples": samples,
+        "fingerprint": hashlib.blake2b(latest[0], digest_size=8).hexdigest(),
+    }}
@@ -0,0 +1,70 @@
+import numpy as np
+
+from ..schema import SchemaError
+from ..watch import poll, timing
+
+READ_ONLY = True
+# Waits on the server loop; each grab goes to the read pool (see watch.py)
+ON_LOOP = True
+
+SCHEMA = {
+    # Watch one pixel (x, y) or any pixel in a region [x, y, w, h]
+    "x": {"type": "int"},
+    "y": {"type": "int"},
+    "region": {"type": "list", "length": 4, "items": {"type": "int"}},
+    "color": {"type": "list", "required": True, "length": 3, "items": {"type": "int", "min": 0, "max": 255}},
+    # Largest per-channel difference still counted as the color
+    "tolerance": {"type": "int", "default": 0, "min": 0, "max": 255},
+    # false: wait until the color is gone instead
+    "present": {"type": "bool", "default": True},
+    "timeout": {"type": "float", "default": 5.0, "min": 0},
+    "interval": {"type": "float", "min": 0.01, "max": 5},
+}
+
+def invalid(field, reason):
+    return {"status": "error", "error": {"message": "invalid_params", "details": {"field": field, "reason": reason}}}
+
+async def handle(msg, context):
+    region = msg.get("region")
+    if region is None:
+        if msg.get("x") is None or msg.get("y") is None:
+            return invalid("region", "or 'x' and 'y' is required")
+        region = [msg["x"], msg["y"], 1, 1]
+    elif region[2] <= 0 or region[3] <= 0:
+        return invalid("region", "must have a positive width and height")
+    try:
+        timeout, interval = timing(msg, context)
+    except SchemaError as e:
+        return {"status": "error", "error": {"message": "invalid_params", "details": e.details()}}
+
+    color = np.array(msg["color"], dtype=np.int16)
+    tolerance = msg.get("tolerance", 0)
+    present = msg.get("present", True)
+    capture = context["capture"]
+    left, top = region[0], region[1]
+
+    def check():
+        pixels = np.asarray(capture.grab(tuple(region)).convert("RGB"), dtype=np.int16)
+        matching = np.abs(pixels - color).max(axis=2) <= tolerance
+        if present:
+            hits = np.argwhere(matching)
+            if not len(hits):
+                return None
+            row, col = hits[0]
+        else:
+            if matching.any():
+                return None
+            row, col = 0, 0
+        return [left + int(col), top + int(row)], pixels[row, col].tolist()
+
+    outcome, found, samples, elapsed = await poll(check, timeout, interval, context.get("cancelled"), context.get("offload"))
+    if outcome == "cancelled":
+        return {"status": "error", "error": {"message": "cancelled", "details": {"elapsed": round(elapsed, 3), "samples": samples}}}
+    position, pixel = found if found is not None else (None, None)
+    return {"status": "ok", "result": {
+        "matched": outcome == "matched",
+        "position": position,
+        "color": pixel,
+        "elapsed": round(elapsed, 3),
+        "samples": samples,
+    }}
@@ -0,0 +1,300 @@
+"""
+Macro recording and replay.
+
+While a connection is recording, every input action it dispatches is kept
+with its time offset. ``record_stop`` packs them into a compact binary log
+(no JSON) saved as ``<macro_dir>/<name>.wamacro``, and ``replay`` runs the
+log server-side as one input-lane job.
+
+File layout (little endian)::
+
+    header   "WAMC" magic, u16 version, u16 flags, u32 strings, u32 events, u32 duration ms
+    strings  u32 byte length + UTF-8, for every action name, param name and string value
+    events   u32 offset ms, u16 action string, u8 param count,
+             then per param: u16 name string, u8 tag, value
+
+Value tags: ``h`` i32, ``i`` i64, ``f`` f64, ``t``/``F`` true/false,
+``n`` null, ``s`` u16 string index, ``l`` u16 count followed by tagged items.
+
+Strings are stored once, so repeated key names and action names cost two
+bytes per use. Saved macros are memory-mapped on first use and indexed by
+name, so loading one is a dictionary lookup plus an ``mmap`` call. Events
+are decoded lazily, straight from the mapped buffer.
+"""
+
+import mmap
+import os
+import re
+import struct
+import time
+from pathlib import Path
+
+MAGIC = b"WAMC"
+VERSION = 1
+SUFFIX = ".wamacro"
+NAME_PATTERN = re.compile(r"^[A-Za-z0-9_.-]{1,64}$")
+# Fields that identify a request rather than describe the action
+UNRECORDED_FIELDS = frozenset(("token", "id", "progress"))
+
+HEADER = struct.Struct("<4sHHIII")
+EVENT = struct.Struct("<IHB")
+U16 = struct.Struct("<H")
+U32 = struct.Struct("<I")
+I32 = struct.Struct("<i")
+I64 = struct.Struct("<q")
+F64 = struct.Struct("<d")
+# What reading past the end of a truncated file, or a bad index into the string table, raises
+DECODE_ERRORS = (struct.error, IndexError, UnicodeDecodeError, RecursionError)
+
+
+class MacroError(ValueError):
+    pass
+
+
+def check_name(name) -> str:
+    if not isinstance(name, str) or not NAME_PATTERN.match(name):
+        raise MacroError("Macro names are 1-64 characters of letters, digits, '.', '_' or '-'")
+    return name
+
+
+class MacroRecorder:
+    """Collects the actions dispatched on one connection"""
+
+    def __init__(self, name: str, clock=time.perf_counter):
+        self.name = check_name(name)
+        self._clock = clock
+        self.started = clock()
+        self.events = []
+
+    def add(self, msg: dict) -> None:
+        params = {key: value for key, value in msg.items() if key not in UNRECORDED_FIELDS}
+        self.events.append((self._clock() - self.started, params))
+
+    def encode(self) -> bytes:
+        return encode_events(self.events, self._clock() - self.started)
+
+
+def encode_events(events, duration: float) -> bytes:
+    """Pack ``[(offset_seconds, msg), ...]`` into the binary log format"""
+    strings = {}
+
+    def intern(text: str) -> int:
+        index = strings.get(text)
+        if index is None:
+            index = strings[text] = len(strings)
+            if index > 0xFFFF:
+                raise MacroError("Macro has too many distinct strings")
+        return index
+
+    def pack_value(value, out: list) -> None:
+        if value is None:
+            out.append(b"n")
+        elif value is True:
+            out.append(b"t")
+        elif value is False:
+            out.append(b"F")
+        elif isinstance(value, int):
+            # Coordinates and counts nearly always fit in four bytes
+            out.append(b"h" + I32.pack(value) if -2**31 <= value < 2**31 else b"i" + I64.pack(value))
+        elif isinstance(value, float):
+            out.append(b"f" + F64.pack(value))
+        elif isinstance(value, str):
+            out.append(b"s" + U16.pack(intern(value)))
+        elif isinstance(value, list):
+            out.append(b"l" + U16.pack(len(value)))
+            for item in value:
+                pack_value(item, out)
+        else:
+            raise MacroError(f"Can't record a value of type {type(value).__name__}")
+
+    body = []
+    for offset, msg in events:
+        params = [(key, value) for key, value in msg.items() if key != "action"]
+        if len(params) > 0xFF:
+            raise MacroError("Too many parameters on one action")
+        body.append(EVENT.pack(int(offset * 1000), intern(msg["action"]), len(params)))
+        for key, value in params:
+            body.append(U16.pack(intern(key)))
+            pack_value(value, body)
+
+    table = []
+    for text in strings:
+        data = text.encode("utf-8")
+        table.append(U32.pack(len(data)))
+        table.append(data)
+    header = HEADER.pack(MAGIC, VERSION, 0, len(strings), len(events), int(duration * 1000))
+    return b"".join([header, *table, *body])
+
+
+class Macro:
+    """A decoded view over one macro's bytes (usually an mmap)"""
+
+    def __init__(self, name: str, buffer):
+        self.name = name
+        self._view = memoryview(buffer)
+        self.size = len(self._view)
+        try:
+            self._read_header()
+        except Exception as e:
+            # The caller closes the buffer, which fails while a view is exported
+            self._view.release()
+            if isinstance(e, DECODE_ERRORS):
+                raise self._corrupt(e) from None
+            raise
+
+    def _read_header(self) -> None:
+        if self.size < HEADER.size:
+            raise MacroError(f"Macro '{self.name}' is truncated")
+        magic, version, _flags, string_count, self.event_count, duration_ms = HEADER.unpack_from(self._view, 0)
+        if magic != MAGIC or version != VERSION:
+            raise MacroError(f"Macro '{self.name}' is not a version {VERSION} macro file")
+        self.duration = duration_ms / 1000
+
+        strings = []
+        pos = HEADER.size
+        for _ in range(string_count):
+            (length,) = U32.unpack_from(self._view, pos)
+            pos += U32.size
+            if pos + length > self.size:
+                raise MacroError(f"Macro '{self.name}' is truncated")
+            strings.append(str(self._view[pos:pos + length], "utf-8"))
+            pos += length
+        self._strings = strings
+        self._events_at = pos
+
+    def _corrupt(self, e: Exception) -> MacroError:
+        return MacroError(f"Macro '{self.name}' is corrupt ({type(e).__name__}: {e})")
+
+    def _value(self, pos: int):
+        tag = self._view[pos:pos + 1].tobytes()
+        pos += 1
+        if tag == b"h":
+            return I32.unpack_from(self._view, pos)[0], pos + I32.size
+        if tag == b"i":
+            return I64.unpack_from(self._view, pos)[0], pos + I64.size
+        if tag == b"f":
+            return F64.unpack_from(self._view, pos)[0], pos + F64.size
+        if tag == b"s":
+            return self._strings[U16.unpack_from(self._view, pos)[0]], pos + U16.size
+        if tag == b"t":
+            return True, pos
+        if tag == b"F":
+            return False, pos
+        if tag == b"n":
+            return None, pos
+        if tag == b"l":
+            (count,) = U16.unpack_from(self._view, pos)
+            pos += U16.size
+            items = []
+            for _ in range(count):
+                item, pos = self._value(pos)
+                items.append(item)
+            return items, pos
+        raise MacroError(f"Macro '{self.name}' has an unknown value tag {tag!r}")
+
+    def events(self):
+        """Yield ``(offset_seconds, msg)`` in recorded order; raises MacroError where the file is damaged"""
+        pos = self._events_at
+        for _ in range(self.event_count):
+            try:
+                offset_ms, action, param_count = EVENT.unpack_from(self._view, pos)
+                pos += EVENT.size
+                msg = {"action": self._strings[action]}
+                for _ in range(param_count):
+                    (key,) = U16.unpack_from(self._view, pos)
+                    msg[self._strings[key]], pos = self._value(pos + U16.size)
+            except DECODE_ERRORS as e:
+                raise self._corrupt(e) from None
+            yield offset_ms / 1000, msg
+
+    def info(self) -> dict:
+        return {"name": self.name, "events": self.event_count, "duration": self.duration, "bytes": self.size}
+
+    def release(self) -> None:
+        self._view.release()
+
+
+class MacroStore:
+    """Saved macros by name, memory-mapped on first use"""
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._paths = {
+            entry.name[:-len(SUFFIX)]: Path(entry.path)
+            for entry in os.scandir(self.directory)
+            if entry.is_file() and entry.name.endswith(SUFFIX)
+        }
+        # name -> (file, mmap, Macro)
+        self._open = {}
+
+    def names(self):
+        return sorted(self._paths)
+
+    def get(self, name: str) -> Macro:
+        check_name(name)
+        opened = self._open.get(name)
+        if opened is not None:
+            return opened[2]
+        path = self._paths.get(name)
+        if path is None:
+            raise MacroError(f"No macro named '{name}'")
+        try:
+            f = open(path, "rb")
+        except OSError:
+            raise MacroError(f"Macro '{name}' is unreadable")
+        mapped = None
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            macro = Macro(name, mapped)
+        except (OSError, ValueError) as e:
+            if mapped is not None:
+                mapped.close()
+            f.close()
+            if isinstance(e, MacroError):
+                raise
+            raise MacroError(f"Macro '{name}' is empty or unreadable")
+        self._open[name] = (f, mapped, macro)
+        return macro
+
+    def info(self):
+        """``Macro.info()`` for every saved macro; one that can't be read is listed with its ``error``"""
+        listed = []
+        for name in self.names():
+            try:
+                listed.append(self.get(name).info())
+            except MacroError as e:
+                listed.append({"name": name, "error": str(e)})
+        return listed
+
+    def save(self, name: str, data: bytes) -> Macro:
+        check_name(name)
+        # Windows can't replace a file that is still mapped
+        self._close(name)
+        path = self.directory / f"{name}{SUFFIX}"
+        tmp = path.with_suffix(SUFFIX + ".tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+        self._paths[name] = path
+        return self.get(name)
+
+    def delete(self, name: str) -> bool:
+        check_name(name)
+        self._close(name)
+        path = self._paths.pop(name, None)
+        if path is None:
+            return False
+        path.unlink(missing_ok=True)
+        return True
+
+    def _close(self, name: str) -> None:
+        opened = self._open.pop(name, None)
+        if opened is not None:
+            f, mapped, macro = opened
+            macro.release()
+            mapped.close()
+            f.close()
+
+    def close(self) -> None:
+        for name in list(self._open):
+            self._close(name)
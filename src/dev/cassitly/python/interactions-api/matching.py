@@ -0,0 +1,268 @@
+"""
+Template matching for the ``locate`` action.
+
+Finds a small template image on the screen with zero-mean normalized cross
+correlation (the same score as OpenCV's ``TM_CCOEFF_NORMED``: 1.0 is a
+perfect match, unaffected by brightness and contrast changes):
+
+- both images are converted to grayscale ``float32`` and reduced into a
+  pyramid of 2x2-averaged levels. The coarsest level is searched in full,
+  and each candidate is then refined in a few-pixel window on every finer
+  level, so the expensive full search runs on a fraction of the pixels
+- the full search uses ``cv2.matchTemplate`` when OpenCV is installed.
+  Otherwise it uses NumPy, with an FFT cross correlation for the numerator
+  and integral images for the per-window statistics
+- decoded templates (and their pyramids) are kept in an LRU cache keyed by
+  content hash, so repeated lookups skip decoding
+- the last location of every template is remembered. The next ``locate``
+  first grabs only that box plus a small margin and re-verifies it there,
+  which costs a tiny capture instead of a full-screen search
+"""
+
+import base64
+import binascii
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+ENGINE = "opencv" if cv2 is not None else "numpy"
+# Templates are reduced until their shorter side would drop below this
+MIN_PYRAMID_SIDE = 12
+# Candidates must score at least this on the coarsest level to be refined
+COARSE_FLOOR = 0.3
+# Pixels searched around a candidate on each finer level
+REFINE_MARGIN = 2
+# Pixels around the last known box grabbed by the fast path
+LAST_MARGIN = 8
+
+
+class TemplateError(ValueError):
+    pass
+
+
+def to_gray(img) -> np.ndarray:
+    """A PIL image as a 2-D ``float32`` luma array"""
+    return np.asarray(img.convert("L"), dtype=np.float32)
+
+
+def downsample(image: np.ndarray) -> np.ndarray:
+    """Halve both dimensions by averaging 2x2 blocks (an odd last row/column is dropped)"""
+    h, w = image.shape[0] // 2 * 2, image.shape[1] // 2 * 2
+    view = image[:h, :w]
+    return (view[0::2, 0::2] + view[1::2, 0::2] + view[0::2, 1::2] + view[1::2, 1::2]) * 0.25
+
+
+def _window_sums(values: np.ndarray, h: int, w: int) -> np.ndarray:
+    """Sum of every ``h`` x ``w`` window (valid positions only), from an integral image"""
+    integral = np.zeros((values.shape[0] + 1, values.shape[1] + 1), dtype=np.float64)
+    np.cumsum(np.cumsum(values, axis=0, dtype=np.float64), axis=1, out=integral[1:, 1:])
+    return integral[h:, w:] - integral[:-h, w:] - integral[h:, :-w] + integral[:-h, :-w]
+
+
+def _ncc_numpy(image: np.ndarray, template: np.ndarray) -> np.ndarray:
+    h, w = template.shape
+    t = template.astype(np.float64) - template.mean()
+    t_norm = np.sqrt(np.square(t).sum())
+    rows, cols = image.shape[0] - h + 1, image.shape[1] - w + 1
+    if t_norm == 0:
+        return np.zeros((rows, cols), dtype=np.float32)
+    # sum(I * t) over each window; t has zero mean, so this is already the centered numerator
+    spectrum = np.fft.rfft2(image, s=image.shape) * np.conj(np.fft.rfft2(t, s=image.shape))
+    numerator = np.fft.irfft2(spectrum, s=image.shape)[:rows, :cols]
+    n = h * w
+    sums = _window_sums(image, h, w)
+    variance = _window_sums(np.square(image, dtype=np.float64), h, w) - sums * sums / n
+    denominator = np.sqrt(np.maximum(variance, 0.0)) * t_norm
+    scores = np.zeros((rows, cols), dtype=np.float64)
+    np.divide(numerator, denominator, out=scores, where=denominator > 1e-6 * t_norm)
+    return np.clip(scores, -1.0, 1.0).astype(np.float32)
+
+
+def ncc(image: np.ndarray, template: np.ndarray) -> np.ndarray:
+    """Score map of ``template`` at every valid top-left position in ``image``"""
+    if image.shape[0] < template.shape[0] or image.shape[1] < template.shape[1]:
+        return np.zeros((0, 0), dtype=np.float32)
+    if cv2 is not None:
+        scores = cv2.matchTemplate(image, template, cv2.TM_CCOEFF_NORMED)
+        # Flat windows come back as inf/nan
+        return np.nan_to_num(scores, nan=0.0, posinf=0.0, neginf=0.0)
+    return _ncc_numpy(image, template)
+
+
+def peaks(scores: np.ndarray, count: int, floor: float, h: int, w: int):
+    """Up to ``count`` ``(score, y, x)`` maxima, at least half a template apart"""
+    scores = scores.copy()
+    found = []
+    for _ in range(count):
+        if scores.size == 0:
+            break
+        index = int(np.argmax(scores))
+        y, x = divmod(index, scores.shape[1])
+        score = float(scores[y, x])
+        if score < floor:
+            break
+        found.append((score, y, x))
+        scores[max(0, y - h // 2):y + h // 2 + 1, max(0, x - w // 2):x + w // 2 + 1] = -np.inf
+    return found
+
+
+class Template:
+    """A decoded template and its pyramid"""
+
+    def __init__(self, key: str, gray: np.ndarray):
+        self.key = key
+        self.height, self.width = gray.shape
+        self.levels = [gray]
+        while min(self.levels[-1].shape) // 2 >= MIN_PYRAMID_SIDE:
+            self.levels.append(downsample(self.levels[-1]))
+
+
+def decode_template(data: str, key: str) -> Template:
+    """A template from base64 PNG/JPEG data"""
+    try:
+        raw = base64.b64decode(data, validate=True)
+    except (binascii.Error, ValueError):
+        raise TemplateError("'template' is not valid base64")
+    from PIL import Image, UnidentifiedImageError
+
+    try:
+        img = Image.open(io.BytesIO(raw))
+        img.load()
+    except (UnidentifiedImageError, OSError):
+        raise TemplateError("'template' is not a PNG or JPEG image")
+    gray = to_gray(img)
+    if min(gray.shape) < 2:
+        raise TemplateError("'template' must be at least 2x2 pixels")
+    if float(gray.std()) == 0.0:
+        raise TemplateError("'template' is a single flat color and can't be matched")
+    return Template(key, gray)
+
+
+class TemplateMatcher:
+    """Template LRU, last-known locations and the pyramid search; shared by every locate call"""
+
+    def __init__(self, cache_size: int = 32, max_levels: int = 4):
+        self.cache_size = max(1, int(cache_size))
+        self.max_levels = max(1, int(max_levels))
+        self._templates = OrderedDict()
+        # template key -> last (x, y, w, h) found on screen
+        self._last = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.fast_path_hits = 0
+
+    def template(self, data: str) -> Template:
+        # Key on the base64 text first so cache hits skip decoding entirely
+        key = hashlib.sha1(data.encode("ascii", "replace")).hexdigest()
+        with self._lock:
+            template = self._templates.get(key)
+            if template is not None:
+                self._templates.move_to_end(key)
+                self.hits += 1
+                return template
+            self.misses += 1
+        template = decode_template(data, key)
+        with self._lock:
+            self._templates[key] = template
+            while len(self._templates) > self.cache_size:
+                evicted, _ = self._templates.popitem(last=False)
+                self._last.pop(evicted, None)
+        return template
+
+    def search(self, image: np.ndarray, template: Template, threshold: float, max_results: int):
+        """Matches of ``template`` in a grayscale ``image``: ``[(score, x, y), ...]``, best first"""
+        h, w = template.height, template.width
+        if image.shape[0] < h or image.shape[1] < w:
+            return []
+        # Coarsest level at which both the template and the image are still usable
+        images = [image]
+        level = 0
+        while (level + 1 < min(self.max_levels, len(template.levels))
+               and min(images[-1].shape) // 2 >= 2 * min(template.levels[level + 1].shape)):
+            images.append(downsample(images[-1]))
+            level += 1
+
+        coarse = template.levels[level]
+        floor = min(threshold, COARSE_FLOOR) if level else threshold
+        candidates = peaks(ncc(images[level], coarse), max_results * 3 + 2, floor, *coarse.shape)
+
+        matches = []
+        for score, y, x in candidates:
+            for finer in range(level - 1, -1, -1):
+                tpl = template.levels[finer]
+                th, tw = tpl.shape
+                img = images[finer]
+                y0 = max(0, min(2 * y - REFINE_MARGIN, img.shape[0] - th))
+                x0 = max(0, min(2 * x - REFINE_MARGIN, img.shape[1] - tw))
+                window = img[y0:y0 + th + 2 * REFINE_MARGIN, x0:x0 + tw + 2 * REFINE_MARGIN]
+                scores = ncc(window, tpl)
+                if scores.size == 0:
+                    break
+                dy, dx = divmod(int(np.argmax(scores)), scores.shape[1])
+                score, y, x = float(scores[dy, dx]), y0 + dy, x0 + dx
+            if score >= threshold and all(abs(x - mx) > w // 2 or abs(y - my) > h // 2 for _, mx, my in matches):
+                matches.append((score, x, y))
+        matches.sort(reverse=True)
+        return matches[:max_results]
+
+    def locate(self, capture, template: Template, threshold: float = 0.9, max_results: int = 1, region=None) -> dict:
+        """Grab the screen (or ``region``) and find ``template``; tries the last known box first"""
+        last = self._last.get(template.key)
+        if last is not None and max_results == 1 and region is None:
+            x, y, w, h = last
+            box = (max(0, x - LAST_MARGIN), max(0, y - LAST_MARGIN), w + 2 * LAST_MARGIN, h + 2 * LAST_MARGIN)
+            found = self.search(to_gray(capture.grab(box)), template, threshold, 1)
+            if found:
+                self.fast_path_hits += 1
+                return self._result(found, template, box[0], box[1], cached=True)
+
+        offset_x, offset_y = (region[0], region[1]) if region else (0, 0)
+        found = self.search(to_gray(capture.grab(tuple(region) if region else None)), template, threshold, max_results)
+        if found:
+            _, x, y = found[0]
+            self._last[template.key] = (offset_x + x, offset_y + y, template.width, template.height)
+        else:
+            self._last.pop(template.key, None)
+        return self._result(found, template, offset_x, offset_y, cached=False)
+
+    def _result(self, found, template: Template, offset_x: int, offset_y: int, cached: bool) -> dict:
+        matches = []
+        for score, x, y in found:
+            x, y = offset_x + x, offset_y + y
+            matches.append({
+                "box": [x, y, template.width, template.height],
+                "center": [x + template.width // 2, y + template.height // 2],
+                "score": round(score, 4),
+            })
+        return {"found": bool(matches), "matches": matches, "cached": cached, "engine": ENGINE}
+
+    def stats(self) -> dict:
+        return {
+            "engine": ENGINE,
+            "templates": len(self._templates),
+            "hits": self.hits,
+            "misses": self.misses,
+            "fast_path_hits": self.fast_path_hits,
+        }
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_matcher() -> TemplateMatcher:
+    """Process-wide matcher for handlers called without a server context"""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = TemplateMatcher()
+        return _shared
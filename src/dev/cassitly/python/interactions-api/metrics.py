@@ -0,0 +1,229 @@
+"""
+Request metrics.
+
+``handle_message`` reports every request here: a counter per action and
+status, an error counter per ``err()`` code, and a latency histogram split
+into three phases:
+
+- ``queue``: time spent waiting before the handler body ran (connection
+  queue, fair scheduler, executor lane, settle time)
+- ``execute``: the handler body itself (the whole dispatch for built-ins
+  that don't use the executor)
+- ``serialize``: encoding the reply
+
+Active connections and bytes in/out are tracked alongside. Everything is
+updated from the websocket loop thread only, so there are no locks. A
+request costs a few ``perf_counter`` calls, a bisect and some dict lookups,
+which is cheap enough to keep on in production.
+
+``render()`` produces the Prometheus text format served at ``/metrics``,
+and ``snapshot()`` the JSON summary returned by the ``stats`` action.
+"""
+
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+# Upper bounds in seconds; the last (implicit) bucket is +Inf
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PHASES = ("queue", "execute", "serialize")
+PREFIX = "windows_api"
+
+# The RequestTiming of the request being dispatched on the current task
+_current = ContextVar("request_timing", default=None)
+
+
+class RequestTiming:
+    """Timestamps for one request, filled in as it moves through the server"""
+
+    __slots__ = ("received", "execute", "_token")
+
+    def __init__(self, received: float):
+        self.received = received
+        # Seconds spent inside handler bodies; None when nothing went through ``timed``
+        self.execute = None
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, *exc):
+        _current.reset(self._token)
+
+
+def timed(func):
+    """Wrap a coroutine function so its run time counts as the current request's execute phase
+
+    Call it on the loop thread (where the request's timing is visible); the returned
+    wrapper may then run anywhere, e.g. on an executor lane.
+    """
+    timing = _current.get()
+    if timing is None:
+        return func
+
+    async def run(*args):
+        started = time.perf_counter()
+        try:
+            return await func(*args)
+        finally:
+            timing.execute = (timing.execute or 0.0) + time.perf_counter() - started
+    return run
+
+
+class Histogram:
+    __slots__ = ("counts", "count", "sum")
+
+    def __init__(self, size: int):
+        self.counts = [0] * size
+        self.count = 0
+        self.sum = 0.0
+
+    def quantile(self, q: float, buckets) -> float:
+        """Upper bound of the bucket holding the ``q`` quantile (the largest bound for +Inf)"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return buckets[-1]
+
+
+def _labels(**labels) -> str:
+    parts = []
+    for key, value in labels.items():
+        text = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{key}="{text}"')
+    return "{" + ",".join(parts) + "}"
+
+
+class Metrics:
+    def __init__(self, buckets=LATENCY_BUCKETS, clock=time.perf_counter):
+        self.buckets = tuple(buckets)
+        self.clock = clock
+        self.started = clock()
+        # (action, status) -> count
+        self.requests = {}
+        # (action, code) -> count
+        self.errors = {}
+        # (action, phase) -> Histogram
+        self.latency = {}
+        self.connections_active = 0
+        self.connections_total = 0
+        self.bytes_received = 0
+        self.bytes_sent = 0
+
+    # --- recording ---
+
+    def start(self, received=None) -> RequestTiming:
+        return RequestTiming(self.clock() if received is None else received)
+
+    def observe(self, action: str, response: dict, timing: RequestTiming, dispatched: float, encoded: float) -> None:
+        """Count one finished request; ``dispatched``/``encoded`` are clock readings after each step"""
+        status = response.get("status", "ok")
+        key = (action, status)
+        self.requests[key] = self.requests.get(key, 0) + 1
+        if status == "error":
+            self.error(action, (response.get("error") or {}).get("message", "error"))
+
+        total = dispatched - timing.received
+        execute = total if timing.execute is None else min(timing.execute, total)
+        self._record(action, "queue", total - execute)
+        self._record(action, "execute", execute)
+        self._record(action, "serialize", encoded - dispatched)
+
+    def error(self, action: str, code) -> None:
+        key = (action, str(code))
+        self.errors[key] = self.errors.get(key, 0) + 1
+
+    def _record(self, action: str, phase: str, seconds: float) -> None:
+        histogram = self.latency.get((action, phase))
+        if histogram is None:
+            histogram = self.latency[(action, phase)] = Histogram(len(self.buckets) + 1)
+        histogram.counts[bisect_left(self.buckets, seconds)] += 1
+        histogram.count += 1
+        histogram.sum += seconds
+
+    def connection_opened(self) -> None:
+        self.connections_active += 1
+        self.connections_total += 1
+
+    def connection_closed(self) -> None:
+        self.connections_active -= 1
+
+    def received(self, size: int) -> None:
+        self.bytes_received += size
+
+    def sent(self, size: int) -> None:
+        self.bytes_sent += size
+
+    # --- reporting ---
+
+    def snapshot(self) -> dict:
+        actions = {}
+        for (action, status), count in self.requests.items():
+            actions.setdefault(action, {"requests": {}, "errors": {}, "latency_ms": {}})["requests"][status] = count
+        for (action, code), count in self.errors.items():
+            actions.setdefault(action, {"requests": {}, "errors": {}, "latency_ms": {}})["errors"][code] = count
+        for (action, phase), histogram in self.latency.items():
+            actions[action]["latency_ms"][phase] = {
+                "count": histogram.count,
+                "mean": round(histogram.sum / histogram.count * 1000, 3),
+                "p50": round(histogram.quantile(0.5, self.buckets) * 1000, 3),
+                "p95": round(histogram.quantile(0.95, self.buckets) * 1000, 3),
+            }
+        return {
+            "uptime_seconds": round(self.clock() - self.started, 3),
+            "connections_active": self.connections_active,
+            "connections_total": self.connections_total,
+            "bytes_received": self.bytes_received,
+            "bytes_sent": self.bytes_sent,
+            "actions": actions,
+        }
+
+    def render(self, gauges=None) -> str:
+        """Prometheus text exposition format; ``gauges`` adds ``{name: value}`` point-in-time values"""
+        lines = [
+            f"# HELP {PREFIX}_requests_total Requests handled, by action and status.",
+            f"# TYPE {PREFIX}_requests_total counter",
+        ]
+        for (action, status), count in sorted(self.requests.items()):
+            lines.append(f"{PREFIX}_requests_total{_labels(action=action, status=status)} {count}")
+
+        lines += [
+            f"# HELP {PREFIX}_errors_total Error replies, by action and error code.",
+            f"# TYPE {PREFIX}_errors_total counter",
+        ]
+        for (action, code), count in sorted(self.errors.items()):
+            lines.append(f"{PREFIX}_errors_total{_labels(action=action, code=code)} {count}")
+
+        name = f"{PREFIX}_request_phase_seconds"
+        lines += [
+            f"# HELP {name} Request latency by action and phase (queue, execute, serialize).",
+            f"# TYPE {name} histogram",
+        ]
+        for (action, phase), histogram in sorted(self.latency.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(action=action, phase=phase, le=bound)} {cumulative}")
+            lines.append(f"{name}_bucket{_labels(action=action, phase=phase, le='+Inf')} {histogram.count}")
+            lines.append(f"{name}_sum{_labels(action=action, phase=phase)} {histogram.sum:.6f}")
+            lines.append(f"{name}_count{_labels(action=action, phase=phase)} {histogram.count}")
+
+        for metric, kind, help_text, value in (
+            ("connections_active", "gauge", "Open websocket connections.", self.connections_active),
+            ("connections_total", "counter", "Websocket connections accepted.", self.connections_total),
+            ("received_bytes_total", "counter", "Bytes received in websocket messages.", self.bytes_received),
+            ("sent_bytes_total", "counter", "Bytes sent in websocket messages.", self.bytes_sent),
+            ("uptime_seconds", "gauge", "Seconds since the server started.", round(self.clock() - self.started, 3)),
+            *(((gauge, "gauge", gauge.replace("_", " ").capitalize() + ".", value) for gauge, value in (gauges or {}).items())),
+        ):
+            lines += [
+                f"# HELP {PREFIX}_{metric} {help_text}",
+                f"# TYPE {PREFIX}_{metric} {kind}",
+                f"{PREFIX}_{metric} {value}",
+            ]
+        return "\n".join(lines) + "\n"
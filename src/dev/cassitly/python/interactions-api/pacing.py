@@ -0,0 +1,69 @@
+"""
+Pacing for input actions.
+
+pyautogui's global ``PAUSE`` sleeps after every single call, inside the
+handler, before the reply goes out. The input backend now runs with
+``PAUSE = 0`` and the ``Pacer`` handles settle time instead:
+
+- after an input action, the next input action may not start until
+  ``delay`` seconds have passed (the message's ``delay``, else the default)
+- the wait is an ``await asyncio.sleep`` on the input lane. The reply
+  itself is never held back, and actions that arrive after the settle
+  window has already passed don't wait at all.
+
+Clients that don't need settling time send ``"delay": 0`` (or set
+``pause: 0`` in authentication.yaml) and run at full speed. Batches accept
+``options.delay`` as the gap between their steps.
+"""
+
+import asyncio
+import time
+
+# Longest settle time a single message may ask for
+MAX_DELAY = 10.0
+
+# Merged into every input handler's SCHEMA by the dispatcher
+PACING_SCHEMA = {
+    "delay": {"type": "float", "min": 0, "max": MAX_DELAY},
+}
+
+
+class Pacer:
+    """Keeps consecutive input actions at least ``delay`` seconds apart
+
+    Only used from the single input lane thread, so it needs no locking.
+    """
+
+    def __init__(self, default_delay: float = 0.0, clock=time.monotonic):
+        self.default_delay = max(0.0, float(default_delay))
+        self._clock = clock
+        self._ready_at = 0.0
+        self.waits = 0
+        self.waited = 0.0
+
+    async def wait(self) -> None:
+        """Sleep out whatever is left of the previous action's settle time"""
+        remaining = self._ready_at - self._clock()
+        if remaining > 0:
+            self.waits += 1
+            self.waited += remaining
+            await asyncio.sleep(remaining)
+
+    def settle(self, delay=None) -> None:
+        """Start the settle window after an action (``None`` = the default delay)"""
+        delay = self.default_delay if delay is None else delay
+        self._ready_at = self._clock() + delay
+
+    async def pace(self, handler, msg: dict, context: dict, delay=None):
+        """Run one input handler inside the pacing window
+
+        The message's own ``delay`` wins over ``delay`` (a batch's gap), which wins over the default.
+        """
+        await self.wait()
+        try:
+            return await handler(msg, context)
+        finally:
+            self.settle(msg["delay"] if msg.get("delay") is not None else delay)
+
+    def stats(self) -> dict:
+        return {"default_delay": self.default_delay, "waits": self.waits, "waited_seconds": round(self.waited, 3)}
@@ -0,0 +1,256 @@
+"""
+Fair scheduling of input across connections.
+
+There is one mouse and one keyboard, and several agents may be connected at
+once. Rather than letting their messages reach the input lane in whatever
+order the sockets deliver them, every input job goes through an
+``InputScheduler``:
+
+- each connection has its own queue. The next job is picked by start-time
+  fair queuing, so a connection with weight 2 gets twice the share of one
+  with weight 1 when both are busy, and a batch costs as much as its steps
+- an optional exclusive *lease* lets one connection hold the input device
+  for a while. Everyone else's input waits until it is released or expires
+- a per-connection token bucket rejects floods with ``rate_limited``, and a
+  full queue rejects with ``busy``. Both carry ``retry_after`` (backpressure).
+  ``admit()`` applies the same limit to messages still waiting in a
+  connection's own queue
+- the time each job spent queued is recorded and reported by ``stats()``
+
+Jobs are awaitable factories (``lambda: executor.run(INPUT, ...)``) and at
+most one runs at a time, which matches the single input lane behind it.
+"""
+
+import asyncio
+import itertools
+import time
+from collections import deque
+
+# Queue waits kept per client for the percentiles in stats()
+WAIT_SAMPLES = 512
+
+
+class SchedulerBusy(Exception):
+    """A job was refused before being queued"""
+
+    def __init__(self, reason: str, details: dict):
+        super().__init__(reason)
+        self.reason = reason
+        self.details = details
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float, clock):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self._clock = clock
+        self._updated = clock()
+
+    def take(self) -> float:
+        """Spend one token; returns 0, or the seconds until one is available"""
+        if self.rate <= 0:
+            return 0.0
+        now = self._clock()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class _Job:
+    __slots__ = ("start", "finish", "factory", "future", "enqueued")
+
+    def __init__(self, start, finish, factory, future, enqueued):
+        self.start = start
+        self.finish = finish
+        self.factory = factory
+        self.future = future
+        self.enqueued = enqueued
+
+
+class _Client:
+    _ids = itertools.count(1)
+
+    def __init__(self, name: str, weight: float, bucket: TokenBucket):
+        self.id = next(self._ids)
+        self.name = name
+        self.weight = weight
+        self.bucket = bucket
+        self.queue = deque()
+        self.finish = 0.0
+        self.served = 0
+        self.rate_limited = 0
+        self.busy = 0
+        self.waits = deque(maxlen=WAIT_SAMPLES)
+        self.wait_total = 0.0
+
+
+def _percentile(values, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+
+class InputScheduler:
+    def __init__(self, rate: float = 0.0, burst: float = 20, max_queue: int = 64,
+                 max_lease: float = 60.0, weights=None, clock=time.monotonic):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.max_queue = int(max_queue)
+        self.max_lease = float(max_lease)
+        self.weights = dict(weights or {})
+        self._clock = clock
+        self._clients = {}
+        self._virtual_time = 0.0
+        self._running = None
+        self._lease = None  # (client key, expires at)
+        self._lease_timer = None
+
+    def _client(self, key, name) -> _Client:
+        client = self._clients.get(key)
+        if client is None:
+            weight = max(0.01, float(self.weights.get(name, 1.0)))
+            client = self._clients[key] = _Client(name or "anonymous", weight, TokenBucket(self.rate, self.burst, self._clock))
+        return client
+
+    # --- jobs ---
+
+    async def run(self, key, name, factory, cost: float = 1.0):
+        """Queue ``factory`` for client ``key`` and return its result once it has run"""
+        client = self._client(key, name)
+        retry_after = client.bucket.take()
+        if retry_after:
+            client.rate_limited += 1
+            raise SchedulerBusy("rate_limited", {"retry_after": round(retry_after, 3)})
+        self._check_queue(client, len(client.queue))
+
+        start = max(self._virtual_time, client.finish)
+        client.finish = start + max(cost, 1.0) / client.weight
+        job = _Job(start, client.finish, factory, asyncio.get_running_loop().create_future(), self._clock())
+        client.queue.append(job)
+        self._dispatch()
+        return await job.future
+
+    def admit(self, key, name, queued: int) -> None:
+        """Refuse with ``busy`` when ``queued`` messages already wait in front of the scheduler
+
+        A connection in concurrent mode keeps its input in its own queue and hands
+        the scheduler one job at a time, so its backlog is checked here instead.
+        """
+        self._check_queue(self._client(key, name), queued)
+
+    def _check_queue(self, client: _Client, queued: int) -> None:
+        if queued >= self.max_queue:
+            client.busy += 1
+            raise SchedulerBusy("busy", {"queued": queued, "retry_after": 0.1})
+
+    def _eligible(self):
+        lease = self._current_lease()
+        if lease is not None:
+            client = self._clients.get(lease)
+            return [client] if client is not None else []
+        return list(self._clients.values())
+
+    def _dispatch(self) -> None:
+        """Start the next job if nothing is running (called after every enqueue/finish/lease change)"""
+        if self._running is not None:
+            return
+        client = None
+        for candidate in self._eligible():
+            # Callers that went away (closed connection) leave cancelled futures behind
+            while candidate.queue and candidate.queue[0].future.done():
+                candidate.queue.popleft()
+            if candidate.queue and (client is None or candidate.queue[0].finish < client.queue[0].finish):
+                client = candidate
+        if client is None:
+            return
+        job = client.queue.popleft()
+        self._virtual_time = job.start
+        wait = self._clock() - job.enqueued
+        client.waits.append(wait)
+        client.wait_total += wait
+        client.served += 1
+        self._running = asyncio.ensure_future(self._run_job(job))
+
+    async def _run_job(self, job: _Job) -> None:
+        try:
+            result = await job.factory()
+        except asyncio.CancelledError:
+            job.future.cancel()
+            raise
+        except Exception as e:
+            if not job.future.done():
+                job.future.set_exception(e)
+        else:
+            if not job.future.done():
+                job.future.set_result(result)
+        finally:
+            self._running = None
+            self._dispatch()
+
+    # --- leases ---
+
+    def _current_lease(self):
+        if self._lease is not None and self._clock() >= self._lease[1]:
+            self._lease = None
+        return self._lease[0] if self._lease is not None else None
+
+    def acquire_lease(self, key, name, duration: float) -> dict:
+        """Hold the input device for ``duration`` seconds; raises SchedulerBusy if someone else has it"""
+        holder = self._current_lease()
+        if holder is not None and holder != key:
+            remaining = self._lease[1] - self._clock()
+            raise SchedulerBusy("lease_held", {"holder": self._clients[holder].name, "retry_after": round(remaining, 3)})
+        self._client(key, name)
+        duration = min(max(0.0, float(duration)), self.max_lease)
+        self._lease = (key, self._clock() + duration)
+        self._arm_lease_timer(duration)
+        return {"expires_in": duration}
+
+    def release_lease(self, key) -> bool:
+        if self._current_lease() != key:
+            return False
+        self._lease = None
+        self._dispatch()
+        return True
+
+    def _arm_lease_timer(self, delay: float) -> None:
+        # Wake queued clients as soon as the lease runs out, even with no new traffic
+        if self._lease_timer is not None:
+            self._lease_timer.cancel()
+        self._lease_timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+
+    def drop(self, key) -> None:
+        """Forget a closed connection: cancel its queued jobs and release its lease"""
+        client = self._clients.pop(key, None)
+        if client is not None:
+            for job in client.queue:
+                job.future.cancel()
+        if self._lease is not None and self._lease[0] == key:
+            self._lease = None
+            self._dispatch()
+
+    def stats(self) -> dict:
+        lease = self._current_lease()
+        clients = {}
+        for client in self._clients.values():
+            waits = list(client.waits)
+            clients[f"{client.name}#{client.id}"] = {
+                "weight": client.weight,
+                "queued": len(client.queue),
+                "served": client.served,
+                "rate_limited": client.rate_limited,
+                "busy": client.busy,
+                "wait_p50_ms": round(_percentile(waits, 50) * 1000, 3),
+                "wait_p95_ms": round(_percentile(waits, 95) * 1000, 3),
+                "wait_total_seconds": round(client.wait_total, 3),
+            }
+        return {
+            "lease": self._clients[lease].name if lease is not None else None,
+            "running": self._running is not None,
+            "clients": clients,
+        }
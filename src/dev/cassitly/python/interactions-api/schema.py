@@ -0,0 +1,154 @@
+"""
+Parameter schemas for handlers.
+
+A handler module may declare a ``SCHEMA`` dict describing its parameters::
+
+    SCHEMA = {
+        "x": {"type": "int", "required": True},
+        "duration": {"type": "float", "default": 0.0, "min": 0},
+        "button": {"type": "str", "default": "left", "choices": ["left", "right", "middle"]},
+    }
+
+``compile_schema`` turns it into a single validator function once, at
+``load_handlers()`` time. The dispatcher runs that validator before the
+handler: it returns a copy of the message with coerced values and defaults
+filled in, or raises ``SchemaError`` which becomes one ``invalid_params``
+error shape for every handler.
+
+Supported keys per field: ``type`` (int, float, str, bool, list, any),
+``required``, ``default``, ``min``/``max`` (numbers), ``choices``,
+``min_length``/``max_length``/``length`` (str and list) and ``items``
+(a field spec applied to every list element).
+"""
+
+_MISSING = object()
+
+
+class SchemaError(ValueError):
+    def __init__(self, field: str, reason: str):
+        super().__init__(f"'{field}' {reason}")
+        self.field = field
+        self.reason = reason
+
+    def details(self) -> dict:
+        return {"field": self.field, "reason": self.reason}
+
+
+def _to_int(value):
+    if isinstance(value, bool):
+        raise TypeError
+    if isinstance(value, int):
+        return value
+    if isinstance(value, (float, str)):
+        return int(float(value))
+    raise TypeError
+
+
+def _to_float(value):
+    if isinstance(value, bool):
+        raise TypeError
+    if isinstance(value, (int, float, str)):
+        return float(value)
+    raise TypeError
+
+
+def _to_str(value):
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    raise TypeError
+
+
+def _to_bool(value):
+    if isinstance(value, bool):
+        return value
+    if value in (0, 1):
+        return bool(value)
+    raise TypeError
+
+
+def _to_list(value):
+    if isinstance(value, list):
+        return value
+    raise TypeError
+
+
+_COERCERS = {
+    "int": (_to_int, "an integer"),
+    "float": (_to_float, "a number"),
+    "str": (_to_str, "a string"),
+    "bool": (_to_bool, "a boolean"),
+    "list": (_to_list, "a list"),
+    "any": (lambda value: value, "a value"),
+}
+
+
+def _compile_value(name: str, spec: dict):
+    """Build ``convert(value) -> value`` for one field (without required/default handling)"""
+    coerce, expected = _COERCERS[spec.get("type", "any")]
+    checks = []
+    if "min" in spec:
+        low = spec["min"]
+        checks.append((lambda v: v >= low, f"must be >= {low}"))
+    if "max" in spec:
+        high = spec["max"]
+        checks.append((lambda v: v <= high, f"must be <= {high}"))
+    if "choices" in spec:
+        choices = frozenset(spec["choices"])
+        checks.append((lambda v: v in choices, f"must be one of: {', '.join(map(str, spec['choices']))}"))
+    if "length" in spec:
+        length = spec["length"]
+        checks.append((lambda v: len(v) == length, f"must have exactly {length} items"))
+    if "min_length" in spec:
+        min_length = spec["min_length"]
+        checks.append((lambda v: len(v) >= min_length, f"must have a length of at least {min_length}"))
+    if "max_length" in spec:
+        max_length = spec["max_length"]
+        checks.append((lambda v: len(v) <= max_length, f"must have a length of at most {max_length}"))
+    item = _compile_value(f"{name}[]", spec["items"]) if "items" in spec else None
+
+    def convert(value):
+        try:
+            value = coerce(value)
+        except (TypeError, ValueError, OverflowError):
+            raise SchemaError(name, f"must be {expected}")
+        for check, reason in checks:
+            if not check(value):
+                raise SchemaError(name, reason)
+        if item is not None:
+            value = [item(element) for element in value]
+        return value
+
+    return convert
+
+
+def _compile_field(name: str, spec: dict):
+    convert = _compile_value(name, spec)
+    required = spec.get("required", False)
+    default = spec.get("default", _MISSING)
+
+    def validate(msg: dict, out: dict) -> None:
+        value = msg.get(name)
+        if value is None:
+            if required:
+                raise SchemaError(name, "is required")
+            if default is not _MISSING:
+                out[name] = default
+            return
+        out[name] = convert(value)
+
+    return validate
+
+
+def compile_schema(schema: dict):
+    """Compile a handler ``SCHEMA`` into ``validate(msg) -> msg``, raising SchemaError"""
+    fields = [_compile_field(name, spec) for name, spec in schema.items()]
+
+    def validate(msg: dict) -> dict:
+        out = dict(msg)
+        for field in fields:
+            field(msg, out)
+        return out
+
+    return validate
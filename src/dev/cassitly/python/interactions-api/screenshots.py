@@ -0,0 +1,265 @@
+"""
+Screenshot files for the ``screenshot`` action.
+
+``ScreenshotStore`` owns the screenshot directory:
+
+- frames are encoded and written by one background thread, so the handler
+  only pays for the capture. Each file is written under a temporary name and
+  renamed when complete, so a returned path is either missing or whole
+- identical frames are stored once. A capture whose pixels hash the same as
+  a file already kept returns that file instead of writing another copy
+- generated names carry microseconds and a sequence number, so captures in
+  the same second no longer overwrite each other
+- retention is bounded by file count, total bytes and age, checked on every
+  write. The least recently used files (written, or returned as a duplicate)
+  go first, and the newest file is always kept
+- the PNG ``compression`` level (zlib 0-9) comes from
+  ``gui_automation.screenshot`` in src/dev/config.yaml
+
+Only files written by the store, plus ``snap_*`` files found at startup, are
+ever deleted.
+"""
+
+import datetime
+import hashlib
+import itertools
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from pathlib import Path
+
+PREFIX = "snap_"
+# Frames waiting for the writer; save() blocks beyond this (backpressure on capture)
+MAX_PENDING = 16
+
+
+class _Entry:
+    __slots__ = ("name", "size", "used", "digest", "future")
+
+    def __init__(self, name: str, size: int, used: float, digest, future: Future):
+        self.name = name
+        self.size = size
+        self.used = used
+        self.digest = digest
+        self.future = future
+
+
+def _done() -> Future:
+    future = Future()
+    future.set_result(None)
+    return future
+
+
+def frame_digest(img) -> bytes:
+    """Hash of a frame's pixels (mode and size included)"""
+    digest = hashlib.blake2b(f"{img.mode}{img.size}".encode(), digest_size=16)
+    digest.update(img.tobytes())
+    return digest.digest()
+
+
+class ScreenshotStore:
+    def __init__(self, directory, max_files: int = 0, max_bytes: int = 0, max_age: float = 0.0,
+                 compression: int = 6, dedup: bool = True, tag: str = "", clock=time.time):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_files = max(0, int(max_files))
+        self.max_bytes = max(0, int(max_bytes))
+        self.max_age = max(0.0, float(max_age))
+        self.compression = min(9, max(0, int(compression)))
+        self.dedup = bool(dedup)
+        # Added to generated names when several processes write to one directory
+        self.tag = f"{tag}_" if tag else ""
+        self._clock = clock
+        # file name -> _Entry, least recently used first
+        self._entries = OrderedDict()
+        # frame digest -> file name
+        self._digests = {}
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(MAX_PENDING)
+        self._worker = None
+        self._sequence = itertools.count(1)
+        self.bytes = 0
+        self.written = 0
+        self.deduplicated = 0
+        self.evicted = 0
+        self.failed = 0
+        self._scan()
+
+    def _scan(self) -> None:
+        found = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.startswith(PREFIX) and not entry.name.endswith(".tmp"):
+                stat = entry.stat()
+                found.append((stat.st_mtime, entry.name, stat.st_size))
+        with self._lock:
+            for mtime, name, size in sorted(found):
+                self._entries[name] = _Entry(name, size, mtime, None, _done())
+                self.bytes += size
+            self._evict()
+
+    # --- saving ---
+
+    def save(self, img, name: str = None, wait: bool = False) -> dict:
+        """Queue ``img`` for writing and return ``{"path", "deduplicated"}`` right away
+
+        ``name`` picks the file name (its extension picks the format) and skips
+        deduplication. With ``wait`` this returns once the file is on disk.
+        Raises ValueError for a ``name`` that isn't a bare file name.
+        """
+        from PIL import Image
+
+        if name is not None and (Path(name).name != name or "\\" in name or name in (".", "..")):
+            raise ValueError(f"'{name}' must be a file name without directories")
+        if name is not None and Path(name).suffix.lower() not in Image.registered_extensions():
+            raise ValueError(f"Unknown image file extension in '{name}'")
+        digest = frame_digest(img) if self.dedup and name is None else None
+        with self._lock:
+            existing = self._entries.get(self._digests.get(digest)) if digest is not None else None
+            if existing is not None and existing.future.done() and not (self.directory / existing.name).exists():
+                # Deleted from outside; write the frame again
+                del self._entries[existing.name]
+                self._forget(existing)
+                existing = None
+            if existing is not None:
+                existing.used = self._clock()
+                self._entries.move_to_end(existing.name)
+                self.deduplicated += 1
+                entry, deduplicated = existing, True
+            else:
+                filename = name or self._new_name()
+                replaced = self._entries.pop(filename, None)
+                if replaced is not None:
+                    self._forget(replaced)
+                entry = self._entries[filename] = _Entry(filename, 0, self._clock(), digest, Future())
+                if digest is not None:
+                    self._digests[digest] = filename
+                deduplicated = False
+        if not deduplicated:
+            self._start()
+            self._queue.put((img, entry))
+        if wait:
+            entry.future.result()
+        return {"path": self.directory / entry.name, "deduplicated": deduplicated}
+
+    def _new_name(self) -> str:
+        stamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        while True:
+            name = f"{PREFIX}{stamp}_{self.tag}{next(self._sequence)}.png"
+            if name not in self._entries and not (self.directory / name).exists():
+                return name
+
+    def _forget(self, entry: _Entry) -> None:
+        self.bytes -= entry.size
+        if entry.digest is not None and self._digests.get(entry.digest) == entry.name:
+            del self._digests[entry.digest]
+
+    # --- writer thread ---
+
+    def _start(self) -> None:
+        if self._worker is None:
+            with self._lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name="screenshot-writer", daemon=True)
+                    self._worker.start()
+
+    def _run(self) -> None:
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    return
+                self._write(*job)
+            finally:
+                self._queue.task_done()
+
+    def _write(self, img, entry: _Entry) -> None:
+        from PIL import Image
+
+        path = self.directory / entry.name
+        tmp = path.with_name(path.name + ".tmp")
+        fmt = Image.registered_extensions()[path.suffix.lower()]
+        try:
+            options = {"compress_level": self.compression} if fmt == "PNG" else {}
+            img.save(tmp, format=fmt, **options)
+            os.replace(tmp, path)
+            size = path.stat().st_size
+        except Exception as e:
+            tmp.unlink(missing_ok=True)
+            with self._lock:
+                if self._entries.get(entry.name) is entry:
+                    del self._entries[entry.name]
+                    self._forget(entry)
+                self.failed += 1
+            print(f"[SCREENSHOT] Failed to write {path}: {e}")
+            entry.future.set_exception(e)
+            return
+        with self._lock:
+            if self._entries.get(entry.name) is entry:
+                entry.size = size
+                self.bytes += size
+            self.written += 1
+            self._evict()
+        entry.future.set_result(path)
+
+    # --- retention ---
+
+    def _evict(self) -> None:
+        """Delete least recently used files until every limit holds (call with the lock held)"""
+        if not (self.max_files or self.max_bytes or self.max_age):
+            return
+        now = self._clock()
+        count, size = len(self._entries), self.bytes
+        victims = []
+        for entry in self._entries.values():
+            if count <= 1:
+                break
+            if not ((self.max_files and count > self.max_files)
+                    or (self.max_bytes and size > self.max_bytes)
+                    or (self.max_age and now - entry.used > self.max_age)):
+                break
+            if not entry.future.done():
+                continue
+            victims.append(entry)
+            count -= 1
+            size -= entry.size
+        for entry in victims:
+            del self._entries[entry.name]
+            self._forget(entry)
+            (self.directory / entry.name).unlink(missing_ok=True)
+            self.evicted += 1
+
+    def flush(self) -> None:
+        """Block until every queued frame is on disk"""
+        self._queue.join()
+
+    def close(self) -> None:
+        if self._worker is not None:
+            self._queue.put(None)
+            self._worker.join()
+            self._worker = None
+
+    def stats(self) -> dict:
+        return {
+            "files": len(self._entries),
+            "bytes": self.bytes,
+            "pending": self._queue.qsize(),
+            "written": self.written,
+            "deduplicated": self.deduplicated,
+            "evicted": self.evicted,
+            "failed": self.failed,
+        }
+
+
+_shared = {}
+
+
+def shared_store(directory) -> ScreenshotStore:
+    """Unbounded store for handlers called without a server context, one per directory"""
+    key = Path(directory)
+    store = _shared.get(key)
+    if store is None:
+        store = _shared[key] = ScreenshotStore(key)
+    return store
@@ -0,0 +1,105 @@
+"""
+Per-connection state for the websocket server.
+
+By default a connection is handled strictly in order. With ``concurrent``
+enabled (via the ``configure`` action), read-only actions are spawned as
+their own tasks and may reply out of order, while input actions are drained
+one at a time from a per-connection queue so they stay serialized.
+"""
+
+import asyncio
+
+
+class Session:
+    """State for one websocket connection"""
+
+    def __init__(self, websocket, codec, on_send=None):
+        self.websocket = websocket
+        # Called with the size of every frame sent (bytes-out metric)
+        self.on_send = on_send
+        # Negotiated per connection: JSON by default, MessagePack on request
+        self.codec = codec
+        # Set once the connection authenticates (auth.Credential name and permissions)
+        self.client = None
+        self.permissions = None
+        # The token it authenticated with; worker processes reuse it for the owner link
+        self.token = None
+        # workers.OwnerLink for input forwarded to the owner process (worker mode only)
+        self.owner_link = None
+        self.concurrent = False
+        # screenshot stream id -> task pushing its frames
+        self.streams = {}
+        # request id -> threading.Event set by the "cancel" action
+        self.cancellations = {}
+        # macros.MacroRecorder between record_start and record_stop
+        self.recording = None
+        self._send_lock = asyncio.Lock()
+        self._tasks = set()
+        self._input_queue = None
+        self._input_worker = None
+
+    async def _send(self, data) -> None:
+        if self.on_send is not None:
+            self.on_send(len(data))
+        # Codecs produce bytes; JSON replies still belong in text frames
+        if isinstance(data, bytes) and not self.codec.binary:
+            await self.websocket.send(data, text=True)
+        else:
+            await self.websocket.send(data)
+
+    async def send(self, data) -> None:
+        async with self._send_lock:
+            await self._send(data)
+
+    async def send_all(self, frames) -> None:
+        """Send an encoded reply followed by its binary attachment frames"""
+        async with self._send_lock:
+            await self._send(frames[0])
+            for frame in frames[1:]:
+                if self.on_send is not None:
+                    self.on_send(len(frame))
+                await self.websocket.send(frame)
+
+    def spawn(self, coro) -> asyncio.Task:
+        """Run a coroutine as a task that is cancelled when the connection closes"""
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def start_input_worker(self, process) -> None:
+        """Start the task that feeds queued input messages to ``process`` in order"""
+        if self._input_worker is not None:
+            return
+        self._input_queue = asyncio.Queue()
+
+        async def drain():
+            while True:
+                msg = await self._input_queue.get()
+                try:
+                    await process(msg)
+                finally:
+                    self._input_queue.task_done()
+
+        self._input_worker = self.spawn(drain())
+
+    async def queue_input(self, msg: dict) -> None:
+        await self._input_queue.put(msg)
+
+    @property
+    def input_queued(self) -> int:
+        """Input messages waiting for their turn (not counting the one running)"""
+        return self._input_queue.qsize() if self._input_queue is not None else 0
+
+    async def close(self) -> None:
+        """Cancel anything still running for this connection"""
+        # Long-running handlers on the executor threads check these between steps
+        for cancel in self.cancellations.values():
+            cancel.set()
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._input_worker = None
+        if self.owner_link is not None:
+            await self.owner_link.close()
@@ -0,0 +1,83 @@
+"""
+Startup profiling for ``--profile-startup``.
+
+The server is restarted often by the launcher, so cold start matters. With
+the flag set, ``__main__`` starts a ``StartupProfile`` before its own
+imports. It times every module that is actually loaded (cached imports are
+not counted), and ``mark()`` closes named setup phases. Just before the
+server starts listening, ``report()`` prints the phases and the slowest
+imports by self time, like ``python -X importtime`` but filtered and sorted.
+"""
+
+import builtins
+import importlib.util
+import sys
+import time
+
+
+class StartupProfile:
+    def __init__(self, clock=time.perf_counter):
+        self._clock = clock
+        self.started = clock()
+        self._last_mark = self.started
+        self.phases = []
+        # module -> [cumulative seconds, self seconds]
+        self.imports = {}
+        self._stack = []
+        self._original_import = None
+
+    def start(self) -> "StartupProfile":
+        if self._original_import is None:
+            self._original_import = builtins.__import__
+            builtins.__import__ = self._import
+        return self
+
+    def stop(self) -> None:
+        if self._original_import is not None:
+            builtins.__import__ = self._original_import
+            self._original_import = None
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        original = self._original_import
+        try:
+            package = (globals or {}).get("__package__") if level else None
+            target = importlib.util.resolve_name("." * level + name, package) if level else name
+        except (ImportError, ValueError):
+            return original(name, globals, locals, fromlist, level)
+        if target.rstrip(".") in sys.modules and not fromlist:
+            return original(name, globals, locals, fromlist, level)
+        if not name and fromlist:
+            # "from . import x": the submodules are what gets loaded
+            target = ", ".join(f"{target.rstrip('.')}.{item}" for item in fromlist)
+        if all(module in sys.modules for module in target.split(", ")):
+            return original(name, globals, locals, fromlist, level)
+
+        started = self._clock()
+        self._stack.append(0.0)
+        try:
+            return original(name, globals, locals, fromlist, level)
+        finally:
+            children = self._stack.pop()
+            elapsed = self._clock() - started
+            entry = self.imports.setdefault(target, [0.0, 0.0])
+            entry[0] += elapsed
+            entry[1] += elapsed - children
+            if self._stack:
+                self._stack[-1] += elapsed
+
+    def mark(self, phase: str) -> None:
+        """Close the phase running since the previous mark (or since start)"""
+        now = self._clock()
+        self.phases.append((phase, now - self._last_mark))
+        self._last_mark = now
+
+    def report(self, top: int = 20) -> str:
+        total = self._clock() - self.started
+        lines = [f"[STARTUP] {total * 1000:.1f} ms until listening"]
+        for phase, seconds in self.phases:
+            lines.append(f"  {phase:<24}{seconds * 1000:9.1f} ms")
+        lines.append("[STARTUP] slowest imports (self / cumulative ms):")
+        slowest = sorted(self.imports.items(), key=lambda item: item[1][1], reverse=True)[:top]
+        for module, (cumulative, own) in slowest:
+            lines.append(f"  {own * 1000:9.1f} {cumulative * 1000:9.1f}  {module}")
+        return "\n".join(lines)
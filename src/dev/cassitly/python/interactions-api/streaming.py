@@ -0,0 +1,188 @@
+"""
+Screenshot streams: push changed screen tiles over the websocket at a set FPS.
+
+The first frame of a stream is a keyframe covering the whole capture. After
+that each frame is diffed against the previous one in fixed-size tiles;
+unchanged frames are skipped and changed tiles are merged into horizontal
+runs before being encoded as PNG, JPEG or raw RGB.
+"""
+
+import asyncio
+import base64
+import itertools
+
+from .capture import encode_image
+from .executor import READ
+from .schema import SchemaError, compile_schema
+
+ENCODINGS = ("png", "jpeg", "raw")
+MAX_FPS = 30.0
+MAX_STREAMS_PER_SESSION = 4
+
+_stream_ids = itertools.count(1)
+
+SCHEMA = {
+    "fps": {"type": "float", "default": 5.0, "max": MAX_FPS},
+    "encoding": {"type": "str", "default": "png", "choices": ENCODINGS},
+    "quality": {"type": "int", "default": 80, "min": 1, "max": 95},
+    "tile": {"type": "int", "default": 64, "min": 8, "max": 512},
+    # Only stream this part of the screen: [x, y, w, h]
+    "region": {"type": "list", "length": 4, "items": {"type": "int"}},
+}
+_validate = compile_schema(SCHEMA)
+
+
+def dirty_rects(previous, current, width: int, height: int, tile: int, bpp: int = 3):
+    """Return ``(x, y, w, h)`` rectangles covering every tile that differs
+
+    ``previous`` and ``current`` are packed pixel buffers of the same size.
+    Identical rows are skipped with one compare, so mostly-static screens are cheap.
+    """
+    stride = width * bpp
+    cols = (width + tile - 1) // tile
+    prev = memoryview(previous)
+    cur = memoryview(current)
+    dirty = {}
+
+    for y in range(height):
+        start = y * stride
+        if prev[start:start + stride] == cur[start:start + stride]:
+            continue
+        row_tiles = dirty.setdefault(y // tile, set())
+        if len(row_tiles) == cols:
+            continue
+        for tx in range(cols):
+            if tx in row_tiles:
+                continue
+            a = start + tx * tile * bpp
+            b = min(a + tile * bpp, start + stride)
+            if prev[a:b] != cur[a:b]:
+                row_tiles.add(tx)
+
+    rects = []
+    for ty in sorted(dirty):
+        y = ty * tile
+        h = min(tile, height - y)
+        run_start = prev_tx = None
+        for tx in sorted(dirty[ty]) + [None]:
+            if run_start is not None and tx == prev_tx + 1:
+                prev_tx = tx
+                continue
+            if run_start is not None:
+                x = run_start * tile
+                rects.append((x, y, min((prev_tx + 1) * tile, width) - x, h))
+            run_start = prev_tx = tx
+    return rects
+
+
+def encode_region(img, rect, encoding: str, quality: int = 80) -> bytes:
+    x, y, w, h = rect
+    part = img if (x, y, w, h) == (0, 0, img.width, img.height) else img.crop((x, y, x + w, y + h))
+    if encoding == "raw":
+        return part.tobytes()
+    return encode_image(part, encoding, quality)
+
+
+class ScreenshotStream:
+    """One subscription: captures, diffs and encodes frames for a session"""
+
+    def __init__(self, capture, fps=5.0, encoding="png", quality=80, tile=64, region=None, raw_bytes=False):
+        self.id = next(_stream_ids)
+        self.capture = capture
+        self.fps = fps
+        self.encoding = encoding
+        self.quality = quality
+        self.tile = tile
+        self.region = region
+        # Binary codecs (MessagePack) carry tile bytes as-is instead of base64
+        self.raw_bytes = raw_bytes
+        self.seq = 0
+        self.sent = 0
+        self._previous = None
+        self._size = None
+
+    async def next_frame(self):
+        """Capture and diff one frame; returns the frame message or ``None`` if unchanged"""
+        img = self.capture.grab(self.region)
+        current = img.tobytes()
+        size = (img.width, img.height)
+        self.seq += 1
+
+        keyframe = self._previous is None or size != self._size
+        if keyframe:
+            rects = [(0, 0, img.width, img.height)]
+        else:
+            rects = dirty_rects(self._previous, current, img.width, img.height, self.tile)
+        self._previous, self._size = current, size
+        if not rects:
+            return None
+
+        tiles = []
+        for rect in rects:
+            data = encode_region(img, rect, self.encoding, self.quality)
+            x, y, w, h = rect
+            if not self.raw_bytes:
+                data = base64.b64encode(data).decode("ascii")
+            tiles.append({"x": x, "y": y, "w": w, "h": h, "data": data})
+        return {
+            "event": "frame",
+            "stream": self.id,
+            "seq": self.seq,
+            "keyframe": keyframe,
+            "size": list(size),
+            "encoding": self.encoding,
+            "tiles": tiles,
+        }
+
+    async def run(self, session, executor):
+        loop = asyncio.get_running_loop()
+        interval = 1.0 / self.fps
+        next_at = loop.time()
+        while True:
+            try:
+                frame = await executor.run(READ, self.next_frame)
+            except Exception as e:
+                await session.send(session.codec.dumps({"event": "stream_error", "stream": self.id, "details": str(e)}))
+                return
+            if frame is not None:
+                await session.send(session.codec.dumps(frame))
+                self.sent += 1
+            next_at += interval
+            delay = next_at - loop.time()
+            if delay < 0:
+                # Fell behind (slow capture or client); don't try to catch up
+                next_at = loop.time()
+                delay = 0
+            await asyncio.sleep(delay)
+
+
+def parse_stream_options(msg: dict) -> dict:
+    """Validate screenshot_stream parameters against ``SCHEMA``, raising SchemaError"""
+    options = _validate(msg)
+    if not 0 < options["fps"]:
+        raise SchemaError("fps", f"must be between 0 and {MAX_FPS:g}")
+    region = options.get("region")
+    if region is not None:
+        if region[2] <= 0 or region[3] <= 0:
+            raise SchemaError("region", "must have a positive width and height")
+        region = tuple(region)
+    return {"fps": options["fps"], "encoding": options["encoding"], "quality": options["quality"],
+            "tile": options["tile"], "region": region}
+
+
+def start_stream(session, executor, capture, msg: dict) -> ScreenshotStream:
+    if len(session.streams) >= MAX_STREAMS_PER_SESSION:
+        raise ValueError(f"At most {MAX_STREAMS_PER_SESSION} streams per connection")
+    stream = ScreenshotStream(capture, raw_bytes=session.codec.binary, **parse_stream_options(msg))
+    task = session.spawn(stream.run(session, executor))
+    session.streams[stream.id] = task
+    task.add_done_callback(lambda _: session.streams.pop(stream.id, None))
+    return stream
+
+
+def stop_stream(session, stream_id) -> bool:
+    task = session.streams.pop(stream_id, None) if isinstance(stream_id, int) else None
+    if task is None:
+        return False
+    task.cancel()
+    return True
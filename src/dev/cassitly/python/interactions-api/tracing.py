@@ -0,0 +1,279 @@
+"""
+Sampled request tracing.
+
+``sys.settrace`` (the old ``debug.trace`` behaviour) fires on every line and
+call in the whole process. Here tracing is built from spans instead:
+
+- ``request(name)`` opens a root span per dispatched message. Only a
+  ``sample_rate`` share of requests is sampled, and unsampled requests cost
+  one ``random()`` call
+- ``wrap(func, name)`` times a handler body as a child span, also when it
+  runs on an executor thread
+- with ``functions: true``, calls into code under ``include_paths`` (minus
+  ``exclude_functions``) are recorded too, on threads where a sampled
+  request is in flight. On Python 3.12+ this uses ``sys.monitoring`` and
+  switches itself off for every other code object after its first call.
+  Older versions fall back to ``sys.setprofile``, which sees call events
+  only, never lines
+
+Finished spans go into a fixed-size ring buffer, and ``export()`` returns
+them in the Chrome trace format. Load the file in ``chrome://tracing`` or
+https://ui.perfetto.dev.
+"""
+
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from pathlib import Path
+
+# The sampled request span (if any) on the current task / executor call
+_current = ContextVar("trace_span", default=None)
+
+
+class _Span:
+    __slots__ = ("name", "category", "start", "args", "_token")
+
+    def __init__(self, name: str, category: str, start: int, args):
+        self.name = name
+        self.category = category
+        self.start = start
+        self.args = args
+
+
+class _NullContext:
+    """Returned for unsampled requests; entering it does nothing"""
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL = _NullContext()
+
+
+class _SpanContext:
+    __slots__ = ("tracer", "span")
+
+    def __init__(self, tracer, span: _Span):
+        self.tracer = tracer
+        self.span = span
+
+    def __enter__(self):
+        self.span._token = _current.set(self.span)
+        self.tracer._active.depth = getattr(self.tracer._active, "depth", 0) + 1
+        return self.span
+
+    def __exit__(self, *exc):
+        self.tracer._active.depth -= 1
+        _current.reset(self.span._token)
+        self.tracer._finish(self.span)
+        return False
+
+
+def _normalize(path: str) -> str:
+    return path.replace("\\", "/")
+
+
+class Tracer:
+    """Collects sampled spans into a ring buffer; see the module docstring"""
+
+    def __init__(self, sample_rate: float = 1.0, buffer_size: int = 10000, include_paths=(),
+                 exclude_functions=(), functions: bool = False, clock=time.perf_counter_ns, rng=random.random):
+        self.sample_rate = min(1.0, max(0.0, float(sample_rate)))
+        self.include_paths = tuple(_normalize(str(path)) for path in include_paths or ())
+        self.exclude_functions = frozenset(exclude_functions or ())
+        self.functions = bool(functions)
+        self._clock = clock
+        self._random = rng
+        # (name, category, start ns, duration ns, thread id, args); deque appends are thread-safe
+        self._events = deque(maxlen=max(1, int(buffer_size)))
+        self._active = threading.local()
+        self._included = {}
+        self._pid = os.getpid()
+        self._hooked = None
+        self.requests = 0
+        self.sampled = 0
+
+    @classmethod
+    def from_config(cls, trace_config: dict) -> "Tracer":
+        """A tracer from the ``debug.trace`` section of src/dev/config.yaml"""
+        return cls(
+            sample_rate=trace_config.get("sample_rate", 0.1),
+            buffer_size=trace_config.get("buffer_size", 10000),
+            include_paths=trace_config.get("include_paths"),
+            exclude_functions=trace_config.get("exclude_functions"),
+            functions=trace_config.get("functions", False),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0
+
+    # --- spans ---
+
+    def request(self, name: str, args=None):
+        """Root span for one request, or a no-op context when it isn't sampled"""
+        self.requests += 1
+        if not self.sample_rate or (self.sample_rate < 1 and self._random() >= self.sample_rate):
+            return _NULL
+        self.sampled += 1
+        return _SpanContext(self, _Span(name, "request", self._clock(), args))
+
+    def span(self, name: str, category: str = "server", args=None):
+        """Child span inside a sampled request; a no-op otherwise"""
+        if _current.get() is None:
+            return _NULL
+        return _SpanContext(self, _Span(name, category, self._clock(), args))
+
+    def wrap(self, func, name: str, category: str = "handler"):
+        """Wrap a coroutine function so it runs as a child span of the current request
+
+        Call it on the loop thread; the wrapper carries the request into executor threads.
+        """
+        parent = _current.get()
+        if parent is None:
+            return func
+        tracer = self
+
+        async def run(*args):
+            token = _current.set(parent)
+            try:
+                with _SpanContext(tracer, _Span(name, category, tracer._clock(), None)):
+                    return await func(*args)
+            finally:
+                _current.reset(token)
+        return run
+
+    def _finish(self, span: _Span) -> None:
+        self._events.append((span.name, span.category, span.start, self._clock() - span.start, threading.get_ident(), span.args))
+
+    # --- function-level events ---
+
+    def _include(self, code) -> bool:
+        included = self._included.get(code)
+        if included is None:
+            filename = _normalize(code.co_filename)
+            included = self._included[code] = (
+                code.co_filename != __file__
+                and code.co_name not in self.exclude_functions
+                and any(path in filename for path in self.include_paths)
+            )
+        return included
+
+    def _enter(self, code) -> None:
+        stack = getattr(self._active, "stack", None)
+        if stack is None:
+            stack = self._active.stack = []
+        stack.append((code, self._clock()))
+
+    def _leave(self, code) -> None:
+        stack = getattr(self._active, "stack", None)
+        if not stack:
+            return
+        # Calls entered before the request started have nothing to close
+        for index in range(len(stack) - 1, -1, -1):
+            if stack[index][0] is code:
+                start = stack[index][1]
+                del stack[index:]
+                self._events.append((getattr(code, "co_qualname", code.co_name), "function",
+                                     start, self._clock() - start, threading.get_ident(),
+                                     {"file": code.co_filename, "line": code.co_firstlineno}))
+                return
+
+    def install_function_hooks(self) -> None:
+        """Start recording calls into ``include_paths`` inside sampled requests"""
+        if self._hooked is not None or not self.include_paths:
+            return
+        if hasattr(sys, "monitoring"):
+            monitoring = sys.monitoring
+            tool = monitoring.PROFILER_ID
+            monitoring.use_tool_id(tool, "windows-api tracing")
+            events = monitoring.events
+
+            def on_start(code, offset):
+                if not self._include(code):
+                    # Never called again for this code object
+                    return monitoring.DISABLE
+                if getattr(self._active, "depth", 0):
+                    self._enter(code)
+
+            def on_return(code, offset, value):
+                if not self._include(code):
+                    return monitoring.DISABLE
+                if getattr(self._active, "depth", 0):
+                    self._leave(code)
+
+            def on_unwind(code, offset, exception):
+                # PY_UNWIND can't be disabled per location
+                if getattr(self._active, "depth", 0) and self._included.get(code):
+                    self._leave(code)
+
+            monitoring.register_callback(tool, events.PY_START, on_start)
+            monitoring.register_callback(tool, events.PY_RETURN, on_return)
+            monitoring.register_callback(tool, events.PY_UNWIND, on_unwind)
+            monitoring.set_events(tool, events.PY_START | events.PY_RETURN | events.PY_UNWIND)
+            self._hooked = "monitoring"
+        else:
+            def profile(frame, event, arg):
+                if event == "call":
+                    if getattr(self._active, "depth", 0) and self._include(frame.f_code):
+                        self._enter(frame.f_code)
+                elif event == "return":
+                    if getattr(self._active, "depth", 0) and self._include(frame.f_code):
+                        self._leave(frame.f_code)
+
+            sys.setprofile(profile)
+            threading.setprofile(profile)
+            self._hooked = "setprofile"
+
+    def remove_function_hooks(self) -> None:
+        if self._hooked == "monitoring":
+            monitoring = sys.monitoring
+            monitoring.set_events(monitoring.PROFILER_ID, 0)
+            monitoring.free_tool_id(monitoring.PROFILER_ID)
+        elif self._hooked == "setprofile":
+            sys.setprofile(None)
+            threading.setprofile(None)
+        self._hooked = None
+
+    # --- export ---
+
+    def export(self, clear: bool = False) -> dict:
+        """The ring buffer as a Chrome trace (``traceEvents`` with complete ``X`` events, in µs)"""
+        events = list(self._events)
+        if clear:
+            self._events.clear()
+        trace_events = []
+        for name, category, start, duration, thread, args in events:
+            event = {
+                "name": name, "cat": category, "ph": "X",
+                "ts": start / 1000, "dur": duration / 1000,
+                "pid": self._pid, "tid": thread,
+            }
+            if args:
+                event["args"] = args
+            trace_events.append(event)
+        return {"traceEvents": trace_events, "displayTimeUnit": "ms"}
+
+    def dump(self, path) -> Path:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(self.export()), encoding="utf-8")
+        return path
+
+    def stats(self) -> dict:
+        return {
+            "sample_rate": self.sample_rate,
+            "requests": self.requests,
+            "sampled": self.sampled,
+            "buffered": len(self._events),
+            "buffer_size": self._events.maxlen,
+            "function_hooks": self._hooked,
+        }
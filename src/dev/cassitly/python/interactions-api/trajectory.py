@@ -0,0 +1,133 @@
+"""
+Precomputed mouse trajectories.
+
+pyautogui's ``duration`` runs a tween loop with a Python sleep per step on
+the calling thread. Here a whole path is generated up front as a NumPy
+array at a fixed sample rate, then ``replay`` walks it with deadline-based
+``asyncio.sleep`` timing. A sample that comes due while the previous one was
+still sleeping is skipped rather than replayed late, so a move always takes
+its requested duration whatever the OS timer resolution is.
+
+Path kinds:
+
+- ``linear``: straight line, constant speed
+- ``bezier``: cubic curve through two random control points, eased in/out
+- ``human``: bezier with minimum-jerk easing plus small jitter that fades
+  out towards both ends, so the path still lands exactly on the target
+"""
+
+import asyncio
+
+import numpy as np
+
+PATH_KINDS = ("linear", "bezier", "human")
+DEFAULT_RATE = 120
+# Longest move or drag a client may ask for; a path holds duration * rate points
+MAX_DURATION = 60.0
+
+
+def _ease_in_out(t):
+    return t * t * (3 - 2 * t)
+
+
+def _minimum_jerk(t):
+    return t ** 3 * (10 - 15 * t + 6 * t * t)
+
+
+def _control_points(start, end, rng, bend: float):
+    """Two control points offset sideways from the straight line by up to ``bend`` of its length"""
+    delta = end - start
+    length = float(np.hypot(*delta))
+    normal = np.array([-delta[1], delta[0]]) / length if length else np.zeros(2)
+    offsets = rng.uniform(-bend, bend, size=2) * length
+    return (
+        start + delta * (1 / 3) + normal * offsets[0],
+        start + delta * (2 / 3) + normal * offsets[1],
+    )
+
+
+def build_path(start, end, duration: float, kind: str = "linear", rate: int = DEFAULT_RATE, seed=None) -> np.ndarray:
+    """Sample a path from ``start`` to ``end`` as an ``(n, 2)`` int array, ``rate`` points per second
+
+    The first row is the first step after ``start`` and the last row is always exactly ``end``.
+    """
+    if kind not in PATH_KINDS:
+        raise ValueError(f"Unknown path kind '{kind}' (expected one of: {', '.join(PATH_KINDS)})")
+    start = np.asarray(start, dtype=np.float64)
+    end = np.asarray(end, dtype=np.float64)
+    steps = max(1, int(round(duration * rate)))
+    t = np.linspace(0.0, 1.0, steps + 1)[1:]
+
+    if kind == "linear":
+        points = start + np.outer(t, end - start)
+    else:
+        rng = np.random.default_rng(seed)
+        c1, c2 = _control_points(start, end, rng, bend=0.2 if kind == "human" else 0.3)
+        s = (_minimum_jerk if kind == "human" else _ease_in_out)(t)[:, None]
+        u = 1 - s
+        points = u ** 3 * start + 3 * u ** 2 * s * c1 + 3 * u * s ** 2 * c2 + s ** 3 * end
+        if kind == "human":
+            # Jitter of up to ~1.5px, zero at both ends
+            envelope = np.sin(np.pi * t)[:, None]
+            points += rng.normal(0.0, 0.75, size=points.shape) * envelope
+
+    path = np.rint(points).astype(np.int64)
+    path[-1] = np.rint(end)
+    return path
+
+
+def clip_path(path: np.ndarray, bounds) -> np.ndarray:
+    """Keep every point inside ``bounds`` (a geometry.Rect), 1px off the edges"""
+    left, top, width, height = bounds
+    np.clip(path[:, 0], left + 1, left + width - 2, out=path[:, 0])
+    np.clip(path[:, 1], top + 1, top + height - 2, out=path[:, 1])
+    return path
+
+
+async def replay(path: np.ndarray, duration: float, move) -> int:
+    """Call ``move(x, y)`` for each point on schedule; returns how many points were sent
+
+    Points that fell due while sleeping are skipped (only the latest one is sent), and
+    repeats of the previous point are never sent.
+    """
+    count = len(path)
+    if count == 0:
+        return 0
+    loop = asyncio.get_running_loop()
+    interval = duration / count if duration > 0 else 0.0
+    started = loop.time()
+    sent = 0
+    last = None
+    index = 0
+    while index < count:
+        if interval:
+            now = loop.time()
+            # Point i is due at (i + 1) intervals, so the last one lands at ``duration``
+            due = int((now - started) / interval) - 1
+            if due < index:
+                await asyncio.sleep(started + (index + 1) * interval - now)
+            else:
+                # Behind schedule: jump straight to the latest due sample
+                index = min(due, count - 1)
+        x, y = int(path[index, 0]), int(path[index, 1])
+        if (x, y) != last:
+            move(x, y)
+            last = (x, y)
+            sent += 1
+        index += 1
+    return sent
+
+
+async def glide(backend, geometry, target, duration: float, kind: str = "linear", rate: int = DEFAULT_RATE, button=None) -> int:
+    """Move the pointer from where it is to ``target`` along a precomputed path
+
+    With ``button`` it is held down for the whole path (a drag). Returns the points sent.
+    """
+    path = clip_path(build_path(backend.position(), target, duration, kind, rate), geometry.layout().virtual)
+    if button:
+        backend.mouse_down(button)
+    try:
+        return await replay(path, duration, backend.move_to)
+    finally:
+        if button:
+            backend.mouse_up(button)
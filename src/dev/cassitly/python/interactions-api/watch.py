@@ -0,0 +1,88 @@
+"""
+Server-side screen watching for ``wait_for_change`` and ``wait_for_pixel``.
+
+Instead of a client polling ``screenshot`` (a round trip and a PNG on disk
+per look), the handler samples the region itself at a fixed rate and replies
+once:
+
+- ``fingerprint()`` box-filters a grab down to a tiny grayscale thumbnail.
+  Two samples are compared by the mean absolute difference of their
+  thumbnails, so a blinking caret or anti-aliasing noise can stay below the
+  threshold while a dialog appearing can't
+- ``poll()`` runs a check on a fixed schedule (no drift from the grab time)
+  until it reports something, the timeout passes, or the request is cancelled
+
+The handlers set ``ON_LOOP``: they wait on the websocket loop, and only each
+grab and compare is sent to the read pool through ``context["offload"]``. A
+long wait therefore doesn't keep a read worker from screenshots and streams.
+"""
+
+import asyncio
+import time
+
+from .schema import SchemaError
+
+# Longest side of the thumbnail compared between samples
+THUMBNAIL_SIDE = 32
+# Used when authentication.yaml has no "watch" section
+DEFAULT_INTERVAL = 0.05
+DEFAULT_MAX_TIMEOUT = 60.0
+
+
+def fingerprint(img, side: int = THUMBNAIL_SIDE) -> bytes:
+    """A grayscale thumbnail of ``img`` at most ``side`` pixels across, as raw bytes"""
+    from PIL import Image
+
+    width, height = img.size
+    scale = max(width, height) / side
+    if scale > 1:
+        img = img.resize((max(1, round(width / scale)), max(1, round(height / scale))), Image.BOX)
+    return img.convert("L").tobytes()
+
+
+def difference(a: bytes, b: bytes) -> float:
+    """Mean absolute difference of two fingerprints, from 0.0 (identical) to 1.0"""
+    if a == b:
+        return 0.0
+    if len(a) != len(b) or not a:
+        return 1.0
+    return sum(abs(x - y) for x, y in zip(a, b)) / (255 * len(a))
+
+
+def timing(msg: dict, context: dict):
+    """``(timeout, interval)`` for a request; raises SchemaError past the configured maximum timeout"""
+    options = context.get("watch_options") or {}
+    max_timeout = options.get("max_timeout", DEFAULT_MAX_TIMEOUT)
+    timeout = msg.get("timeout", 5.0)
+    if timeout > max_timeout:
+        raise SchemaError("timeout", f"must be <= {max_timeout:g}")
+    return timeout, msg.get("interval") or options.get("interval", DEFAULT_INTERVAL)
+
+
+async def sample(func, offload=None):
+    """``func()``, on the read pool when the server passed an ``offload`` (inline otherwise, e.g. in a batch)"""
+    if offload is None:
+        return func()
+    return await offload(func)
+
+
+async def poll(check, timeout: float, interval: float, cancelled=None, offload=None, clock=time.monotonic):
+    """Call ``check()`` every ``interval`` seconds until it returns something other than None
+
+    Returns ``(outcome, value, samples, elapsed)`` where outcome is ``matched``,
+    ``timeout`` or ``cancelled``. The last sample is taken at the deadline.
+    """
+    started = clock()
+    deadline = started + timeout
+    samples = 0
+    while True:
+        samples += 1
+        value = await sample(check, offload)
+        now = clock()
+        if value is not None:
+            return "matched", value, samples, now - started
+        if now >= deadline:
+            return "timeout", None, samples, now - started
+        if cancelled is not None and cancelled():
+            return "cancelled", None, samples, now - started
+        await asyncio.sleep(max(0.0, min(started + samples * interval, deadline) - now))
@@ -0,0 +1,275 @@
+"""
+Multi-process mode (``workers: N`` in authentication.yaml).
+
+One event loop shares the GIL between input dispatch and CPU-heavy reads
+(encoding screenshots, template matching, frame diffing). With ``workers``
+set, the process started by the launcher becomes the *owner*:
+
+- it keeps the only input backend and serves a websocket on a private
+  loopback port. It does not accept client connections itself
+- it starts ``N`` worker processes (``python -m`` this package) that all
+  accept on the public port. On Linux each worker binds its own socket with
+  ``SO_REUSEPORT`` and the kernel balances connections. Windows has no
+  ``SO_REUSEPORT`` and can't fork, so the owner creates the listening
+  socket and hands it to each worker with ``socket.share()``. Other systems
+  inherit the descriptor. Workers that exit are started again. Each worker's
+  stdin is a pipe the owner holds open, so a worker sees end-of-file there
+  and shuts down when the owner exits or crashes
+- a worker answers read-only actions itself. Everything else (input,
+  batches with input, leases, macros, ``cancel`` of a forwarded request)
+  goes to the owner through an ``OwnerLink``: one loopback websocket per
+  client connection, authenticated with that client's own token. The owner
+  therefore sees one connection per client, in the client's order, with
+  the same fair scheduling, leases and recording as a direct connection
+
+Forwarded requests get a link-local ``id`` so replies and progress events
+can be matched up, and are given the client's own ``id`` back before they
+are relayed.
+"""
+
+import asyncio
+import base64
+import itertools
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+# Set by the owner in each worker's environment
+WORKER_ENV = "WINDOWS_API_WORKER"
+OWNER_ENV = "WINDOWS_API_OWNER"
+LISTEN_FD_ENV = "WINDOWS_API_LISTEN_FD"
+LISTEN_SHARE_ENV = "WINDOWS_API_LISTEN_SHARE"
+# Seconds before a worker that exited is started again
+RESTART_DELAY = 1.0
+
+_NO_ID = object()
+
+
+def _unavailable(details) -> dict:
+    return {"status": "error", "error": {"message": "owner_unavailable", "details": details}}
+
+
+class OwnerLink:
+    """A worker's channel to the owner for one client connection, opened on first use"""
+
+    def __init__(self, url: str, token: str, codec, on_event):
+        self.url = url
+        self.token = token
+        self.codec = codec
+        # Called with progress (and other) events, their id already mapped back
+        self.on_event = on_event
+        # link id -> (future, client id or _NO_ID)
+        self._pending = {}
+        self._ids = itertools.count(1)
+        self._ws = None
+        self._reader = None
+        self._opening = asyncio.Lock()
+        self._attachment_for = None
+
+    async def _open(self) -> None:
+        import websockets
+
+        ws = await websockets.connect(self.url, additional_headers={"Authorization": f"Bearer {self.token}"}, max_size=None)
+        # Lets "cancel" through while a forwarded input action is still running
+        await ws.send(self.codec.dumps({"action": "configure", "concurrent": True}), text=True)
+        await ws.recv()
+        self._ws = ws
+        self._reader = asyncio.create_task(self._read(ws))
+
+    async def call(self, msg: dict) -> dict:
+        """Send ``msg`` to the owner and return its reply (without an ``id``)"""
+        try:
+            async with self._opening:
+                if self._ws is None:
+                    await self._open()
+        except Exception as e:
+            return _unavailable(str(e))
+        key = f"w{next(self._ids)}"
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = (future, msg.get("id", _NO_ID))
+        try:
+            await self._ws.send(self.codec.dumps({**msg, "id": key}), text=True)
+            return await future
+        except Exception as e:
+            return _unavailable(str(e))
+        finally:
+            self._pending.pop(key, None)
+
+    def link_id(self, client_id):
+        """The link id of a forwarded request still running, by the client's id"""
+        for key, (future, original) in self._pending.items():
+            if original is not _NO_ID and original == client_id and not future.done():
+                return key
+        return None
+
+    async def _read(self, ws) -> None:
+        try:
+            async for frame in ws:
+                if isinstance(frame, bytes):
+                    # Binary attachment following a reply with result.binary
+                    if self._attachment_for is None:
+                        continue
+                    future, reply = self._attachment_for
+                    self._attachment_for = None
+                    if not future.done():
+                        future.set_result({**reply, "attachment": frame})
+                    continue
+                message = self.codec.loads(frame)
+                entry = self._pending.get(message.pop("id", None))
+                if "event" in message:
+                    if entry is not None and entry[1] is not _NO_ID:
+                        message["id"] = entry[1]
+                    await self.on_event(message)
+                    continue
+                if entry is None:
+                    continue
+                result = message.get("result")
+                if isinstance(result, dict) and result.pop("binary", False):
+                    self._attachment_for = (entry[0], message)
+                elif not entry[0].done():
+                    entry[0].set_result(message)
+        except Exception as e:
+            reason = str(e)
+        else:
+            reason = "connection to the owner closed"
+        finally:
+            if self._ws is ws:
+                self._ws = None
+        for future, _ in list(self._pending.values()):
+            if not future.done():
+                future.set_result(_unavailable(reason))
+
+    async def close(self) -> None:
+        if self._ws is not None:
+            await self._ws.close()
+        if self._reader is not None:
+            await asyncio.gather(self._reader, return_exceptions=True)
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._pending)
+
+
+# --- worker side ---
+
+def worker_index():
+    """This process's worker number, or None for the owner / single-process mode"""
+    value = os.environ.get(WORKER_ENV)
+    return int(value) if value else None
+
+
+def worker_socket():
+    """The listening socket handed over by the owner, or None to bind with SO_REUSEPORT"""
+    fd = os.environ.get(LISTEN_FD_ENV)
+    if fd:
+        return socket.socket(fileno=int(fd))
+    if os.environ.get(LISTEN_SHARE_ENV):
+        # socket.share() data for this pid, written to stdin by the owner (Windows)
+        return socket.fromshare(base64.b64decode(sys.stdin.readline()))
+    return None
+
+
+def watch_owner(on_gone) -> None:
+    """Call ``on_gone()`` on the running loop once stdin, the owner's pipe, reaches end-of-file"""
+    loop = asyncio.get_running_loop()
+
+    def wait():
+        try:
+            while sys.stdin.read(4096):
+                pass
+        except (OSError, ValueError):
+            pass
+        try:
+            loop.call_soon_threadsafe(on_gone)
+        except RuntimeError:
+            # The loop already closed (worker shut down first)
+            pass
+
+    threading.Thread(target=wait, name="owner-watch", daemon=True).start()
+
+
+# --- owner side ---
+
+def reuse_port_supported() -> bool:
+    # Only Linux balances connections across SO_REUSEPORT listeners
+    return sys.platform.startswith("linux") and hasattr(socket, "SO_REUSEPORT")
+
+
+class WorkerPool:
+    """Starts, restarts and stops the worker processes"""
+
+    def __init__(self, count: int, package: str, owner_url: str, host: str, port: int):
+        self.count = count
+        self.package = package
+        self.owner_url = owner_url
+        self.host = host
+        self.port = port
+        self.processes = [None] * count
+        self.restarts = 0
+        self._socket = None
+        self._stopping = False
+        self._watcher = None
+
+    def start(self) -> None:
+        if not reuse_port_supported():
+            self._socket = socket.create_server((self.host, self.port), backlog=128)
+        for index in range(self.count):
+            self._spawn(index)
+        self._watcher = asyncio.ensure_future(self._watch())
+
+    def _spawn(self, index: int) -> None:
+        env = {**os.environ, WORKER_ENV: str(index + 1), OWNER_ENV: self.owner_url}
+        # Kept open while the owner lives; the worker exits on end-of-file (watch_owner)
+        options = {"stdin": subprocess.PIPE}
+        if self._socket is not None and sys.platform == "win32":
+            env[LISTEN_SHARE_ENV] = "1"
+        elif self._socket is not None:
+            env[LISTEN_FD_ENV] = str(self._socket.fileno())
+            options["pass_fds"] = (self._socket.fileno(),)
+        process = subprocess.Popen([sys.executable, "-m", self.package], env=env, **options)
+        if env.get(LISTEN_SHARE_ENV):
+            process.stdin.write(base64.b64encode(self._socket.share(process.pid)) + b"\n")
+            process.stdin.flush()
+        self.processes[index] = (process, time.monotonic())
+
+    async def _watch(self) -> None:
+        while not self._stopping:
+            await asyncio.sleep(RESTART_DELAY)
+            for index, (process, _) in enumerate(self.processes):
+                if process.poll() is not None and not self._stopping:
+                    print(f"[WORKERS] worker {index + 1} (pid {process.pid}) exited with code {process.returncode}, restarting")
+                    self.restarts += 1
+                    process.stdin.close()
+                    self._spawn(index)
+
+    async def stop(self, timeout: float = 5.0) -> None:
+        self._stopping = True
+        if self._watcher is not None:
+            self._watcher.cancel()
+        for process, _ in self.processes:
+            if process is not None and process.poll() is None:
+                process.terminate()
+        deadline = time.monotonic() + timeout
+        for process, _ in self.processes:
+            while process is not None and process.poll() is None and time.monotonic() < deadline:
+                await asyncio.sleep(0.05)
+            if process is not None and process.poll() is None:
+                process.kill()
+            if process is not None:
+                process.stdin.close()
+        if self._socket is not None:
+            self._socket.close()
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            "mode": "reuse_port" if self._socket is None else "shared_socket",
+            "restarts": self.restarts,
+            "workers": [
+                {"pid": process.pid, "alive": process.poll() is None, "uptime_seconds": round(now - started, 1)}
+                for process, started in self.processes if process is not None
+            ],
+        }
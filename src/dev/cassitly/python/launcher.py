@@ -1,17 +1,227 @@
 # src/cassitly/python/launcher.py
+"""
+Starts every package in src/resources/packages.yaml and keeps it running.
+
+- all children are spawned at once. A child with a ``health`` URL is ready
+  once a websocket ping to it gets a pong, and its startup time is printed
+- modules are only located (``find_spec``), never imported in this process,
+  so nothing pays the import cost twice
+- a child that exits with a non-zero code, or misses ``HEALTH_FAILURES``
+  checks in a row, is restarted after an exponential backoff taken from
+  ``get_retry_config()`` (``connection.retry`` in src/dev/config.yaml). A
+  child that stayed up for ``max_delay`` seconds starts over at the first
+  delay. A clean exit (code 0) is final, unless the launcher itself stopped
+  the child
+- Ctrl+C terminates every child and waits for it
+
+packages.yaml entries are either a module name or a mapping::
+
+    gui-controller:
+      module: "src.dev.cassitly.python.interactions-api"
+      health: "ws://127.0.0.1:8766"
+      startup_timeout: 30
+"""
 import sys
-import subprocess
+import asyncio
+import signal
+import time
 import yaml
 from pathlib import Path
-import importlib
+import importlib.util
 import traceback
 import os
 
+from src.dev.utils.config_loader import get_config_loader
+
+PROJECT_ROOT = Path(__file__).resolve().parents[4]
+# Seconds between health checks of a running child
+HEALTH_INTERVAL = 5.0
+# Consecutive failed checks before a running child is restarted
+HEALTH_FAILURES = 3
+STARTUP_TIMEOUT = 30.0
+# Grace period between terminate() and kill()
+STOP_TIMEOUT = 5.0
+
 def load_package_map(path=Path("src/resources/packages.yaml")):
     with open(path, "r") as f:
         data = yaml.safe_load(f)
     return data.get("packages", {}).get("python", {})
 
+class Child:
+    """One supervised package"""
+
+    def __init__(self, name: str, spec):
+        if isinstance(spec, str):
+            spec = {"module": spec}
+        self.name = name
+        self.module = spec["module"]
+        self.health = spec.get("health")
+        self.startup_timeout = float(spec.get("startup_timeout", STARTUP_TIMEOUT))
+        self.process = None
+        self.restarts = 0
+        # Milliseconds from spawn to ready, one entry per successful start
+        self.startup_times = []
+        # Set once the first start has succeeded or failed
+        self.settled = asyncio.Event()
+        self.state = "starting"
+        # Set when the supervisor stopped the current process (unhealthy or slow to start)
+        self.stopped_by_supervisor = False
+
+def backoff_delay(retry: dict, attempt: int) -> float:
+    """Seconds to wait before restart number ``attempt`` (1-based)"""
+    delay = float(retry.get("initial_delay", 5)) * float(retry.get("backoff_multiplier", 1.5)) ** (attempt - 1)
+    return min(delay, float(retry.get("max_delay", 60)))
+
+async def websocket_ping(url: str, timeout: float = 2.0) -> bool:
+    """Whether a websocket server at ``url`` accepts a connection and answers a ping"""
+    import websockets
+
+    try:
+        async with websockets.connect(url, open_timeout=timeout, close_timeout=1) as ws:
+            pong = await ws.ping()
+            await asyncio.wait_for(pong, timeout)
+        return True
+    except (OSError, asyncio.TimeoutError, websockets.exceptions.WebSocketException):
+        return False
+
+async def healthy(child: Child) -> bool:
+    if child.process is None or child.process.returncode is not None:
+        return False
+    if not child.health:
+        return True
+    return await websocket_ping(child.health)
+
+async def wait_ready(child: Child, started: float) -> str:
+    """``ready``, ``exited`` or ``timeout`` for a freshly spawned child"""
+    while True:
+        if child.process.returncode is not None:
+            return "exited"
+        if await healthy(child):
+            return "ready"
+        if time.perf_counter() - started > child.startup_timeout:
+            return "timeout"
+        await asyncio.sleep(0.1)
+
+async def stop(child: Child) -> None:
+    process = child.process
+    if process is None or process.returncode is not None:
+        return
+    try:
+        process.terminate()
+        await asyncio.wait_for(process.wait(), STOP_TIMEOUT)
+    except ProcessLookupError:
+        pass
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+
+async def monitor(child: Child) -> int:
+    """Wait for the child to exit, restarting it (by stopping it) when health checks keep failing"""
+    exited = asyncio.ensure_future(child.process.wait())
+    failures = 0
+    while True:
+        done, _ = await asyncio.wait({exited}, timeout=HEALTH_INTERVAL)
+        if done:
+            return exited.result()
+        if await healthy(child):
+            failures = 0
+            continue
+        failures += 1
+        if failures >= HEALTH_FAILURES:
+            print(f"[LAUNCHER] {child.name} failed {failures} health checks, restarting")
+            child.stopped_by_supervisor = True
+            await stop(child)
+
+async def supervise(child: Child, env: dict, retry: dict, stopping: asyncio.Event) -> None:
+    attempt = 0
+    max_attempts = int(retry.get("max_attempts", 10))
+    while not stopping.is_set():
+        started = time.perf_counter()
+        child.stopped_by_supervisor = False
+        try:
+            child.process = await asyncio.create_subprocess_exec(sys.executable, "-m", child.module, env=env)
+        except OSError as e:
+            print(f"[LAUNCH ERROR] Could not start {child.module}: {e}")
+            child.state = "failed"
+            child.settled.set()
+            return
+
+        state = await wait_ready(child, started)
+        if state == "ready":
+            elapsed = (time.perf_counter() - started) * 1000
+            child.startup_times.append(elapsed)
+            child.state = "running"
+            child.settled.set()
+            print(f"[LAUNCHER] {child.name} ready in {elapsed:.0f} ms (pid {child.process.pid})")
+            code = await monitor(child)
+        else:
+            if state == "timeout":
+                print(f"[LAUNCHER] {child.name} not healthy after {child.startup_timeout:g}s")
+                child.stopped_by_supervisor = True
+                await stop(child)
+            code = await child.process.wait()
+        if stopping.is_set():
+            child.settled.set()
+            return
+        # A server stopped by us usually exits cleanly on SIGTERM; that still needs a restart
+        if code == 0 and not child.stopped_by_supervisor:
+            print(f"{child.name} exited with code 0")
+            child.state = "exited"
+            child.settled.set()
+            return
+
+        # A child that came up and ran for a while failed on its own; start the backoff over
+        if state == "ready" and time.perf_counter() - started >= float(retry.get("max_delay", 60)):
+            attempt = 0
+        attempt += 1
+        if attempt > max_attempts:
+            print(f"[LAUNCHER] {child.name} exited with code {code}; giving up after {max_attempts} restarts")
+            child.state = "failed"
+            child.settled.set()
+            return
+        delay = backoff_delay(retry, attempt)
+        print(f"[LAUNCHER] {child.name} exited with code {code}; restart {attempt}/{max_attempts} in {delay:.1f}s")
+        child.state = "restarting"
+        child.settled.set()
+        child.restarts += 1
+        try:
+            await asyncio.wait_for(stopping.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+
+async def report_startup(children, started: float) -> None:
+    await asyncio.gather(*(child.settled.wait() for child in children))
+    print(f"[LAUNCHER] startup finished in {(time.perf_counter() - started) * 1000:.0f} ms")
+    for child in children:
+        took = f"{child.startup_times[0]:.0f} ms" if child.startup_times else "-"
+        print(f"  {child.name:<24}{child.state:<12}{took}")
+
+async def run(children, env: dict, retry: dict) -> None:
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+
+    def request_stop(signum, frame):
+        print("\n[LAUNCHER] Stopping children...")
+        loop.call_soon_threadsafe(stopping.set)
+
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+
+    started = time.perf_counter()
+    supervisors = [asyncio.create_task(supervise(child, env, retry, stopping)) for child in children]
+    reporter = asyncio.create_task(report_startup(children, started))
+    stop_requested = asyncio.create_task(stopping.wait())
+    await asyncio.wait([stop_requested, asyncio.gather(*supervisors)], return_when=asyncio.FIRST_COMPLETED)
+
+    stopping.set()
+    stop_requested.cancel()
+    await asyncio.gather(*(stop(child) for child in children))
+    await asyncio.gather(*supervisors)
+    reporter.cancel()
+    for child in children:
+        if child.process is not None:
+            print(f"{child.name} exited with code {child.process.returncode} ({child.restarts} restarts)")
+
 def main():
     package_map = load_package_map()
     if not package_map:
@@ -19,32 +229,27 @@ def main():
         sys.exit(1)
 
     env = dict(os.environ)
-    # Ensure src/ is on PYTHONPATH
-    env["PYTHONPATH"] = str(Path(__file__).resolve().parents[3]) + os.pathsep + env.get("PYTHONPATH", "")
+    # Ensure the project root is on PYTHONPATH (modules are named src.…)
+    env["PYTHONPATH"] = str(PROJECT_ROOT) + os.pathsep + env.get("PYTHONPATH", "")
 
-    processes = []
-    for name, module in package_map.items():
-        print(f"Starting {name} -> {module}")
+    children = []
+    for name, spec in package_map.items():
+        child = Child(name, spec)
+        print(f"Starting {name} -> {child.module}")
         try:
-            # Try to import to validate
-            importlib.import_module(module)
-        except Exception as e:
-            print(f"[IMPORT ERROR] Could not import {module}: {e}")
+            # Locate only; importing here would run the module's top level a second time
+            found = importlib.util.find_spec(child.module)
+        except (ImportError, ValueError) as e:
+            print(f"[IMPORT ERROR] Could not locate {child.module}: {e}")
             print(traceback.format_exc())
             continue
+        if found is None:
+            print(f"[IMPORT ERROR] No module named {child.module}")
+            continue
+        children.append(child)
 
-        try:
-            cmd = [sys.executable, "-m", module]
-            proc = subprocess.Popen([sys.executable, "-m", module], env=env)
-            processes.append((name, proc))
-        except Exception as e:
-            print(f"[LAUNCH ERROR] Could not start {module}: {e}")
-            print(traceback.format_exc())
-
-    # Wait for all to finish
-    for name, proc in processes:
-        proc.wait()
-        print(f"{name} exited with code {proc.returncode}")
+    if children:
+        asyncio.run(run(children, env, get_config_loader().get_retry_config()))
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,6 +1,11 @@
 """
 Configuration loader utility for debug and trace settings
 Loads config.yaml and applies settings across all modules
+
+debug.trace.mode selects how tracing works:
+- "spans" (default): sampled per-action spans recorded by the interactions-api
+  (see interactions-api/tracing.py); no process-wide hook is installed here
+- "settrace": the legacy sys.settrace tracer, which slows every Python call
 """
 
 import yaml
@@ -40,6 +45,7 @@ class ConfigLoader:
                 "enabled": True,
                 "trace": {
                     "enabled": False,
+                    "mode": "spans",
                     "verbose": False
                 }
             }
@@ -60,6 +66,10 @@ class ConfigLoader:
         """Get trace configuration"""
         return self.config.get("debug", {}).get("trace", {})
     
+    def get_trace_mode(self) -> str:
+        """Get the trace mode ("spans" or "settrace")"""
+        return self.get_trace_config().get("mode", "spans")
+    
     def get_logging_config(self) -> Dict[str, Any]:
         """Get logging configuration"""
         return self.config.get("debug", {}).get("logging", {})
@@ -103,9 +113,9 @@ class ConfigLoader:
         logging.getLogger().setLevel(level)
     
     def apply_trace_config(self, trace_func):
-        """Apply trace configuration to the trace function"""
-        if not self.is_trace_enabled():
-            # Disable tracing
+        """Apply trace configuration to the trace function (only in "settrace" mode)"""
+        if not self.is_trace_enabled() or self.get_trace_mode() != "settrace":
+            # Disabled, or handled by the span tracer without a global hook
             sys.settrace(None)
             return
         
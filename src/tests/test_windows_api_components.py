@@ -11,6 +11,7 @@ import tempfile
 import os
 from unittest.mock import Mock, AsyncMock, patch, MagicMock
 from pathlib import Path
+import importlib
 import sys
 
 # Add the project to the path for imports
@@ -19,83 +20,88 @@ sys.path.insert(0, str(project_root / "src" / "dev" / "cassitly" / "python"))
 
 # Import handlers
 from interactions_api.handlers import click, move, keydown, keyup, hotkey, dragto, dragrel
+from interactions_api.backends import RecordingBackend
+from interactions_api.geometry import ScreenGeometry, query_layout
+
+
+def recording_context(**extra):
+    """Handler context backed by the headless recording input backend"""
+    backend = RecordingBackend()
+    return {"backend": backend, "geometry": ScreenGeometry(query=lambda: query_layout(backend)), **extra}
 
 class TestClickHandler:
     """Test click handler functionality"""
     
     @pytest.mark.asyncio
-    @patch('interactions_api.handlers.click.pyautogui')
-    async def test_click_with_coordinates(self, mock_pyautogui):
+    async def test_click_with_coordinates(self):
         """Test clicking at specific coordinates"""
         msg = {"x": 100, "y": 200, "button": "left"}
-        context = {}
+        context = recording_context()
         
         result = await click.handle(msg, context)
         
-        mock_pyautogui.moveTo.assert_called_once_with(100, 200)
-        mock_pyautogui.click.assert_called_once_with(button="left")
+        assert context["backend"].calls() == [
+            ("move_to", {"x": 100, "y": 200, "duration": 0.0}),
+            ("click", {"button": "left"}),
+        ]
         
         assert result["status"] == "ok"
         assert result["result"]["clicked"] == [100, 200]
         assert result["result"]["button"] == "left"
     
     @pytest.mark.asyncio
-    @patch('interactions_api.handlers.click.pyautogui')
-    async def test_click_without_coordinates(self, mock_pyautogui):
+    async def test_click_without_coordinates(self):
         """Test clicking without coordinates"""
         msg = {"button": "right"}
-        context = {}
+        context = recording_context()
         
         result = await click.handle(msg, context)
         
-        mock_pyautogui.moveTo.assert_not_called()
-        mock_pyautogui.click.assert_called_once_with(button="right")
+        assert context["backend"].calls() == [("click", {"button": "right"})]
         
         assert result["status"] == "ok"
         assert result["result"]["button"] == "right"
     
     @pytest.mark.asyncio
-    @patch('interactions_api.handlers.click.pyautogui')
-    async def test_click_default_button(self, mock_pyautogui):
+    async def test_click_default_button(self):
         """Test clicking with default button"""
         msg = {"x": 50, "y": 75}
-        context = {}
+        context = recording_context()
         
         result = await click.handle(msg, context)
         
-        mock_pyautogui.moveTo.assert_called_once_with(50, 75)
-        mock_pyautogui.click.assert_called_once_with(button="left")
+        assert context["backend"].calls() == [
+            ("move_to", {"x": 50, "y": 75, "duration": 0.0}),
+            ("click", {"button": "left"}),
+        ]
         
         assert result["status"] == "ok"
         assert result["result"]["button"] == "left"
     
     @pytest.mark.asyncio
-    @patch('interactions_api.handlers.click.pyautogui')
-    async def test_click_invalid_coordinates(self, mock_pyautogui):
+    async def test_click_invalid_coordinates(self):
         """Test clicking with invalid coordinates"""
         msg = {"x": "invalid", "y": 100, "button": "left"}
-        context = {}
+        context = recording_context()
         
         result = await click.handle(msg, context)
         
         # Should not call moveTo with invalid coordinates
-        mock_pyautogui.moveTo.assert_not_called()
-        mock_pyautogui.click.assert_called_once_with(button="left")
+        assert context["backend"].calls() == [("click", {"button": "left"})]
 
 
 class TestMoveHandler:
     """Test move handler functionality"""
     
     @pytest.mark.asyncio
-    @patch('interactions_api.handlers.move.pyautogui')
-    async def test_move_to_coordinates(self, mock_pyautogui):
+    async def test_move_to_coordinates(self):
         """Test moving to specific coordinates"""
         msg = {"x": 300, "y": 400}
-        context = {}
+        context = recording_context()
         
         result = await move.handle(msg, context)
         
-        mock_pyautogui.moveTo.assert_called_once_with(300, 400)
+        assert context["backend"].calls() == [("move_to", {"x": 300, "y": 400, "duration": 0.0})]
         
         assert result["status"] == "ok"
         assert result["result"]["moved_to"] == [300, 400]
@@ -104,7 +110,7 @@ class TestMoveHandler:
     async def test_move_missing_coordinates(self):
         """Test move with missing coordinates"""
         msg = {"x": 100}  # Missing y coordinate
-        context = {}
+        context = recording_context()
         
         with pytest.raises(Exception):
             await move.handle(msg, context)
@@ -114,86 +120,98 @@ class TestKeyHandlers:
     """Test keyboard input handlers"""
     
     @pytest.mark.asyncio
-    @patch('interactions_api.handlers.keydown.pyautogui')
-    async def test_keydown(self, mock_pyautogui):
+    async def test_keydown(self):
         """Test key down action"""
         msg = {"key": "ctrl"}
-        context = {}
+        context = recording_context()
         
         result = await keydown.handle(msg, context)
         
-        mock_pyautogui.keyDown.assert_called_once_with("ctrl")
+        assert context["backend"].calls() == [("key_down", {"key": "ctrl"})]
         assert result["status"] == "ok"
-        assert result["result"]["key_down"] == "ctrl"
+        assert result["result"]["keydown"] == "ctrl"
     
     @pytest.mark.asyncio
-    @patch('interactions_api.handlers.keyup.pyautogui')
-    async def test_keyup(self, mock_pyautogui):
+    async def test_keyup(self):
         """Test key up action"""
         msg = {"key": "shift"}
-        context = {}
+        context = recording_context()
         
         result = await keyup.handle(msg, context)
         
-        mock_pyautogui.keyUp.assert_called_once_with("shift")
+        assert context["backend"].calls() == [("key_up", {"key": "shift"})]
         assert result["status"] == "ok"
-        assert result["result"]["key_up"] == "shift"
+        assert result["result"]["keyup"] == "shift"
     
     @pytest.mark.asyncio
-    @patch('interactions_api.handlers.hotkey.pyautogui')
-    async def test_hotkey_single_key(self, mock_pyautogui):
+    async def test_hotkey_single_key(self):
         """Test hotkey with single key"""
         msg = {"keys": ["enter"]}
-        context = {}
+        context = recording_context()
         
         result = await hotkey.handle(msg, context)
         
-        mock_pyautogui.hotkey.assert_called_once_with("enter")
+        assert context["backend"].calls() == [("hotkey", {"keys": ["enter"]})]
         assert result["status"] == "ok"
-        assert result["result"]["hotkey"] == ["enter"]
+        assert result["result"]["message"] == "Pressed hotkey: enter"
     
     @pytest.mark.asyncio
-    @patch('interactions_api.handlers.hotkey.pyautogui')
-    async def test_hotkey_multiple_keys(self, mock_pyautogui):
+    async def test_hotkey_multiple_keys(self):
         """Test hotkey with multiple keys"""
         msg = {"keys": ["ctrl", "c"]}
-        context = {}
+        context = recording_context()
         
         result = await hotkey.handle(msg, context)
         
-        mock_pyautogui.hotkey.assert_called_once_with("ctrl", "c")
+        assert context["backend"].calls() == [("hotkey", {"keys": ["ctrl", "c"]})]
         assert result["status"] == "ok"
-        assert result["result"]["hotkey"] == ["ctrl", "c"]
+        assert result["result"]["message"] == "Pressed hotkey: ctrl+c"
 
 
 class TestDragHandlers:
     """Test drag operation handlers"""
     
     @pytest.mark.asyncio
-    @patch('interactions_api.handlers.dragto.pyautogui')
-    async def test_dragto(self, mock_pyautogui):
+    async def test_dragto(self):
         """Test drag to absolute coordinates"""
-        msg = {"x": 500, "y": 600, "duration": 1.0}
-        context = {}
+        msg = {"x": 500, "y": 600, "duration": 0.1}
+        context = recording_context()
         
         result = await dragto.handle(msg, context)
         
-        mock_pyautogui.dragTo.assert_called_once_with(500, 600, duration=1.0)
+        calls = context["backend"].calls()
+        assert calls[0] == ("mouse_down", {"button": "left"})
+        assert calls[-2] == ("move_to", {"x": 500, "y": 600, "duration": 0.0})
+        assert calls[-1] == ("mouse_up", {"button": "left"})
         assert result["status"] == "ok"
         assert result["result"]["dragged_to"] == [500, 600]
     
     @pytest.mark.asyncio
-    @patch('interactions_api.handlers.dragrel.pyautogui')
-    async def test_dragrel(self, mock_pyautogui):
+    async def test_dragrel(self):
         """Test drag by relative coordinates"""
-        msg = {"dx": 100, "dy": -50, "duration": 0.5}
-        context = {}
+        msg = {"x": 100, "y": -50}
+        context = recording_context()
         
         result = await dragrel.handle(msg, context)
         
-        mock_pyautogui.drag.assert_called_once_with(100, -50, duration=0.5)
+        assert context["backend"].calls() == [("drag_rel", {"dx": 100, "dy": -50, "duration": 0.0, "button": "left"})]
         assert result["status"] == "ok"
-        assert result["result"]["dragged_by"] == [100, -50]
+        assert result["result"]["dragged_rel"] == [100, -50]
+    
+    @pytest.mark.asyncio
+    async def test_dragrel_with_duration_glides(self):
+        """With a duration the drag follows a precomputed path to the offset"""
+        msg = {"x": 100, "y": 50, "duration": 0.1}
+        context = recording_context()
+        context["backend"].move_to(200, 300)
+        
+        result = await dragrel.handle(msg, context)
+        
+        calls = context["backend"].calls()
+        assert calls[1] == ("mouse_down", {"button": "left"})
+        assert calls[-2] == ("move_to", {"x": 300, "y": 350, "duration": 0.0})
+        assert calls[-1] == ("mouse_up", {"button": "left"})
+        assert result["result"]["dragged_rel"] == [100, 50]
 
 
 class TestConfigurationLoading:
@@ -413,6 +431,7 @@ class TestWebSocketServer:
         from interactions_api.__main__ import handler
         
         mock_websocket = AsyncMock()
+        mock_websocket.request = None  # no handshake headers
         mock_websocket.__aiter__.return_value = ['{"token": "test", "action": "click"}']
         
         with patch('interactions_api.__main__.handle_message') as mock_handle:
@@ -437,6 +456,7 @@ class TestWebSocketServer:
         from interactions_api.__main__ import handler
         
         mock_websocket = AsyncMock()
+        mock_websocket.request = None  # no handshake headers
         mock_websocket.__aiter__.return_value = ['invalid json']
         
         # Run handler for one iteration
@@ -457,6 +477,1979 @@ class TestWebSocketServer:
         assert "invalid_json" in response["error"]["message"]
 
 
+class TestActionExecutor:
+    """Test the managed handler executor"""
+    
+    @pytest.mark.asyncio
+    async def test_input_lane_preserves_order(self):
+        """Input actions run one at a time, in submission order"""
+        from interactions_api.executor import ActionExecutor, INPUT
+        
+        executor = ActionExecutor()
+        order = []
+        
+        async def action(n):
+            order.append(n)
+            return n
+        
+        results = await asyncio.gather(*(executor.run(INPUT, action, n) for n in range(10)))
+        executor.shutdown()
+        
+        assert results == list(range(10))
+        assert order == list(range(10))
+    
+    @pytest.mark.asyncio
+    async def test_read_lane_does_not_wait_for_input(self):
+        """A slow input action does not block the read-only pool"""
+        from interactions_api.executor import ActionExecutor, INPUT, READ
+        import time
+        
+        executor = ActionExecutor(read_workers=2)
+        
+        async def slow():
+            time.sleep(0.3)
+            return "slow"
+        
+        async def fast():
+            return "fast"
+        
+        slow_task = asyncio.create_task(executor.run(INPUT, slow))
+        await asyncio.sleep(0.05)
+        assert await asyncio.wait_for(executor.run(READ, fast), timeout=0.2) == "fast"
+        assert await slow_task == "slow"
+        executor.shutdown()
+    
+    @pytest.mark.asyncio
+    async def test_stats_report_queue_depth(self):
+        """Stats count completed and failed jobs per lane"""
+        from interactions_api.executor import ActionExecutor, INPUT
+        
+        executor = ActionExecutor()
+        
+        async def boom():
+            raise ValueError("boom")
+        
+        with pytest.raises(ValueError):
+            await executor.run(INPUT, boom)
+        stats = executor.stats()
+        executor.shutdown()
+        
+        assert stats["input"]["failed"] == 1
+        assert stats["input"]["pending"] == 0
+        assert stats["input"]["max_pending"] == 1
+        assert stats["read"]["workers"] == 4
+
+
+class TestBatchAction:
+    """Test the batch action"""
+    
+    @pytest.mark.asyncio
+    async def test_batch_runs_actions_in_order(self):
+        """Sub-actions run in order and come back as one result array"""
+        from interactions_api.__main__ import handle_message
+        
+        calls = []
+        
+        async def record(msg, context):
+            calls.append(msg["action"])
+            return {"status": "ok", "result": {"action": msg["action"]}}
+        
+        msg = {
+            "token": "test-token",
+            "action": "batch",
+            "actions": [{"action": "move", "x": 1, "y": 2}, {"action": "click"}, {"action": "press", "key": "a"}]
+        }
+        
+        with patch('interactions_api.__main__.AUTH_TOKEN', "test-token"):
+            with patch('interactions_api.__main__.handlers', {"move": record, "click": record, "press": record}):
+                result = await handle_message(msg)
+        
+        response = json.loads(result)
+        assert response["status"] == "ok"
+        assert calls == ["move", "click", "press"]
+        assert [r["result"]["action"] for r in response["result"]["results"]] == calls
+        assert response["result"]["completed"] == 3
+    
+    @pytest.mark.asyncio
+    async def test_batch_stops_on_error_by_default(self):
+        """The first failing sub-action ends the batch"""
+        from interactions_api.__main__ import handle_message
+        
+        msg = {
+            "token": "test-token",
+            "action": "batch",
+            "actions": [{"action": "click"}, {"action": "missing"}, {"action": "click"}]
+        }
+        
+        with patch('interactions_api.__main__.AUTH_TOKEN', "test-token"):
+            with patch('interactions_api.__main__.handlers', {"click": AsyncMock(return_value={"status": "ok"})}):
+                result = await handle_message(msg)
+        
+        response = json.loads(result)
+        assert len(response["result"]["results"]) == 2
+        assert response["result"]["results"][1]["error"]["message"] == "unsupported_action"
+        assert response["result"]["stopped_early"] is True
+    
+    @pytest.mark.asyncio
+    async def test_batch_continue_on_error(self):
+        """stop_on_error: false keeps going after a failure"""
+        from interactions_api.__main__ import handle_message
+        
+        msg = {
+            "token": "test-token",
+            "action": "batch",
+            "options": {"stop_on_error": False},
+            "actions": [{"action": "click"}, {"action": "missing"}, {"action": "click"}]
+        }
+        
+        with patch('interactions_api.__main__.AUTH_TOKEN', "test-token"):
+            with patch('interactions_api.__main__.handlers', {"click": AsyncMock(return_value={"status": "ok"})}):
+                result = await handle_message(msg)
+        
+        response = json.loads(result)
+        assert len(response["result"]["results"]) == 3
+        assert response["result"]["failed"] == 1
+        assert response["result"]["stopped_early"] is False
+    
+    @pytest.mark.asyncio
+    async def test_batch_requires_actions(self):
+        """A batch without an actions list is rejected"""
+        from interactions_api.__main__ import handle_message
+        
+        with patch('interactions_api.__main__.AUTH_TOKEN', "test-token"):
+            result = await handle_message({"token": "test-token", "action": "batch"})
+        
+        response = json.loads(result)
+        assert response["status"] == "error"
+        assert response["error"]["message"] == "invalid_params"
+
+    
+    @pytest.mark.asyncio
+    async def test_batch_rejects_waits(self):
+        """Waits run on the server loop, so a batch can't carry them"""
+        from interactions_api.__main__ import handle_message
+        
+        msg = {"token": "test-token", "action": "batch", "actions": [
+            {"action": "size"},
+            {"action": "wait_for_pixel", "x": 0, "y": 0, "color": [0, 0, 0], "timeout": 0},
+        ]}
+        with patch('interactions_api.__main__.AUTH_TOKEN', "test-token"):
+            response = json.loads(await handle_message(msg))
+        
+        assert response["status"] == "error"
+        assert response["error"]["message"] == "invalid_params"
+        assert response["error"]["details"]["field"] == "actions"
+
+
+class TestRequestIds:
+    """Test request ids and per-connection concurrent dispatch"""
+    
+    @pytest.mark.asyncio
+    async def test_response_echoes_id(self):
+        """The request id is copied onto the response"""
+        from interactions_api.__main__ import handle_message
+        
+        msg = {"token": "test-token", "action": "click", "id": "req-7"}
+        
+        with patch('interactions_api.__main__.AUTH_TOKEN', "test-token"):
+            with patch('interactions_api.__main__.handlers', {"click": AsyncMock(return_value={"status": "ok"})}):
+                result = await handle_message(msg)
+        
+        response = json.loads(result)
+        assert response["status"] == "ok"
+        assert response["id"] == "req-7"
+    
+    @pytest.mark.asyncio
+    async def test_concurrent_mode_replies_out_of_order(self):
+        """A slow read-only action does not hold back a queued input action"""
+        from interactions_api.__main__ import handler
+        import time
+        
+        async def slow_screenshot(msg, context):
+            time.sleep(0.3)
+            return {"status": "ok", "result": {}}
+        
+        class FakeWebSocket:
+            def __init__(self, messages):
+                self.messages = messages
+                self.sent = []
+                self.done = asyncio.Event()
+            
+            async def send(self, data, text=None):
+                self.sent.append(json.loads(data))
+                if len(self.sent) == len(self.messages):
+                    self.done.set()
+            
+            async def __aiter__(self):
+                for message in self.messages:
+                    yield json.dumps(message)
+                await self.done.wait()
+        
+        websocket = FakeWebSocket([
+            {"token": "t", "action": "configure", "concurrent": True, "id": 1},
+            {"token": "t", "action": "screenshot", "id": 2},
+            {"token": "t", "action": "press", "key": "a", "id": 3},
+        ])
+        
+        with patch('interactions_api.__main__.AUTH_TOKEN', "t"):
+            with patch('interactions_api.__main__.handlers', {"screenshot": slow_screenshot, "press": AsyncMock(return_value={"status": "ok"})}):
+                with patch('interactions_api.__main__.read_only_actions', {"screenshot"}):
+                    await asyncio.wait_for(handler(websocket), timeout=2)
+        
+        assert [response["id"] for response in websocket.sent] == [1, 3, 2]
+
+
+class TestScreenshotStream:
+    """Test screenshot streaming and frame diffing"""
+    
+    def test_dirty_rects_unchanged(self):
+        """Identical frames produce no dirty tiles"""
+        from interactions_api.streaming import dirty_rects
+        
+        frame = bytes(64 * 32 * 3)
+        assert dirty_rects(frame, frame, 64, 32, 16) == []
+    
+    def test_dirty_rects_merges_adjacent_tiles(self):
+        """Changed tiles on the same row are merged into one rectangle"""
+        from interactions_api.streaming import dirty_rects
+        
+        width, height = 64, 32
+        previous = bytearray(width * height * 3)
+        current = bytearray(previous)
+        # Touch pixels in tiles (0, 0), (1, 0) and (3, 1)
+        for x, y in [(2, 2), (20, 5), (60, 30)]:
+            current[(y * width + x) * 3] = 255
+        
+        rects = dirty_rects(bytes(previous), bytes(current), width, height, 16)
+        
+        assert rects == [(0, 0, 32, 16), (48, 16, 16, 16)]
+    
+    @pytest.mark.asyncio
+    async def test_stream_sends_keyframe_then_tiles(self):
+        """The first frame is a full keyframe, later ones only carry changed tiles"""
+        from interactions_api.streaming import ScreenshotStream
+        from interactions_api.capture import FakeCapture
+        
+        stream = ScreenshotStream(FakeCapture(width=128, height=64, block=8), encoding="raw", tile=16)
+        
+        first = await stream.next_frame()
+        second = await stream.next_frame()
+        
+        assert first["keyframe"] is True
+        assert first["tiles"][0]["w"] == 128 and first["tiles"][0]["h"] == 64
+        assert second["keyframe"] is False
+        assert 0 < len(second["tiles"]) < 8
+        assert all(tile["h"] == 16 for tile in second["tiles"])
+    
+    @pytest.mark.asyncio
+    async def test_stream_options_rejected(self):
+        """Out of range stream options are rejected"""
+        from interactions_api.streaming import parse_stream_options
+        
+        with pytest.raises(ValueError):
+            parse_stream_options({"fps": 500})
+        with pytest.raises(ValueError):
+            parse_stream_options({"encoding": "gif"})
+        for region in ([None, 0, 10, 10], [0, 0, 0, 10], [0, 0, 10, -5], [0, 0, 10]):
+            with pytest.raises(ValueError):
+                parse_stream_options({"region": region})
+        assert parse_stream_options({"fps": "10", "region": [0, 0, 10, 20]})["region"] == (0, 0, 10, 20)
+    
+    @pytest.mark.asyncio
+    async def test_bad_stream_region_is_an_error_reply(self):
+        """A malformed region gets invalid_params on the connection instead of closing it"""
+        from interactions_api.__main__ import handle_message
+        from interactions_api.codec import StdlibJsonCodec
+        from interactions_api.session import Session
+        
+        session = Session(AsyncMock(), StdlibJsonCodec())
+        with patch('interactions_api.__main__.AUTH_TOKEN', "t"):
+            reply = json.loads(await handle_message({"action": "screenshot_stream", "region": [None, 0, 10, 10], "token": "t"}, session))
+        
+        assert reply["error"] == {"message": "invalid_params", "details": {"field": "region[]", "reason": "must be an integer"}}
+        assert not session.streams
+
+
+class TestInlineScreenshot:
+    """Test in-memory screenshot returns"""
+    
+    @pytest.mark.asyncio
+    async def test_inline_returns_attachment(self, tmp_path):
+        """Inline mode encodes in memory and never touches the screenshot directory"""
+        from interactions_api.handlers import screenshot
+        from interactions_api.capture import FakeCapture
+        
+        context = {"capture": FakeCapture(width=200, height=100), "screenshot_dir": tmp_path}
+        result = await screenshot.handle({"return": "inline", "format": "jpeg", "scale": 0.5}, context)
+        
+        assert result["status"] == "ok"
+        assert result["attachment"][:2] == b"\xff\xd8"
+        assert result["result"]["bytes"] == len(result["attachment"])
+        assert list(tmp_path.iterdir()) == []
+    
+    @pytest.mark.asyncio
+    async def test_handle_message_falls_back_to_base64(self):
+        """Without a websocket session the attachment is inlined as base64"""
+        from interactions_api.__main__ import handle_message
+        import base64
+        
+        handler = AsyncMock(return_value={"status": "ok", "result": {"bytes": 3}, "attachment": b"abc"})
+        
+        with patch('interactions_api.__main__.AUTH_TOKEN', "test-token"):
+            with patch('interactions_api.__main__.handlers', {"screenshot": handler}):
+                result = await handle_message({"token": "test-token", "action": "screenshot", "return": "inline"})
+        
+        response = json.loads(result)
+        assert base64.b64decode(response["result"]["data"]) == b"abc"
+    
+    @pytest.mark.asyncio
+    async def test_binary_attachment_for_sessions(self):
+        """A connected client gets the JSON reply followed by a binary frame"""
+        from interactions_api.__main__ import handle_message
+        from interactions_api.codec import StdlibJsonCodec
+        from interactions_api.session import Session
+        
+        handler = AsyncMock(return_value={"status": "ok", "result": {}, "attachment": b"abc"})
+        session = Session(Mock(), StdlibJsonCodec())
+        
+        with patch('interactions_api.__main__.AUTH_TOKEN', "test-token"):
+            with patch('interactions_api.__main__.handlers', {"screenshot": handler}):
+                header, frame = await handle_message({"token": "test-token", "action": "screenshot"}, session=session)
+        
+        assert json.loads(header)["result"]["binary"] is True
+        assert frame == b"abc"
+    
+    @pytest.mark.asyncio
+    async def test_oversized_attachment_rejected(self):
+        """Attachments above the per-action limit become payload_too_large"""
+        from interactions_api.__main__ import handle_message
+        
+        handler = AsyncMock(return_value={"status": "ok", "result": {}, "attachment": b"x" * 64})
+        
+        with patch('interactions_api.__main__.AUTH_TOKEN', "test-token"):
+            with patch('interactions_api.__main__.handlers', {"screenshot": handler}):
+                with patch('interactions_api.__main__.ACTION_PAYLOAD_LIMITS', {"screenshot": 16}):
+                    result = await handle_message({"token": "test-token", "action": "screenshot"})
+        
+        assert json.loads(result)["error"]["message"] == "payload_too_large"
+
+
+class TestScreenGeometry:
+    """Test the cached screen geometry service"""
+    
+    def test_layout_is_cached_until_invalidated(self):
+        """The OS is only queried again after invalidate() or the TTL"""
+        from interactions_api.geometry import ScreenGeometry, Layout, Rect
+        
+        screen = Rect(0, 0, 1920, 1080)
+        query = Mock(return_value=Layout(screen, [screen]))
+        geometry = ScreenGeometry(ttl=60, query=query)
+        
+        geometry.clamp(10, 10)
+        geometry.clamp(20, 20)
+        assert query.call_count == 1
+        
+        geometry.invalidate()
+        geometry.clamp(30, 30)
+        assert query.call_count == 2
+    
+    def test_clamp_avoids_edges(self):
+        """Points are kept one pixel inside the screen"""
+        from interactions_api.geometry import ScreenGeometry, Layout, Rect
+        
+        screen = Rect(0, 0, 1920, 1080)
+        geometry = ScreenGeometry(query=lambda: Layout(screen, [screen]))
+        
+        assert geometry.clamp(0, 0) == (1, 1)
+        assert geometry.clamp(5000, 5000) == (1918, 1078)
+        assert geometry.clamp(100, 200) == (100, 200)
+    
+    def test_clamp_multi_monitor(self):
+        """Negative coordinates on a secondary monitor are kept; gaps snap to the nearest monitor"""
+        from interactions_api.geometry import ScreenGeometry, Layout, Rect
+        
+        primary = Rect(0, 0, 1920, 1080)
+        left = Rect(-1280, 0, 1280, 720)
+        geometry = ScreenGeometry(query=lambda: Layout(Rect(-1280, 0, 3200, 1080), [primary, left]))
+        
+        assert geometry.clamp(-600, 300) == (-600, 300)
+        # Below the shorter left monitor: snaps up onto it
+        assert geometry.clamp(-600, 1000) == (-600, 718)
+    
+    @pytest.mark.asyncio
+    async def test_move_uses_context_geometry(self):
+        """Handlers clamp with the geometry from the context"""
+        from interactions_api.geometry import ScreenGeometry, Layout, Rect
+        
+        screen = Rect(0, 0, 800, 600)
+        context = recording_context(geometry=ScreenGeometry(query=lambda: Layout(screen, [screen])))
+        
+        result = await move.handle({"x": 5000, "y": 100}, context)
+        
+        assert result["result"]["moved_to"] == [798, 100]
+        assert context["backend"].calls() == [("move_to", {"x": 798, "y": 100, "duration": 0.0})]
+
+
+class TestSchemaValidation:
+    """Test compiled handler parameter schemas"""
+    
+    def test_coerces_and_fills_defaults(self):
+        """Values are coerced and defaults filled in"""
+        from interactions_api.schema import compile_schema
+        
+        validate = compile_schema({
+            "x": {"type": "int", "required": True},
+            "duration": {"type": "float", "default": 0.0, "min": 0},
+        })
+        
+        assert validate({"x": "12", "token": "t"}) == {"x": 12, "duration": 0.0, "token": "t"}
+    
+    def test_reports_field_and_reason(self):
+        """Bad values raise SchemaError naming the field"""
+        from interactions_api.schema import compile_schema, SchemaError
+        
+        validate = compile_schema({"keys": {"type": "list", "required": True, "items": {"type": "str"}}})
+        
+        with pytest.raises(SchemaError) as info:
+            validate({"keys": [["nested"]]})
+        assert info.value.details() == {"field": "keys[]", "reason": "must be a string"}
+        
+        with pytest.raises(SchemaError) as info:
+            validate({})
+        assert info.value.details() == {"field": "keys", "reason": "is required"}
+    
+    def test_type_interval_is_capped(self):
+        """A huge keystroke interval would hold the input lane for hours"""
+        from interactions_api.handlers import type as type_handler
+        from interactions_api.schema import compile_schema, SchemaError
+        
+        validate = compile_schema(type_handler.SCHEMA)
+        assert validate({"text": "a", "interval": 1})["interval"] == 1.0
+        with pytest.raises(SchemaError) as info:
+            validate({"text": "a", "interval": 3600})
+        assert info.value.details()["field"] == "interval"
+    
+    @pytest.mark.asyncio
+    async def test_dispatcher_rejects_bad_params(self):
+        """A non-numeric duration is rejected before the handler runs"""
+        from interactions_api.__main__ import handle_message
+        
+        from interactions_api.schema import compile_schema
+        
+        handler = AsyncMock(return_value={"status": "ok"})
+        msg = {"token": "test-token", "action": "move", "x": 1, "y": 2, "duration": "slow"}
+        
+        with patch('interactions_api.__main__.AUTH_TOKEN', "test-token"):
+            with patch('interactions_api.__main__.handlers', {"move": handler}):
+                with patch('interactions_api.__main__.validators', {"move": compile_schema(move.SCHEMA)}):
+                    result = await handle_message(msg)
+        
+        response = json.loads(result)
+        handler.assert_not_called()
+        assert response["error"]["message"] == "invalid_params"
+        assert response["error"]["details"] == {"field": "duration", "reason": "must be a number"}
+
+
+class TestCodecs:
+    """Test the pluggable message codecs"""
+    
+    def test_json_codecs_round_trip(self):
+        """Every JSON codec writes bytes that decode back to the same object"""
+        from interactions_api import codec
+        
+        payload = {"status": "ok", "result": {"moved_to": [1, 2], "name": "snap"}}
+        codecs = [codec.StdlibJsonCodec(), codec.json_codec()]
+        
+        for c in codecs:
+            data = c.dumps(payload)
+            assert isinstance(data, bytes)
+            assert c.loads(data) == payload
+            assert json.loads(data) == payload
+    
+    def test_json_codec_rejects_bad_input(self):
+        """Decode failures are reported through decode_errors"""
+        from interactions_api.codec import json_codec
+        
+        c = json_codec()
+        with pytest.raises(c.decode_errors):
+            c.loads("{ invalid_json")
+    
+    def test_msgpack_keeps_raw_bytes(self):
+        """MessagePack carries binary payloads without base64"""
+        from interactions_api.codec import msgpack_codec
+        
+        c = msgpack_codec()
+        if c is None:
+            pytest.skip("msgspec/msgpack not installed")
+        
+        payload = {"result": {"data": b"\x89PNG"}}
+        assert c.binary is True
+        assert c.loads(c.dumps(payload)) == payload
+    
+    @pytest.mark.asyncio
+    async def test_msgpack_session_inlines_attachment(self):
+        """Attachments ride inside the MessagePack reply instead of a second frame"""
+        from interactions_api.__main__ import handle_message
+        from interactions_api.codec import msgpack_codec
+        from interactions_api.session import Session
+        
+        c = msgpack_codec()
+        if c is None:
+            pytest.skip("msgspec/msgpack not installed")
+        
+        handler = AsyncMock(return_value={"status": "ok", "result": {}, "attachment": b"abc"})
+        
+        with patch('interactions_api.__main__.AUTH_TOKEN', "test-token"):
+            with patch('interactions_api.__main__.handlers', {"screenshot": handler}):
+                reply = await handle_message({"token": "test-token", "action": "screenshot"}, session=Session(Mock(), c))
+        
+        assert c.loads(reply)["result"]["data"] == b"abc"
+
+
+class TestInputBackends:
+    """Test the pluggable input backends"""
+    
+    def test_recording_backend_timestamps_events(self):
+        """Every call is recorded in order with a perf_counter timestamp"""
+        backend = RecordingBackend(width=800, height=600)
+        
+        backend.move_to(10, 20)
+        backend.click(button="right")
+        backend.write("hi")
+        
+        assert [event.name for event in backend.events] == ["move_to", "click", "write"]
+        times = [event.time for event in backend.events]
+        assert times == sorted(times)
+        assert backend.position() == (10, 20)
+        assert backend.size() == (800, 600)
+        assert backend.stats()["by_name"] == {"move_to": 1, "click": 1, "write": 1}
+    
+    def test_recording_backend_captures_headless(self):
+        """Screenshots come from the fake capture at the backend's screen size"""
+        backend = RecordingBackend(width=320, height=200)
+        
+        assert backend.screenshot().size == (320, 200)
+        assert backend.screenshot((0, 0, 50, 40)).size == (50, 40)
+    
+    def test_geometry_follows_backend(self):
+        """Monitor bounds come from a non-desktop backend instead of the OS"""
+        backend = RecordingBackend(width=1024, height=768)
+        
+        layout = query_layout(backend)
+        
+        assert layout.primary.width == 1024
+        assert layout.primary.height == 768
+    
+    def test_unknown_backend(self):
+        """Unknown backend names fail loudly at startup"""
+        from interactions_api.backends import get_input_backend
+        
+        with pytest.raises(ValueError):
+            get_input_backend("nope")
+
+
+class TestPacing:
+    """Test the async settle delay between input actions"""
+    
+    @pytest.mark.asyncio
+    async def test_next_action_waits_out_settle_time(self):
+        """The second action starts only after the first one's delay"""
+        from interactions_api.pacing import Pacer
+        
+        pacer = Pacer(default_delay=0.05)
+        started = []
+        
+        async def record(msg, context):
+            started.append(asyncio.get_running_loop().time())
+            return {"status": "ok"}
+        
+        await pacer.pace(record, {}, {})
+        await pacer.pace(record, {}, {})
+        
+        assert started[1] - started[0] >= 0.04
+        assert pacer.waits == 1
+    
+    @pytest.mark.asyncio
+    async def test_zero_delay_runs_at_full_speed(self):
+        """delay: 0 on a message skips the settle window"""
+        from interactions_api.pacing import Pacer
+        
+        pacer = Pacer(default_delay=5.0)
+        handler = AsyncMock(return_value={"status": "ok"})
+        
+        await pacer.pace(handler, {"delay": 0}, {})
+        await asyncio.wait_for(pacer.pace(handler, {"delay": 0}, {}), timeout=1)
+        
+        assert pacer.waits == 0
+    
+    @pytest.mark.asyncio
+    async def test_batch_delay_spaces_steps(self):
+        """options.delay is the gap between batch steps"""
+        from interactions_api.__main__ import handle_message
+        from interactions_api.pacing import Pacer
+        
+        started = []
+        
+        async def record(msg, context):
+            started.append(asyncio.get_running_loop().time())
+            return {"status": "ok"}
+        
+        msg = {
+            "token": "test-token",
+            "action": "batch",
+            "options": {"delay": 0.05},
+            "actions": [{"action": "press", "key": "a"}, {"action": "press", "key": "b"}],
+        }
+        
+        with patch('interactions_api.__main__.AUTH_TOKEN', "test-token"):
+            with patch('interactions_api.__main__.handlers', {"press": record}):
+                with patch('interactions_api.__main__.pacer', Pacer()):
+                    response = json.loads(await handle_message(msg))
+        
+        assert response["result"]["completed"] == 2
+        assert started[1] - started[0] >= 0.04
+    
+    @pytest.mark.asyncio
+    async def test_invalid_delay_rejected(self):
+        """delay is validated like any other parameter"""
+        from interactions_api.__main__ import handle_message
+        from interactions_api.handlers import press
+        from interactions_api.pacing import PACING_SCHEMA
+        from interactions_api.schema import compile_schema
+        
+        validators = {"press": compile_schema({**PACING_SCHEMA, **press.SCHEMA})}
+        with patch('interactions_api.__main__.AUTH_TOKEN', "test-token"):
+            with patch('interactions_api.__main__.validators', validators):
+                response = json.loads(await handle_message({"token": "test-token", "action": "press", "key": "a", "delay": -1}))
+                batch = json.loads(await handle_message({
+                    "token": "test-token", "action": "batch", "options": {"delay": "soon"}, "actions": [{"action": "press", "key": "a"}],
+                }))
+        
+        assert response["error"]["message"] == "invalid_params"
+        assert response["error"]["details"]["field"] == "delay"
+        assert batch["error"]["details"]["field"] == "options.delay"
+
+
+class TestBulkType:
+    """Test the bulk unicode/paste type modes"""
+    
+    @pytest.mark.asyncio
+    async def test_unicode_mode_chunks_and_reports_progress(self):
+        """Text is injected in chunks, with a progress callback per chunk"""
+        from interactions_api.handlers import type as type_handler
+        
+        text = "Grüße, 世界! 🎉"
+        updates = []
+        context = recording_context(progress=updates.append)
+        
+        result = await type_handler.handle({"text": text, "mode": "unicode", "chunk_size": 5}, context)
+        
+        calls = context["backend"].calls()
+        assert {name for name, _ in calls} == {"write_unicode"}
+        assert "".join(params["text"] for _, params in calls) == text
+        assert result["result"] == {"typed_chars": len(text), "mode": "unicode", "chunks": 3}
+        assert updates[-1] == {"typed_chars": len(text), "total_chars": len(text)}
+        assert len(updates) == 3
+    
+    @pytest.mark.asyncio
+    async def test_paste_mode(self):
+        """Paste mode goes through the backend's clipboard path"""
+        from interactions_api.handlers import type as type_handler
+        
+        context = recording_context()
+        
+        await type_handler.handle({"text": "hello", "mode": "paste", "chunk_delay": 0}, context)
+        
+        assert context["backend"].calls() == [("paste", {"text": "hello"})]
+    
+    @pytest.mark.asyncio
+    async def test_cancel_stops_between_chunks(self):
+        """A cancelled request stops before its next chunk"""
+        from interactions_api.handlers import type as type_handler
+        
+        context = recording_context()
+        context["cancelled"] = lambda: len(context["backend"].events) >= 2
+        
+        result = await type_handler.handle({"text": "abcdefgh", "mode": "unicode", "chunk_size": 2}, context)
+        
+        assert result["error"]["message"] == "cancelled"
+        assert result["error"]["details"] == {"typed_chars": 4, "total_chars": 8}
+    
+    @pytest.mark.asyncio
+    async def test_cancel_action(self):
+        """cancel sets the running request's flag, or reports an unknown id"""
+        from interactions_api.__main__ import handle_message
+        from interactions_api.codec import StdlibJsonCodec
+        from interactions_api.session import Session
+        import threading
+        
+        session = Session(Mock(), StdlibJsonCodec())
+        running = threading.Event()
+        session.cancellations["job-1"] = running
+        
+        with patch('interactions_api.__main__.AUTH_TOKEN', "t"):
+            ok = json.loads(await handle_message({"token": "t", "action": "cancel", "target": "job-1"}, session))
+            missing = json.loads(await handle_message({"token": "t", "action": "cancel", "target": "job-2"}, session))
+        
+        assert ok["result"] == {"cancelled": "job-1"}
+        assert running.is_set()
+        assert missing["error"]["message"] == "invalid_params"
+    
+    @pytest.mark.asyncio
+    async def test_progress_events_stream_before_reply(self):
+        """Requests with an id and progress: true get progress events, then the reply"""
+        from interactions_api.__main__ import handle_message
+        from interactions_api.codec import StdlibJsonCodec
+        from interactions_api.handlers import type as type_handler
+        from interactions_api.session import Session
+        
+        websocket = Mock()
+        websocket.send = AsyncMock()
+        session = Session(websocket, StdlibJsonCodec())
+        msg = {"token": "t", "action": "type", "id": 9, "text": "x" * 10, "mode": "unicode", "chunk_size": 4, "progress": True}
+        
+        with patch('interactions_api.__main__.AUTH_TOKEN', "t"):
+            with patch('interactions_api.__main__.handlers', {"type": type_handler.handle}):
+                with patch('interactions_api.__main__.context', recording_context()):
+                    reply = json.loads(await handle_message(msg, session))
+        await asyncio.sleep(0.05)
+        
+        events = [json.loads(call.args[0]) for call in websocket.send.call_args_list]
+        assert [event["typed_chars"] for event in events] == [4, 8, 10]
+        assert all(event["event"] == "progress" and event["id"] == 9 for event in events)
+        assert reply["result"]["typed_chars"] == 10
+        assert session.cancellations == {}
+
+
+class TestTrajectories:
+    """Test precomputed mouse paths and their replay"""
+    
+    def test_paths_end_on_target(self):
+        """Every path kind has duration * rate points and lands exactly on the target"""
+        from interactions_api.trajectory import PATH_KINDS, build_path
+        
+        for kind in PATH_KINDS:
+            path = build_path((0, 0), (300, 200), duration=0.5, kind=kind, rate=100, seed=1)
+            assert path.shape == (50, 2)
+            assert tuple(path[-1]) == (300, 200)
+    
+    def test_duration_is_bounded(self):
+        """Huge or infinite durations are rejected before any path is allocated"""
+        from interactions_api.schema import SchemaError, compile_schema
+        from interactions_api.trajectory import MAX_DURATION
+        
+        for module in (move, dragto, dragrel):
+            validate = compile_schema(module.SCHEMA)
+            assert validate({"x": 1, "y": 2, "duration": MAX_DURATION})["duration"] == MAX_DURATION
+            for duration in (MAX_DURATION + 1, 1e12, "inf"):
+                with pytest.raises(SchemaError) as rejected:
+                    validate({"x": 1, "y": 2, "duration": duration})
+                assert rejected.value.field == "duration"
+    
+    def test_linear_path_is_straight(self):
+        """Linear samples are evenly spaced along the line"""
+        from interactions_api.trajectory import build_path
+        
+        path = build_path((0, 0), (100, 0), duration=0.1, rate=100)
+        
+        assert [tuple(point) for point in path] == [(x, 0) for x in range(10, 101, 10)]
+    
+    def test_clip_path(self):
+        """Bezier overshoot is pulled back inside the screen"""
+        from interactions_api.geometry import Rect
+        from interactions_api.trajectory import build_path, clip_path
+        
+        path = clip_path(build_path((0, 0), (0, 1000), 1.0, kind="bezier", seed=3), Rect(0, 0, 800, 1080))
+        
+        assert path[:, 0].min() >= 1 and path[:, 0].max() <= 798
+    
+    @pytest.mark.asyncio
+    async def test_replay_keeps_duration_and_skips_late_points(self):
+        """A slow move call makes replay drop points instead of running long"""
+        from interactions_api.trajectory import build_path, replay
+        import time
+        
+        moves = []
+        
+        def slow_move(x, y):
+            moves.append((x, y))
+            time.sleep(0.02)
+        
+        path = build_path((0, 0), (500, 0), duration=0.2, rate=200)
+        started = time.perf_counter()
+        sent = await replay(path, 0.2, slow_move)
+        elapsed = time.perf_counter() - started
+        
+        assert moves[-1] == (500, 0)
+        assert sent < len(path)
+        assert elapsed < 0.35
+    
+    @pytest.mark.asyncio
+    async def test_move_with_duration_glides(self):
+        """move with a duration replays a path on the backend"""
+        context = recording_context()
+        
+        result = await move.handle({"x": 200, "y": 100, "duration": 0.05, "path": "human", "rate": 200}, context)
+        
+        calls = context["backend"].calls()
+        assert len(calls) > 1
+        assert calls[-1] == ("move_to", {"x": 200, "y": 100, "duration": 0.0})
+        assert result["result"]["moved_to"] == [200, 100]
+
+
+class TestMacros:
+    """Test the binary macro log, the store and record/replay"""
+    
+    def test_binary_log_round_trip(self):
+        """Every supported value type survives encoding, strings are shared"""
+        from interactions_api.macros import Macro, encode_events
+        
+        events = [
+            (0.0, {"action": "move", "x": -120, "y": 40, "duration": 0.25}),
+            (0.5, {"action": "type", "text": "Grüße 世界", "mode": "unicode", "progress": False}),
+            (1.25, {"action": "hotkey", "keys": ["ctrl", "shift", "t"], "delay": None, "big": 2**40}),
+        ]
+        
+        data = encode_events(events, 1.5)
+        macro = Macro("demo", data)
+        
+        assert list(macro.events()) == events
+        assert macro.info() == {"name": "demo", "events": 3, "duration": 1.5, "bytes": len(data)}
+    
+    def test_binary_log_is_compact(self):
+        """Repeated actions cost a few bytes per field, well under their JSON"""
+        from interactions_api.macros import encode_events
+        
+        events = [(i * 0.01, {"action": "click", "x": 100 + i, "y": 200, "button": "left"}) for i in range(100)]
+        
+        assert len(encode_events(events, 1.0)) * 2 < len(json.dumps(events))
+    
+    def test_store_indexes_and_maps_by_name(self, tmp_path):
+        """Saved macros are found by name, also from a fresh store"""
+        from interactions_api.macros import MacroError, MacroStore, encode_events
+        
+        store = MacroStore(tmp_path)
+        store.save("login", encode_events([(0.0, {"action": "press", "key": "enter"})], 0.1))
+        store.close()
+        
+        reopened = MacroStore(tmp_path)
+        assert reopened.names() == ["login"]
+        assert list(reopened.get("login").events()) == [(0.0, {"action": "press", "key": "enter"})]
+        with pytest.raises(MacroError):
+            reopened.get("../etc/passwd")
+        reopened.close()
+    
+    @pytest.mark.asyncio
+    async def test_damaged_files_are_reported(self, tmp_path):
+        """Truncated or corrupt macros give an error reply instead of dropping the connection"""
+        from interactions_api.__main__ import handle_message
+        from interactions_api.macros import MacroError, MacroStore, encode_events
+        
+        data = encode_events([(0.0, {"action": "press", "key": "enter"}), (0.1, {"action": "type", "text": "héllo"})], 0.2)
+        (tmp_path / "good.wamacro").write_bytes(data)
+        (tmp_path / "cut.wamacro").write_bytes(data[:-3])
+        (tmp_path / "garbled.wamacro").write_bytes(data.replace("héllo".encode(), b"h\xff\xfello"))
+        store = MacroStore(tmp_path)
+        
+        with pytest.raises(MacroError):
+            store.get("garbled")
+        with pytest.raises(MacroError):
+            list(store.get("cut").events())
+        
+        with patch('interactions_api.__main__.AUTH_TOKEN', "t"):
+            with patch('interactions_api.__main__.macro_store', store):
+                listed = json.loads(await handle_message({"action": "macros", "token": "t"}))
+                replayed = json.loads(await handle_message({"action": "replay", "name": "cut", "token": "t"}))
+        store.close()
+        
+        macros = {entry["name"]: entry for entry in listed["result"]["macros"]}
+        assert macros["good"]["events"] == 2 and "error" not in macros["good"]
+        assert "corrupt" in macros["garbled"]["error"]
+        assert replayed["error"]["message"] == "invalid_params"
+    
+    @pytest.mark.asyncio
+    async def test_record_and_replay(self, tmp_path):
+        """Input actions dispatched while recording are replayed server-side"""
+        from interactions_api.__main__ import handle_message
+        from interactions_api.codec import StdlibJsonCodec
+        from interactions_api.handlers import click, press
+        from interactions_api.macros import MacroStore
+        from interactions_api.session import Session
+        
+        session = Session(Mock(), StdlibJsonCodec())
+        context = recording_context()
+        backend = context["backend"]
+        
+        async def send(msg):
+            return json.loads(await handle_message({"token": "t", **msg}, session))
+        
+        with patch('interactions_api.__main__.AUTH_TOKEN', "t"):
+            with patch('interactions_api.__main__.handlers', {"click": click.handle, "press": press.handle, "size": AsyncMock(return_value={"status": "ok"})}):
+                with patch('interactions_api.__main__.read_only_actions', {"size"}):
+                    with patch('interactions_api.__main__.context', context):
+                        with patch('interactions_api.__main__.macro_store', MacroStore(tmp_path)):
+                            assert (await send({"action": "record_start", "name": "flow"}))["status"] == "ok"
+                            await send({"action": "click", "x": 10, "y": 20, "id": 1})
+                            await send({"action": "size"})
+                            await send({"action": "batch", "actions": [{"action": "press", "key": "a"}, {"action": "press", "key": "b"}]})
+                            saved = await send({"action": "record_stop"})
+                            recorded = backend.calls()
+                            backend.clear()
+                            
+                            replayed = await send({"action": "replay", "name": "flow", "speed": 0})
+                            missing = await send({"action": "replay", "name": "nope"})
+        
+        assert saved["result"]["events"] == 3
+        assert replayed["result"]["completed"] == 3
+        assert backend.calls() == recorded
+        assert missing["error"]["message"] == "invalid_params"
+
+
+class TestConnectionAuth:
+    """Test the once-per-connection handshake and session permissions"""
+    
+    @pytest.mark.asyncio
+    async def test_first_valid_token_authenticates_session(self):
+        """After one valid token, messages don't need to carry it"""
+        from interactions_api.__main__ import handle_message
+        from interactions_api.codec import StdlibJsonCodec
+        from interactions_api.session import Session
+        
+        session = Session(Mock(), StdlibJsonCodec())
+        handler = AsyncMock(return_value={"status": "ok"})
+        
+        with patch('interactions_api.__main__.AUTH_TOKEN', "secret"):
+            with patch('interactions_api.__main__.handlers', {"click": handler}):
+                before = json.loads(await handle_message({"action": "click"}, session))
+                wrong = json.loads(await handle_message({"action": "auth", "token": "nope"}, session))
+                hello = json.loads(await handle_message({"action": "auth", "token": "secret"}, session))
+                after = json.loads(await handle_message({"action": "click"}, session))
+        
+        assert before["error"]["message"] == "unauthorized"
+        assert wrong["error"]["message"] == "unauthorized"
+        assert hello["result"] == {"client": "default", "permissions": ["admin", "input", "read"]}
+        assert after["status"] == "ok"
+    
+    @pytest.mark.asyncio
+    async def test_limited_token_permissions(self):
+        """A read-only token can take screenshots but not send input"""
+        from interactions_api.__main__ import handle_message
+        from interactions_api.auth import parse_tokens
+        
+        viewer = parse_tokens([{"name": "viewer", "token": "look", "permissions": ["read"]}])
+        handler = AsyncMock(return_value={"status": "ok"})
+        
+        with patch('interactions_api.__main__.EXTRA_CREDENTIALS', viewer):
+            with patch('interactions_api.__main__.handlers', {"click": handler, "size": handler}):
+                with patch('interactions_api.__main__.read_only_actions', {"size"}):
+                    size = json.loads(await handle_message({"action": "size", "token": "look"}))
+                    click = json.loads(await handle_message({"action": "click", "token": "look"}))
+        
+        assert size["status"] == "ok"
+        assert click["error"]["message"] == "forbidden"
+    
+    def test_parse_tokens_rejects_unknown_permissions(self):
+        """Typos in the permissions list fail at startup"""
+        from interactions_api.auth import parse_tokens
+        
+        with pytest.raises(ValueError):
+            parse_tokens([{"token": "x", "permissions": ["raed"]}])
+    
+    def test_header_token(self):
+        """Bearer and X-Auth-Token headers are both accepted"""
+        from interactions_api.auth import header_token
+        
+        assert header_token({"Authorization": "Bearer abc"}) == "abc"
+        assert header_token({"X-Auth-Token": "xyz"}) == "xyz"
+        assert header_token({"Authorization": "Basic abc"}) is None
+    
+    @pytest.mark.asyncio
+    async def test_bad_header_token_closes_connection(self):
+        """A wrong handshake header is refused before any message is read"""
+        from interactions_api.__main__ import handler
+        
+        websocket = AsyncMock()
+        websocket.request = Mock(headers={"Authorization": "Bearer wrong"})
+        
+        with patch('interactions_api.__main__.AUTH_TOKEN', "secret"):
+            await handler(websocket)
+        
+        websocket.close.assert_awaited_once_with(code=1008, reason="unauthorized")
+
+
+class TestInputScheduler:
+    """Test fair ordering, leases and rate limits for input from several connections"""
+    
+    @staticmethod
+    async def hold(scheduler):
+        """Occupy the scheduler until the returned event is set, so later jobs queue up"""
+        gate = asyncio.Event()
+        task = asyncio.ensure_future(scheduler.run("gate", "gate", gate.wait))
+        await asyncio.sleep(0)
+        return gate, task
+    
+    @pytest.mark.asyncio
+    async def test_weighted_fair_order(self):
+        """A connection with twice the weight gets twice the turns while both are queued"""
+        from interactions_api.scheduler import InputScheduler
+        
+        scheduler = InputScheduler(weights={"fast": 2, "slow": 1})
+        order = []
+        
+        async def job(name):
+            order.append(name)
+        
+        gate, held = await self.hold(scheduler)
+        tasks = [asyncio.ensure_future(scheduler.run(name, name, lambda name=name: job(name)))
+                 for name in ["fast"] * 4 + ["slow"] * 4]
+        await asyncio.sleep(0)
+        gate.set()
+        await asyncio.gather(held, *tasks)
+        
+        assert order[:6].count("fast") == 4
+        assert sorted(order) == ["fast"] * 4 + ["slow"] * 4
+    
+    @pytest.mark.asyncio
+    async def test_lease_holds_back_other_clients(self):
+        """Other connections wait for the lease; the holder runs straight away"""
+        from interactions_api.scheduler import InputScheduler, SchedulerBusy
+        
+        scheduler = InputScheduler()
+        order = []
+        
+        async def job(name):
+            order.append(name)
+        
+        scheduler.acquire_lease("a", "agent-a", 30)
+        waiting = asyncio.ensure_future(scheduler.run("b", "agent-b", lambda: job("b")))
+        await asyncio.sleep(0.01)
+        await scheduler.run("a", "agent-a", lambda: job("a"))
+        
+        with pytest.raises(SchedulerBusy) as held:
+            scheduler.acquire_lease("b", "agent-b", 5)
+        assert held.value.reason == "lease_held"
+        assert held.value.details["holder"] == "agent-a"
+        assert order == ["a"]
+        
+        assert scheduler.release_lease("a")
+        await waiting
+        assert order == ["a", "b"]
+    
+    @pytest.mark.asyncio
+    async def test_rate_limit_and_full_queue(self):
+        """Floods are refused with retry_after instead of queueing forever"""
+        from interactions_api.scheduler import InputScheduler, SchedulerBusy
+        
+        now = [0.0]
+        scheduler = InputScheduler(rate=1, burst=2, max_queue=1, clock=lambda: now[0])
+        
+        async def noop():
+            return "done"
+        
+        assert await scheduler.run("a", "a", noop) == "done"
+        assert await scheduler.run("a", "a", noop) == "done"
+        with pytest.raises(SchedulerBusy) as limited:
+            await scheduler.run("a", "a", noop)
+        assert limited.value.reason == "rate_limited"
+        assert limited.value.details["retry_after"] == 1.0
+        
+        now[0] = 10.0
+        gate, held = await self.hold(scheduler)
+        queued = asyncio.ensure_future(scheduler.run("a", "a", noop))
+        await asyncio.sleep(0)
+        with pytest.raises(SchedulerBusy) as busy:
+            await scheduler.run("a", "a", noop)
+        assert busy.value.reason == "busy"
+        
+        gate.set()
+        await asyncio.gather(held, queued)
+        stats = scheduler.stats()["clients"]
+        client = next(value for key, value in stats.items() if key.startswith("a#"))
+        assert client["served"] == 3 and client["rate_limited"] == 1 and client["busy"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_pipelined_input_is_refused_when_queue_is_full(self):
+        """A concurrent connection that pipelines input gets busy once max_queue messages wait"""
+        import websockets
+        from interactions_api.__main__ import handler
+        from interactions_api.scheduler import InputScheduler
+        
+        async def slow_move(msg, context):
+            await asyncio.sleep(0.01)
+            return {"status": "ok"}
+        
+        scheduler = InputScheduler(max_queue=4)
+        with patch('interactions_api.__main__.AUTH_TOKEN', "t"), \
+             patch('interactions_api.__main__.scheduler', scheduler), \
+             patch('interactions_api.__main__.handlers', {"move": slow_move}):
+            async with websockets.serve(handler, "127.0.0.1", 0) as server:
+                url = f"ws://127.0.0.1:{server.sockets[0].getsockname()[1]}"
+                async with websockets.connect(url, additional_headers={"Authorization": "Bearer t"}) as ws:
+                    await ws.send(json.dumps({"action": "configure", "concurrent": True}))
+                    await ws.recv()
+                    for i in range(50):
+                        await ws.send(json.dumps({"action": "move", "x": i, "y": 0, "id": i}))
+                    replies = [json.loads(await ws.recv()) for _ in range(50)]
+        
+        busy = [reply for reply in replies if reply["status"] == "error"]
+        assert busy and len(busy) < 50
+        assert all(reply["error"]["message"] == "busy" and reply["error"]["details"]["retry_after"] > 0 for reply in busy)
+        assert {reply["id"] for reply in replies} == set(range(50))
+    
+    @pytest.mark.asyncio
+    async def test_lease_action_between_connections(self):
+        """The lease built-in answers lease_held to a second connection"""
+        from interactions_api.__main__ import handle_message
+        from interactions_api.codec import StdlibJsonCodec
+        from interactions_api.scheduler import InputScheduler
+        from interactions_api.session import Session
+        
+        first = Session(Mock(), StdlibJsonCodec())
+        second = Session(Mock(), StdlibJsonCodec())
+        
+        with patch('interactions_api.__main__.AUTH_TOKEN', "t"):
+            with patch('interactions_api.__main__.scheduler', InputScheduler()):
+                taken = json.loads(await handle_message({"action": "lease", "duration": 5, "token": "t"}, first))
+                refused = json.loads(await handle_message({"action": "lease", "token": "t"}, second))
+                released = json.loads(await handle_message({"action": "lease_release"}, first))
+                retaken = json.loads(await handle_message({"action": "lease"}, second))
+        
+        assert taken["result"] == {"expires_in": 5}
+        assert refused["error"]["message"] == "lease_held"
+        assert released["result"] == {"released": True}
+        assert retaken["status"] == "ok"
+
+
+class TestMetrics:
+    """Test request counters, phase histograms and the Prometheus output"""
+    
+    def test_phases_split_dispatch_time(self):
+        """Time outside the handler body is queueing; built-ins count entirely as execute"""
+        from interactions_api.metrics import Metrics
+        
+        metrics = Metrics()
+        timing = metrics.start(received=1.0)
+        timing.execute = 0.003
+        metrics.observe("click", {"status": "ok"}, timing, dispatched=1.010, encoded=1.0102)
+        metrics.observe("stats", {"status": "ok"}, metrics.start(received=2.0), dispatched=2.001, encoded=2.001)
+        
+        latency = metrics.latency
+        assert latency[("click", "execute")].sum == pytest.approx(0.003)
+        assert latency[("click", "queue")].sum == pytest.approx(0.007)
+        assert latency[("click", "serialize")].sum == pytest.approx(0.0002)
+        assert latency[("stats", "queue")].sum == 0
+        assert latency[("stats", "execute")].sum == pytest.approx(0.001)
+    
+    def test_prometheus_text(self):
+        """Counters, error codes and cumulative histogram buckets in the exposition format"""
+        from interactions_api.metrics import Metrics
+        
+        metrics = Metrics(buckets=(0.01, 0.1))
+        for received in (0.0, 1.0):
+            metrics.observe("click", {"status": "ok"}, metrics.start(received), received + 0.05, received + 0.05)
+        metrics.observe("move", {"status": "error", "error": {"message": "invalid_params"}}, metrics.start(0.0), 0.001, 0.001)
+        metrics.connection_opened()
+        
+        text = metrics.render({"input_lane_pending": 3})
+        
+        assert 'windows_api_requests_total{action="click",status="ok"} 2' in text
+        assert 'windows_api_errors_total{action="move",code="invalid_params"} 1' in text
+        assert 'windows_api_request_phase_seconds_bucket{action="click",phase="execute",le="0.01"} 0' in text
+        assert 'windows_api_request_phase_seconds_bucket{action="click",phase="execute",le="0.1"} 2' in text
+        assert 'windows_api_request_phase_seconds_bucket{action="click",phase="execute",le="+Inf"} 2' in text
+        assert "windows_api_connections_active 1" in text
+        assert "windows_api_input_lane_pending 3" in text
+    
+    @pytest.mark.asyncio
+    async def test_handle_message_records_requests(self):
+        """Dispatched messages show up in the stats action, unknown names under one label"""
+        from interactions_api.__main__ import handle_message
+        from interactions_api.metrics import Metrics
+        
+        handler = AsyncMock(return_value={"status": "ok"})
+        
+        with patch('interactions_api.__main__.AUTH_TOKEN', "t"):
+            with patch('interactions_api.__main__.handlers', {"click": handler}):
+                with patch('interactions_api.__main__.metrics', Metrics()):
+                    await handle_message({"action": "click", "token": "t"})
+                    await handle_message({"action": "no_such_action", "token": "t"})
+                    stats = json.loads(await handle_message({"action": "stats", "token": "t"}))
+        
+        actions = stats["result"]["metrics"]["actions"]
+        assert actions["click"]["requests"] == {"ok": 1}
+        assert set(actions["click"]["latency_ms"]) == {"queue", "execute", "serialize"}
+        assert actions["unknown"]["errors"] == {"unsupported_action": 1}
+
+
+class TestTracing:
+    """Test sampled spans, the ring buffer and the Chrome trace export"""
+    
+    @pytest.mark.asyncio
+    async def test_sampled_request_spans_cross_threads(self):
+        """Handler spans recorded on an executor thread nest under their request"""
+        from interactions_api.executor import ActionExecutor, READ
+        from interactions_api.tracing import Tracer
+        
+        tracer = Tracer(sample_rate=1.0)
+        executor = ActionExecutor(read_workers=1)
+        
+        async def handler(msg, context):
+            return {"status": "ok"}
+        
+        with tracer.request("size"):
+            await executor.run(READ, tracer.wrap(handler, "size"), {}, {})
+            with tracer.span("serialize"):
+                pass
+        executor.shutdown()
+        
+        events = tracer.export()["traceEvents"]
+        by_name = {(event["cat"], event["name"]): event for event in events}
+        request = by_name[("request", "size")]
+        handled = by_name[("handler", "size")]
+        assert ("server", "serialize") in by_name
+        assert all(event["ph"] == "X" for event in events)
+        assert handled["tid"] != request["tid"]
+        assert request["ts"] <= handled["ts"] and handled["ts"] + handled["dur"] <= request["ts"] + request["dur"]
+    
+    def test_sampling_and_ring_buffer(self):
+        """Unsampled requests record nothing; the buffer keeps only the newest spans"""
+        from interactions_api.tracing import Tracer
+        
+        rolls = iter([0.05, 0.5, 0.01, 0.9])
+        tracer = Tracer(sample_rate=0.1, buffer_size=1, rng=lambda: next(rolls))
+        for name in ("a", "b", "c", "d"):
+            with tracer.request(name):
+                pass
+        
+        assert tracer.stats()["sampled"] == 2
+        assert [event["name"] for event in tracer.export(clear=True)["traceEvents"]] == ["c"]
+        assert tracer.export()["traceEvents"] == []
+        
+        disabled = Tracer(sample_rate=0)
+        assert disabled.wrap(len, "len") is len
+    
+    def test_function_hooks_honour_include_and_exclude(self):
+        """Only calls into include_paths, minus exclude_functions, inside sampled requests"""
+        from interactions_api.tracing import Tracer
+        
+        def traced_helper():
+            return 1
+        
+        def write_log():
+            return 2
+        
+        tracer = Tracer(sample_rate=1.0, include_paths=[Path(__file__).name], exclude_functions=["write_log"])
+        tracer.install_function_hooks()
+        try:
+            traced_helper()
+            with tracer.request("click"):
+                traced_helper()
+                write_log()
+                json.dumps({})
+        finally:
+            tracer.remove_function_hooks()
+        
+        functions = [event["name"] for event in tracer.export()["traceEvents"] if event["cat"] == "function"]
+        assert [name.rsplit(".", 1)[-1] for name in functions] == ["traced_helper"]
+    
+    def test_config_loader_skips_settrace_in_span_mode(self, tmp_path):
+        """The default span mode no longer installs a process-wide trace hook"""
+        sys.path.insert(0, str(project_root))
+        from src.dev.utils.config_loader import ConfigLoader
+        
+        config = tmp_path / "config.yaml"
+        config.write_text(yaml.safe_dump({"debug": {"enabled": True, "trace": {"enabled": True}}}))
+        trace_func = Mock()
+        
+        with patch('sys.settrace') as settrace:
+            ConfigLoader(str(config)).apply_trace_config(trace_func)
+        
+        settrace.assert_called_once_with(None)
+
+
+class TestLazyStartup:
+    """Test the handler manifest, first-use imports and the startup profile"""
+    
+    @pytest.mark.asyncio
+    async def test_handlers_import_on_first_use(self):
+        """load_handlers() only lists actions; a module is imported when its action is first used"""
+        from interactions_api import __main__ as server
+        
+        with patch('interactions_api.__main__.AUTH_TOKEN', "t"), \
+                patch('interactions_api.__main__.handler_manifest', {}), \
+                patch('interactions_api.__main__.handlers', {}), \
+                patch('interactions_api.__main__.read_only_actions', set()), \
+                patch('interactions_api.__main__.validators', {}), \
+                patch('interactions_api.__main__.context', recording_context()):
+            server.load_handlers()
+            assert {"click", "size", "type"} <= set(server.handler_manifest)
+            assert server.handlers == {}
+            
+            size = json.loads(await server.handle_message({"action": "size", "token": "t"}))
+            
+            assert size["result"]["width"] == 1920
+            assert set(server.handlers) == {"size"}
+            assert server.read_only_actions == {"size"}
+    
+    @pytest.mark.asyncio
+    async def test_broken_handler_reports_import_error(self):
+        """A handler that fails to import answers with the error instead of unsupported_action"""
+        from interactions_api.__main__ import handle_message
+        
+        with patch('interactions_api.__main__.AUTH_TOKEN', "t"), \
+                patch('interactions_api.__main__.handler_manifest', {"broken": "interactions_api.handlers.does_not_exist"}), \
+                patch('interactions_api.__main__.handler_errors', {}):
+            broken = json.loads(await handle_message({"action": "broken", "token": "t"}))
+        
+        assert broken["error"]["message"] == "executionerror"
+        assert "ModuleNotFoundError" in broken["error"]["details"]["exception"]
+    
+    def test_startup_profile_times_new_imports(self, tmp_path):
+        """Modules loaded while profiling are listed; cached ones are not"""
+        from interactions_api.startup import StartupProfile
+        
+        (tmp_path / "slow_startup_module.py").write_text("import json\nVALUE = 1\n")
+        sys.path.insert(0, str(tmp_path))
+        profile = StartupProfile().start()
+        try:
+            import slow_startup_module
+            profile.mark("imports")
+        finally:
+            profile.stop()
+            sys.path.remove(str(tmp_path))
+            sys.modules.pop("slow_startup_module", None)
+        
+        assert "slow_startup_module" in profile.imports
+        assert "json" not in profile.imports
+        assert "imports" in profile.report()
+
+
+class TestHandlerReload:
+    """Test incremental reloads and the copy-on-write registry swap"""
+    
+    @staticmethod
+    def handler_package(tmp_path, name):
+        """A throwaway handlers package with one module, importable under ``name``"""
+        package = tmp_path / name
+        (package / "handlers").mkdir(parents=True)
+        (package / "__init__.py").write_text("")
+        (package / "handlers" / "echo.py").write_text(
+            'READ_ONLY = True\n\nasync def handle(msg, context):\n    return {"status": "ok", "result": {"version": 1}}\n'
+        )
+        sys.path.insert(0, str(tmp_path))
+        return package / "handlers" / "echo.py"
+    
+    @pytest.mark.asyncio
+    async def test_reload_swaps_changed_module(self, tmp_path):
+        """An edited handler is re-imported; the previous function object still runs the old code"""
+        from interactions_api import __main__ as server
+        
+        path = self.handler_package(tmp_path, "reload_pkg_a")
+        try:
+            module = importlib.import_module("reload_pkg_a.handlers.echo")
+            manifest = {"echo": "reload_pkg_a.handlers.echo"}
+            with patch('interactions_api.__main__.load_handlers'), \
+                    patch('interactions_api.__main__.handler_manifest', manifest), \
+                    patch('interactions_api.__main__.handlers', {"echo": module.handle}), \
+                    patch('interactions_api.__main__.read_only_actions', {"echo"}), \
+                    patch('interactions_api.__main__.validators', {}):
+                before = server.handlers
+                old_handle = before["echo"]
+                path.write_text(path.read_text().replace('"version": 1', '"version": 2'))
+                
+                result = server.reload_handlers({"echo"})
+                
+                assert result == {"reloaded": ["echo"], "removed": [], "failed": {}}
+                assert server.handlers is not before
+                assert (await server.handlers["echo"]({}, {}))["result"]["version"] == 2
+                assert (await old_handle({}, {}))["result"]["version"] == 1
+                assert "echo" in server.read_only_actions
+        finally:
+            sys.path.remove(str(tmp_path))
+    
+    def test_failed_reload_keeps_old_version(self, tmp_path):
+        """A syntax error leaves the working handler in place"""
+        from interactions_api import __main__ as server
+        
+        path = self.handler_package(tmp_path, "reload_pkg_b")
+        try:
+            module = importlib.import_module("reload_pkg_b.handlers.echo")
+            with patch('interactions_api.__main__.load_handlers'), \
+                    patch('interactions_api.__main__.handler_manifest', {"echo": "reload_pkg_b.handlers.echo"}), \
+                    patch('interactions_api.__main__.handlers', {"echo": module.handle, "gone": module.handle}), \
+                    patch('interactions_api.__main__.read_only_actions', {"echo"}), \
+                    patch('interactions_api.__main__.validators', {}):
+                path.write_text("def handle(:\n")
+                
+                result = server.reload_handlers()
+                
+                assert result["removed"] == ["gone"]
+                assert "SyntaxError" in result["failed"]["echo"]
+                assert server.handlers == {"echo": module.handle}
+        finally:
+            sys.path.remove(str(tmp_path))
+
+
+class TestLocate:
+    """Test template matching for the locate action"""
+    
+    @staticmethod
+    def encode(img):
+        import base64, io
+        buffer = io.BytesIO()
+        img.save(buffer, "PNG")
+        return base64.b64encode(buffer.getvalue()).decode()
+    
+    def test_pyramid_search_finds_exact_offset(self):
+        """Coarse-to-fine search lands on the same (odd) pixel offset as a full search"""
+        import numpy as np
+        from PIL import Image
+        from interactions_api.matching import TemplateMatcher
+        
+        rng = np.random.default_rng(7)
+        texture = np.kron(rng.random((60, 80)), np.ones((6, 6))) * 255
+        screen = Image.fromarray(texture.astype(np.uint8)).convert("RGB")
+        
+        class Screen:
+            def grab(self, region=None):
+                if region is None:
+                    return screen
+                x, y, w, h = region
+                return screen.crop((x, y, x + w, y + h))
+        
+        matcher = TemplateMatcher(max_levels=3)
+        template = matcher.template(self.encode(screen.crop((201, 133, 201 + 48, 133 + 36))))
+        assert len(template.levels) > 1
+        result = matcher.locate(Screen(), template)
+        
+        assert result["found"] is True
+        assert result["matches"][0]["box"] == [201, 133, 48, 36]
+        assert result["matches"][0]["center"] == [225, 151]
+        assert result["matches"][0]["score"] > 0.99
+    
+    @pytest.mark.asyncio
+    async def test_last_location_fast_path(self):
+        """A second locate re-verifies the last box instead of searching the whole frame"""
+        from interactions_api.handlers import locate
+        from interactions_api.capture import FakeCapture
+        from interactions_api.matching import TemplateMatcher
+        
+        capture = FakeCapture(width=320, height=160, block=24, step=0)
+        template = self.encode(capture.grab((0, 70, 40, 40)))
+        context = {"capture": capture, "matcher": TemplateMatcher(cache_size=4)}
+        
+        first = await locate.handle({"template": template}, context)
+        second = await locate.handle({"template": template, "threshold": 0.9}, context)
+        
+        assert first["result"]["found"] and not first["result"]["cached"]
+        assert second["result"]["cached"] is True
+        assert second["result"]["matches"][0]["box"] == first["result"]["matches"][0]["box"] == [0, 70, 40, 40]
+        assert context["matcher"].stats()["fast_path_hits"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_region_offsets_and_misses(self):
+        """Boxes are in screen coordinates; a region without the target finds nothing"""
+        from interactions_api.handlers import locate
+        from interactions_api.capture import FakeCapture
+        
+        capture = FakeCapture(width=320, height=160, block=24, step=0)
+        template = self.encode(capture.grab((0, 70, 40, 40)))
+        context = {"capture": capture}
+        
+        hit = await locate.handle({"template": template, "region": [0, 40, 100, 100]}, context)
+        miss = await locate.handle({"template": template, "region": [150, 0, 160, 60]}, context)
+        
+        assert hit["result"]["matches"][0]["box"] == [0, 70, 40, 40]
+        assert miss["result"] == {"found": False, "matches": [], "cached": False, "engine": hit["result"]["engine"]}
+    
+    @pytest.mark.asyncio
+    async def test_requests_with_ids_share_the_server_matcher(self):
+        """Requests that get their own context copy still use the one matcher"""
+        from interactions_api.__main__ import handle_message
+        from interactions_api.capture import FakeCapture
+        from interactions_api.matching import TemplateMatcher
+        
+        capture = FakeCapture(width=320, height=160, block=24, step=0)
+        template = self.encode(capture.grab((0, 70, 40, 40)))
+        matcher = TemplateMatcher()
+        
+        with patch('interactions_api.__main__.AUTH_TOKEN', "t"):
+            with patch.dict('interactions_api.__main__.context', {"capture": capture, "matcher": matcher}):
+                replies = [json.loads(await handle_message({"action": "locate", "template": template, "id": i, "token": "t"}))
+                           for i in range(2)]
+        
+        assert [reply["result"]["cached"] for reply in replies] == [False, True]
+        assert (matcher.misses, matcher.hits, matcher.fast_path_hits) == (1, 1, 1)
+    
+    def test_server_matcher_is_built_once_on_first_use(self):
+        """The server matcher doesn't exist until a locate asks for it, then every caller gets the same one"""
+        from concurrent.futures import ThreadPoolExecutor
+        from interactions_api import __main__ as server
+        
+        with patch.object(server, 'locate_matcher', None):
+            assert server.locate_matcher is None
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                matchers = list(pool.map(lambda _: server.get_locate_matcher(), range(16)))
+            assert all(m is server.locate_matcher for m in matchers)
+    
+    def test_template_cache_is_lru(self):
+        """Decoded templates are reused and the least recently used one is evicted"""
+        from PIL import Image, ImageDraw
+        from interactions_api.matching import TemplateMatcher
+        
+        images = []
+        for shade in (60, 120, 180):
+            img = Image.new("RGB", (16, 16), (shade, 0, 0))
+            ImageDraw.Draw(img).rectangle((4, 4, 11, 11), fill=(255, 255, 255))
+            images.append(self.encode(img))
+        
+        matcher = TemplateMatcher(cache_size=2)
+        first = matcher.template(images[0])
+        matcher.template(images[1])
+        assert matcher.template(images[0]) is first
+        matcher.template(images[2])
+        
+        assert matcher.stats()["templates"] == 2
+        assert matcher.template(images[0]) is first
+        assert (matcher.hits, matcher.misses) == (2, 3)
+        matcher.template(images[1])
+        assert matcher.misses == 4
+    
+    @pytest.mark.asyncio
+    async def test_bad_templates_rejected(self):
+        """Undecodable or flat templates are invalid_params, not executionerror"""
+        from PIL import Image
+        from interactions_api.handlers import locate
+        from interactions_api.capture import FakeCapture
+        
+        context = {"capture": FakeCapture()}
+        for template in ("not base64!", "aGVsbG8=", self.encode(Image.new("RGB", (8, 8), (1, 2, 3)))):
+            result = await locate.handle({"template": template}, context)
+            assert result["error"]["message"] == "invalid_params"
+            assert result["error"]["details"]["field"] == "template"
+
+
+class TestScreenWatch:
+    """Test server-side waiting for screen changes and pixel colors"""
+    
+    @pytest.mark.asyncio
+    async def test_waits_do_not_hold_read_workers(self):
+        """Reads are served while waits are pending, even with a single read worker"""
+        import time
+        from interactions_api.__main__ import handle_message
+        from interactions_api.capture import FakeCapture
+        from interactions_api.executor import ActionExecutor
+        from interactions_api.handlers import wait_for_change
+        
+        size = AsyncMock(return_value={"status": "ok", "result": {"width": 1}})
+        with patch('interactions_api.__main__.AUTH_TOKEN', "t"), \
+             patch('interactions_api.__main__.executor', ActionExecutor(read_workers=1)), \
+             patch('interactions_api.__main__.handlers', {"wait_for_change": wait_for_change.handle, "size": size}), \
+             patch('interactions_api.__main__.read_only_actions', {"wait_for_change", "size"}), \
+             patch('interactions_api.__main__.loop_actions', {"wait_for_change"}), \
+             patch.dict('interactions_api.__main__.context', {"capture": FakeCapture(width=64, height=32, step=0)}):
+            waits = [asyncio.ensure_future(handle_message({"action": "wait_for_change", "timeout": 0.5, "interval": 0.02, "token": "t"}))
+                     for _ in range(4)]
+            await asyncio.sleep(0.05)
+            started = time.perf_counter()
+            measured = json.loads(await handle_message({"action": "size", "token": "t"}))
+            took = time.perf_counter() - started
+            results = [json.loads(reply) for reply in await asyncio.gather(*waits)]
+        
+        assert measured["result"] == {"width": 1}
+        assert took < 0.25
+        assert all(result["result"]["changed"] is False and result["result"]["samples"] > 5 for result in results)
+    
+    @pytest.mark.asyncio
+    async def test_wait_for_change_detects_motion(self):
+        """A moving block is reported on the first sample after the baseline"""
+        from interactions_api.handlers import wait_for_change
+        from interactions_api.capture import FakeCapture
+        
+        context = {"capture": FakeCapture(width=160, height=80, block=16, step=8)}
+        result = await wait_for_change.handle({"timeout": 1.0, "interval": 0.01, "threshold": 0.001}, context)
+        
+        assert result["result"]["changed"] is True
+        assert result["result"]["samples"] == 1
+        assert result["result"]["difference"] > 0.001
+    
+    @pytest.mark.asyncio
+    async def test_wait_for_change_times_out_on_static_screen(self):
+        """A still frame is sampled at the requested rate until the timeout"""
+        from interactions_api.handlers import wait_for_change
+        from interactions_api.capture import FakeCapture
+        
+        context = {"capture": FakeCapture(width=160, height=80, step=0)}
+        result = await wait_for_change.handle({"timeout": 0.1, "interval": 0.02, "region": [0, 0, 80, 80]}, context)
+        
+        assert result["status"] == "ok"
+        assert result["result"]["changed"] is False
+        assert result["result"]["difference"] == 0.0
+        assert 4 <= result["result"]["samples"] <= 7
+        assert result["result"]["elapsed"] >= 0.1
+    
+    def test_fingerprint_ignores_small_noise(self):
+        """One changed pixel stays far below the default threshold; a new block does not"""
+        from PIL import Image, ImageDraw
+        from interactions_api.watch import difference, fingerprint
+        
+        base = Image.new("RGB", (640, 360), (32, 32, 48))
+        noisy = base.copy()
+        noisy.putpixel((100, 100), (255, 255, 255))
+        dialog = base.copy()
+        ImageDraw.Draw(dialog).rectangle((200, 100, 440, 260), fill=(240, 240, 240))
+        
+        assert len(fingerprint(base)) == 32 * 18
+        assert difference(fingerprint(base), fingerprint(noisy)) < 0.002
+        assert difference(fingerprint(base), fingerprint(dialog)) > 0.1
+    
+    @pytest.mark.asyncio
+    async def test_wait_for_pixel_point_and_region(self):
+        """Points and regions report the first matching pixel in screen coordinates"""
+        from interactions_api.handlers import wait_for_pixel
+        from interactions_api.capture import FakeCapture
+        
+        context = {"capture": FakeCapture(width=160, height=80, block=16, step=0)}
+        yellow = [240, 200, 40]
+        point = await wait_for_pixel.handle({"x": 5, "y": 45, "color": yellow, "timeout": 0}, context)
+        region = await wait_for_pixel.handle({"region": [0, 30, 60, 30], "color": [235, 205, 45], "tolerance": 5, "timeout": 0}, context)
+        gone = await wait_for_pixel.handle({"x": 100, "y": 10, "color": yellow, "present": False, "timeout": 0}, context)
+        missing = await wait_for_pixel.handle({"x": 100, "y": 10, "color": yellow, "timeout": 0.05, "interval": 0.01}, context)
+        
+        assert point["result"]["matched"] and point["result"]["position"] == [5, 45]
+        assert region["result"]["position"] == [0, 40] and region["result"]["color"] == yellow
+        assert gone["result"]["matched"] is True
+        assert missing["result"]["matched"] is False and missing["result"]["samples"] > 1
+    
+    @pytest.mark.asyncio
+    async def test_limits_and_cancellation(self):
+        """Timeouts beyond watch.max_timeout are rejected; cancel stops the wait"""
+        from interactions_api.handlers import wait_for_change, wait_for_pixel
+        from interactions_api.capture import FakeCapture
+        
+        context = {"capture": FakeCapture(step=0), "watch_options": {"interval": 0.01, "max_timeout": 2}}
+        too_long = await wait_for_change.handle({"timeout": 5}, context)
+        no_target = await wait_for_pixel.handle({"color": [0, 0, 0]}, context)
+        calls = []
+        cancelled = await wait_for_change.handle({"timeout": 2}, {**context, "cancelled": lambda: calls.append(1) or len(calls) > 2})
+        
+        assert too_long["error"]["details"] == {"field": "timeout", "reason": "must be <= 2"}
+        assert no_target["error"]["message"] == "invalid_params"
+        assert cancelled["error"]["message"] == "cancelled"
+        assert cancelled["error"]["details"]["samples"] == 3
+
+
+class TestScreenshotStore:
+    """Test the screenshot directory store"""
+    
+    @staticmethod
+    def frame(shade, size=(64, 32)):
+        from PIL import Image
+        return Image.new("RGB", size, (shade, shade // 2, 255 - shade))
+    
+    def test_names_are_unique_within_a_second(self, tmp_path):
+        """Back-to-back captures get distinct files that are complete once flushed"""
+        from interactions_api.screenshots import ScreenshotStore
+        
+        store = ScreenshotStore(tmp_path, dedup=False)
+        paths = [store.save(self.frame(10))["path"] for _ in range(20)]
+        store.flush()
+        
+        assert len(set(paths)) == 20
+        assert all(path.name.startswith("snap_") and path.exists() for path in paths)
+        assert not list(tmp_path.glob("*.tmp"))
+        store.close()
+    
+    def test_identical_frames_are_deduplicated(self, tmp_path):
+        """The same pixels return the existing file; a deleted file is written again"""
+        from interactions_api.screenshots import ScreenshotStore
+        
+        store = ScreenshotStore(tmp_path)
+        first = store.save(self.frame(10), wait=True)
+        again = store.save(self.frame(10), wait=True)
+        other = store.save(self.frame(20), wait=True)
+        
+        assert again == {"path": first["path"], "deduplicated": True}
+        assert other["path"] != first["path"]
+        assert store.stats()["written"] == 2 and store.stats()["deduplicated"] == 1
+        
+        first["path"].unlink()
+        rewritten = store.save(self.frame(10), wait=True)
+        assert rewritten["deduplicated"] is False and rewritten["path"].exists()
+        assert store.stats()["files"] == 2
+        store.close()
+    
+    def test_retention_evicts_least_recently_used(self, tmp_path):
+        """Count and age limits delete the least recently used files first"""
+        from interactions_api.screenshots import ScreenshotStore
+        
+        now = [1000.0]
+        store = ScreenshotStore(tmp_path, max_files=2, clock=lambda: now[0])
+        a = store.save(self.frame(1), wait=True)["path"]
+        now[0] += 1
+        b = store.save(self.frame(2), wait=True)["path"]
+        now[0] += 1
+        store.save(self.frame(1), wait=True)  # a is used again, so b is now the oldest
+        now[0] += 1
+        c = store.save(self.frame(3), wait=True)["path"]
+        
+        assert a.exists() and c.exists() and not b.exists()
+        assert store.stats()["evicted"] == 1
+        
+        store.max_files, store.max_age = 0, 5
+        now[0] += 10
+        d = store.save(self.frame(4), wait=True)["path"]
+        assert sorted(tmp_path.iterdir()) == [d]
+        store.close()
+    
+    def test_byte_limit_and_existing_files(self, tmp_path):
+        """Old snap_ files count toward the limits at startup; other files are left alone"""
+        import os
+        from interactions_api.screenshots import ScreenshotStore
+        
+        for index in range(3):
+            path = tmp_path / f"snap_old_{index}.png"
+            path.write_bytes(b"x" * 100)
+            os.utime(path, (index, index))
+        (tmp_path / "keep.txt").write_bytes(b"x" * 1000)
+        
+        store = ScreenshotStore(tmp_path, max_bytes=250)
+        assert sorted(p.name for p in tmp_path.iterdir()) == ["keep.txt", "snap_old_1.png", "snap_old_2.png"]
+        assert store.stats()["bytes"] == 200
+        store.close()
+    
+    def test_compression_and_named_files(self, tmp_path):
+        """The configured PNG level is used; explicit names keep their format and skip dedup"""
+        import numpy as np
+        from PIL import Image
+        from interactions_api.screenshots import ScreenshotStore
+        
+        noisy = Image.fromarray((np.random.default_rng(0).random((120, 160)) * 16).astype(np.uint8)).convert("RGB")
+        sizes = {}
+        for level in (0, 9):
+            store = ScreenshotStore(tmp_path / str(level), compression=level)
+            sizes[level] = store.save(noisy, wait=True)["path"].stat().st_size
+            store.close()
+        assert sizes[9] < sizes[0]
+        
+        store = ScreenshotStore(tmp_path / "named")
+        jpeg = store.save(noisy, "frame.jpg", wait=True)["path"]
+        assert jpeg.read_bytes()[:2] == b"\xff\xd8"
+        assert store.save(noisy, "frame.jpg")["deduplicated"] is False
+        with pytest.raises(ValueError):
+            store.save(noisy, "frame.unknown")
+        store.close()
+    
+    @pytest.mark.asyncio
+    async def test_handler_uses_store(self, tmp_path):
+        """File-mode screenshots go through the store in the context"""
+        from interactions_api.handlers import screenshot
+        from interactions_api.capture import FakeCapture
+        from interactions_api.screenshots import ScreenshotStore
+        
+        store = ScreenshotStore(tmp_path)
+        context = {"capture": FakeCapture(width=80, height=40, step=0), "screenshot_dir": tmp_path, "screenshot_store": store}
+        first = await screenshot.handle({"wait": True}, context)
+        second = await screenshot.handle({}, context)
+        
+        assert first["result"]["deduplicated"] is False
+        assert second["result"] == {"saved": first["result"]["saved"], "deduplicated": True}
+        store.close()
+    
+    @pytest.mark.asyncio
+    async def test_names_stay_inside_the_directory(self, tmp_path):
+        """A name with directories in it is invalid_params and nothing is written outside"""
+        from interactions_api.handlers import screenshot
+        from interactions_api.capture import FakeCapture
+        from interactions_api.screenshots import ScreenshotStore
+        
+        store = ScreenshotStore(tmp_path / "shots")
+        context = {"capture": FakeCapture(width=80, height=40, step=0), "screenshot_dir": tmp_path / "shots", "screenshot_store": store}
+        for name in ("../escape.png", "sub/frame.png", str(tmp_path / "abs.png"), "..\\win.png", ".."):
+            reply = await screenshot.handle({"name": name, "wait": True}, context)
+            assert reply["error"]["message"] == "invalid_params", name
+            assert reply["error"]["details"]["field"] == "name"
+        assert (await screenshot.handle({"name": "ok.png", "wait": True}, context))["status"] == "ok"
+        store.close()
+        assert sorted(p.name for p in tmp_path.rglob("*.png")) == ["ok.png"]
+
+
+class TestLauncher:
+    """Test the launcher's supervisor"""
+    
+    @staticmethod
+    def launcher():
+        sys.path.insert(0, str(project_root))
+        from src.dev.cassitly.python import launcher
+        return launcher
+    
+    def test_backoff_and_package_specs(self):
+        """Delays grow by the multiplier up to max_delay; plain module names still work"""
+        launcher = self.launcher()
+        retry = {"initial_delay": 2, "max_delay": 10, "backoff_multiplier": 2}
+        
+        assert [launcher.backoff_delay(retry, attempt) for attempt in range(1, 5)] == [2, 4, 8, 10]
+        plain = launcher.Child("cfg", "pkg.module")
+        server = launcher.Child("gui", {"module": "pkg.server", "health": "ws://127.0.0.1:1", "startup_timeout": 3})
+        assert (plain.module, plain.health) == ("pkg.module", None)
+        assert (server.health, server.startup_timeout) == ("ws://127.0.0.1:1", 3.0)
+    
+    @pytest.mark.asyncio
+    async def test_crashed_child_is_restarted_with_backoff(self, tmp_path, capsys):
+        """A non-zero exit is restarted until max_attempts; a clean exit is final"""
+        launcher = self.launcher()
+        
+        (tmp_path / "crasher.py").write_text("import sys; sys.exit(3)")
+        (tmp_path / "done.py").write_text("pass")
+        env = {**os.environ, "PYTHONPATH": str(tmp_path)}
+        retry = {"max_attempts": 2, "initial_delay": 0.01, "max_delay": 0.05, "backoff_multiplier": 2}
+        crasher, done = launcher.Child("crasher", "crasher"), launcher.Child("done", "done")
+        
+        stopping = asyncio.Event()
+        await asyncio.wait_for(asyncio.gather(
+            launcher.supervise(crasher, env, retry, stopping),
+            launcher.supervise(done, env, retry, stopping),
+        ), 30)
+        
+        assert (crasher.state, crasher.restarts, crasher.process.returncode) == ("failed", 2, 3)
+        assert (done.state, done.restarts) == ("exited", 0)
+        assert "restart 1/2 in 0.0s" in capsys.readouterr().out
+    
+    @pytest.mark.asyncio
+    async def test_child_stopped_by_supervisor_is_restarted(self, tmp_path):
+        """A child the launcher stopped is restarted even though it exits 0 on SIGTERM"""
+        launcher = self.launcher()
+        
+        (tmp_path / "hung.py").write_text(
+            "import signal, sys, time\n"
+            "signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))\n"
+            "time.sleep(60)\n"
+        )
+        env = {**os.environ, "PYTHONPATH": str(tmp_path)}
+        retry = {"max_attempts": 1, "initial_delay": 0.01, "max_delay": 0.05, "backoff_multiplier": 2}
+        hung = launcher.Child("hung", {"module": "hung", "health": "ws://127.0.0.1:9", "startup_timeout": 0.5})
+        
+        await asyncio.wait_for(launcher.supervise(hung, env, retry, asyncio.Event()), 30)
+        
+        assert (hung.state, hung.restarts, hung.process.returncode) == ("failed", 1, 0)
+    
+    @pytest.mark.asyncio
+    async def test_websocket_ping(self):
+        """The health check needs a pong from a live websocket server"""
+        import websockets
+        launcher = self.launcher()
+        
+        async def echo(websocket):
+            async for _ in websocket:
+                pass
+        
+        async with websockets.serve(echo, "127.0.0.1", 0) as server:
+            port = server.sockets[0].getsockname()[1]
+            assert await launcher.websocket_ping(f"ws://127.0.0.1:{port}") is True
+        assert await launcher.websocket_ping(f"ws://127.0.0.1:{port}", timeout=0.5) is False
+
+
+class TestWorkers:
+    """Test the multi-process mode's forwarding to the owner"""
+    
+    @staticmethod
+    async def fake_owner(received):
+        """An owner that sends a progress event, then echoes the action back"""
+        import websockets
+        from interactions_api.codec import StdlibJsonCodec
+        codec = StdlibJsonCodec()
+        
+        async def owner(websocket):
+            async for frame in websocket:
+                msg = codec.loads(frame)
+                received.append((websocket.request.headers.get("Authorization"), msg))
+                if msg["action"] != "configure":
+                    await websocket.send(codec.dumps({"event": "progress", "id": msg["id"]}), text=True)
+                await websocket.send(codec.dumps({"status": "ok", "result": {"ran": msg["action"]}, "id": msg.get("id")}), text=True)
+        
+        return await websockets.serve(owner, "127.0.0.1", 0)
+    
+    @pytest.mark.asyncio
+    async def test_input_is_forwarded_and_reads_stay_local(self):
+        """Input goes to the owner with the client's token; the reply keeps the client's id"""
+        from interactions_api.__main__ import handle_message
+        from interactions_api.codec import StdlibJsonCodec
+        from interactions_api.session import Session
+        
+        received = []
+        server = await self.fake_owner(received)
+        url = f"ws://127.0.0.1:{server.sockets[0].getsockname()[1]}"
+        session = Session(AsyncMock(), StdlibJsonCodec())
+        press = AsyncMock(return_value={"status": "ok", "result": {"local": True}})
+        size = AsyncMock(return_value={"status": "ok", "result": {"width": 1}})
+        
+        with patch('interactions_api.__main__.OWNER_URL', url), \
+             patch('interactions_api.__main__.AUTH_TOKEN', "secret"), \
+             patch('interactions_api.__main__.handlers', {"press": press, "size": size}), \
+             patch('interactions_api.__main__.read_only_actions', {"size"}):
+            await handle_message({"action": "auth", "token": "secret"}, session)
+            pressed = json.loads(await handle_message({"action": "press", "key": "a", "id": 7}, session))
+            measured = json.loads(await handle_message({"action": "size"}, session))
+        await session.owner_link.close()
+        server.close()
+        
+        assert pressed == {"status": "ok", "result": {"ran": "press"}, "id": 7}
+        assert measured["result"] == {"width": 1}
+        press.assert_not_awaited()
+        assert [msg["action"] for _, msg in received] == ["configure", "press"]
+        assert received[1] == ("Bearer secret", {"action": "press", "key": "a", "id": "w1"})
+        # The progress event was relayed under the client's id
+        event = json.loads(session.websocket.send.await_args_list[0].args[0])
+        assert event == {"event": "progress", "id": 7}
+    
+    @pytest.mark.asyncio
+    async def test_owner_unavailable(self):
+        """A worker that can't reach the owner answers with an error instead of hanging"""
+        from interactions_api.codec import StdlibJsonCodec
+        from interactions_api.workers import OwnerLink
+        
+        link = OwnerLink("ws://127.0.0.1:9", "tok", StdlibJsonCodec(), AsyncMock())
+        reply = await link.call({"action": "press", "key": "a"})
+        
+        assert reply["error"]["message"] == "owner_unavailable"
+    
+    @pytest.mark.asyncio
+    async def test_shutdown_uses_the_signal_path(self):
+        """shutdown sets the stop event instead of exiting, so main() can stop the workers"""
+        from interactions_api.__main__ import handle_message
+        
+        stop = asyncio.Event()
+        with patch('interactions_api.__main__.AUTH_TOKEN', "t"), \
+             patch('interactions_api.__main__.shutdown_event', stop):
+            reply = json.loads(await handle_message({"action": "shutdown", "token": "t"}))
+        
+        assert reply["status"] == "ok" and stop.is_set()
+    
+    @pytest.mark.asyncio
+    async def test_worker_notices_owner_exit(self):
+        """End-of-file on the owner's stdin pipe stops the worker"""
+        import io
+        from interactions_api.workers import watch_owner
+        
+        gone = asyncio.Event()
+        with patch('sys.stdin', io.StringIO("")):
+            watch_owner(gone.set)
+            await asyncio.wait_for(gone.wait(), 5)
+    
+    def test_screenshot_names_carry_worker_tag(self, tmp_path):
+        """Workers sharing a screenshot directory never pick the same file name"""
+        from PIL import Image
+        from interactions_api.screenshots import ScreenshotStore
+        
+        first = ScreenshotStore(tmp_path, tag="w1", dedup=False)
+        second = ScreenshotStore(tmp_path, tag="w2", dedup=False)
+        frame = Image.new("RGB", (8, 8))
+        names = {first.save(frame)["path"].name, second.save(frame)["path"].name}
+        first.close(), second.close()
+        
+        assert len(names) == 2 and all("_w1_" in name or "_w2_" in name for name in names)
+
+
 if __name__ == "__main__":
     # Run with: python -m pytest src/tests/test_windows_api_components.py -v
     print("Run tests with: python -m pytest src/tests/test_windows_api_components.py -v")
\ No newline at end of file
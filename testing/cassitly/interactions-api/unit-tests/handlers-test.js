@@ -148,6 +148,7 @@ describe("Python GUI Handlers (via WebSocket)", () => {
   it("type handler rejects empty text", async () => {
     const res = await send(ws, { action: "type", text: "", token: TOKEN });
     expect(res.status).to.equal("error");
-    expect(res.error.message).to.equal("No text to type");
+    expect(res.error.message).to.equal("invalid_params");
+    expect(res.error.details.field).to.equal("text");
   });
 });